@@ -0,0 +1,311 @@
+"""End-to-end benchmarks for reshaping, runnable without Vim
+
+Run these from anywhere::
+
+    python autoload/benchmarks.py --output results.json
+
+We stand in a fake ``vim`` module for the real one, so ``orthodontics`` can be
+imported outside the editor, then reshape a handful of pathological buffers,
+timing each phase of the work: finding the delimiters, extracting the text
+between them, parsing, visiting, rendering, and writing the result back to the
+buffer. Then a couple of literals big enough to be worth it are reshaped as
+the command-line reshaper does them, both in this process and with their
+elements rendered in a pool of one worker per CPU; the pool only pays off with
+several CPUs. Pass ``--baseline`` a previous run's results to have any phase
+more than ``--tolerance`` slower reported, with a nonzero exit status; phases
+quicker than ``--floor`` are too short to time reliably and aren't.
+
+``benchmarks-baseline.json``, beside this file, is a baseline to start from,
+but times don't carry from machine to machine; make your own from a clean
+checkout with ``--output`` before comparing.
+
+"""
+from __future__ import print_function
+
+from multiprocessing import Pool, cpu_count
+import os
+import re
+import sys
+import types
+
+PLUGIN_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PLUGIN_PATH, 'libs'))
+
+# The saving and comparing of results is shared with Parsimonious's own
+# benchmarks:
+from parsimonious.tests.benchmarks import (  # noqa: E402
+    FLOOR, argument_parser, regressions, report)
+
+
+class FakeBuffer(list):
+    """A list of lines, with a name, a number, and a ``b:changedtick`` like a
+    Vim buffer's, the last counting every change made to the lines"""
+
+    name = ''
+
+    def __init__(self, lines, number=1):
+        super(FakeBuffer, self).__init__(lines)
+        self.number = number
+        self.changedtick = 1
+
+    def __setitem__(self, key, value):
+        super(FakeBuffer, self).__setitem__(key, value)
+        self.changedtick += 1
+
+    def __delitem__(self, key):
+        super(FakeBuffer, self).__delitem__(key)
+        self.changedtick += 1
+
+    def __setslice__(self, start, stop, value):  # Python 2
+        self[max(start, 0):max(stop, 0)] = value
+
+    def __delslice__(self, start, stop):  # Python 2
+        del self[max(start, 0):max(stop, 0)]
+
+    def append(self, line):
+        super(FakeBuffer, self).append(line)
+        self.changedtick += 1
+
+
+class FakeWindow(object):
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+
+class FakeCurrent(object):
+    def __init__(self, buffer, cursor):
+        self.buffer = buffer
+        self.window = FakeWindow(cursor)
+
+
+class FakeVim(types.ModuleType):
+    """A stand-in for Vim's ``vim`` module, backed by lists of lines
+
+    Everything passed to ``command()`` and ``eval()``, and every call of a
+    ``Function()``, is recorded, in order, in ``calls``. Settings are
+    ``g:`` variables, read with ``get(g:, name, default)``; those not in
+    ``settings`` have their defaults. ``features`` are what ``has()``
+    answers yes to, and ``functions`` are the Vim functions ``Function()``
+    can call, by name; the rest return 0.
+
+    """
+    def __init__(self, plugin_path):
+        super(FakeVim, self).__init__('vim')
+        self.plugin_path = plugin_path
+        self.calls = []
+        self.settings = {}
+        self.features = set(['timers'])
+        self.functions = {}
+        self.buffers = {}
+        self.load([''], (1, 0))
+
+    def load(self, lines, cursor):
+        """Open a new buffer of ``lines``, make it the current one, and put
+        the cursor at ``cursor``, a (1-based row, 0-based column) pair."""
+        buffer = FakeBuffer(lines, max(self.buffers or [0]) + 1)
+        self.buffers[buffer.number] = buffer
+        self.current = FakeCurrent(buffer, cursor)
+
+    def command(self, command):
+        self.calls.append(('command', command))
+
+    def eval(self, expression):
+        self.calls.append(('eval', expression))
+        if expression == 'expand(s:plugin_path)':
+            return self.plugin_path
+        if expression == 'b:changedtick':
+            return str(self.current.buffer.changedtick)
+        tick = re.match(r"getbufvar\((\d+), 'changedtick'\)$", expression)
+        if tick:
+            buffer = self.buffers.get(int(tick.group(1)))
+            return '' if buffer is None else str(buffer.changedtick)
+        feature = re.match(r"has\('(\w+)'\)$", expression)
+        if feature:
+            return '1' if feature.group(1) in self.features else '0'
+        setting = re.match(r"get\(g:, '(\w+)', (.*)\)$", expression)
+        if setting:
+            return str(self.settings.get(setting.group(1),
+                                         setting.group(2).strip("'")))
+        return ''
+
+    def Function(self, name):
+        def call(*args):
+            self.calls.append(('call', name) + args)
+            return self.functions.get(name, lambda *args: 0)(*args)
+        return call
+
+
+def install_fake_vim():
+    """Put a :class:`FakeVim` in place of the ``vim`` module, and return
+    it."""
+    vim = sys.modules['vim'] = FakeVim(PLUGIN_PATH)
+    sys.path.insert(0, PLUGIN_PATH)
+    return vim
+
+
+def long_list(size):
+    """Return a buffer with a flat list of ``size`` numbers on one line."""
+    return ['x = [%s]' % ', '.join(str(i) for i in range(size))], (1, 5)
+
+
+def deep_nesting(depth):
+    """Return a buffer with lists nested ``depth`` levels deep."""
+    text = 'a'
+    for level in range(depth):
+        text = '[a, %s]' % text
+    return ['x = %s' % text], (1, 5)
+
+
+def minified_json(size):
+    """Return a buffer with ``size`` records of JSON, minified onto one
+    line."""
+    record = ('{"id":%s,"name":"Larry Lopez","married":true,"sons":null,'
+              '"daughters":[{"age":26,"name":"Sandra"},'
+              '{"age":25,"name":"Margaret"}]}')
+    # The one space gives the cursor somewhere to sit inside the brackets.
+    return (['data = [ %s]' % ','.join(record % i for i in range(size))],
+            (1, 8))
+
+
+def long_strings(length):
+    """Return a buffer with a few strings of ``length`` characters, spread
+    over several lines."""
+    string = "'%s'" % ('x' * length)
+    return (['call(', '    %s,' % string, '    key=%s,' % string,
+             '    other="%s")' % ('y' * length)],
+            (2, 4))
+
+
+#: (name, corpus factory, size)
+CORPORA = [
+    ('long_list', long_list, 10000),
+    ('deep_nesting', deep_nesting, 500),
+    ('minified_json', minified_json, 1000),
+    ('long_strings', long_strings, 100000),
+]
+
+PHASES = ['search', 'extract', 'lookup', 'parse', 'visit', 'render', 'write']
+
+#: (name, corpus factory, size) of literals big enough to render in parallel
+POOLED_CORPORA = [
+    ('pooled_json', minified_json, 3000),
+    ('pooled_list', long_list, 50000),
+]
+
+
+def run(vim, names=None, repetitions=3):
+    """Reshape each corpus, and return a list of result dicts holding the
+    best time of each phase."""
+    import orthodontics
+
+    results = []
+    for name, make_corpus, size in CORPORA:
+        if names and name not in names:
+            continue
+        lines, cursor = make_corpus(size)
+        best = {}
+        error = None
+        for _ in range(repetitions):
+            vim.load(lines, cursor)
+            # Time the parsing, not a cache hit:
+            orthodontics.cache.clear()
+            phases = []
+            try:
+                orthodontics.reshape(vim.current.buffer, cursor[0],
+                                     cursor[1], phases=phases)
+            except Exception as exc:
+                error = '%s: %s' % (exc.__class__.__name__, exc)
+                break
+            for phase, seconds, _ in phases:
+                best[phase] = min(seconds, best.get(phase, seconds))
+        result = {'corpus': name,
+                  'size': size,
+                  'chars': sum(len(line) for line in lines),
+                  'phases': best,
+                  'seconds': sum(best.values()),
+                  'error': error}
+        print('%-14s size=%-6s %s' % (
+            name,
+            size,
+            error or ' '.join('%s %.4fs' % (phase, best[phase])
+                              for phase in PHASES if phase in best)))
+        results.append(result)
+    return results
+
+
+def run_pooled(names=None, repetitions=3):
+    """Reshape each of the big corpora with ``reshape.reshape_text()``, in
+    this process and in a pool, and return a list of result dicts holding
+    the best time of each way."""
+    from timeit import default_timer
+    from reshape import reshape_text
+
+    results = []
+    pool = Pool(cpu_count())
+    try:
+        for name, make_corpus, size in POOLED_CORPORA:
+            if names and name not in names:
+                continue
+            lines, _ = make_corpus(size)
+            text = '\n'.join(lines)
+            best = {}
+            for _ in range(repetitions):
+                for way, way_pool in [('serial', None), ('pool', pool)]:
+                    start = default_timer()
+                    reshape_text(text, 'outline', way_pool)
+                    seconds = default_timer() - start
+                    best[way] = min(seconds, best.get(way, seconds))
+            result = {'corpus': name,
+                      'size': size,
+                      'chars': len(text),
+                      'phases': best,
+                      'seconds': best['pool'],
+                      'error': None}
+            print('%-14s size=%-6s serial %.4fs pool %.4fs on %s CPUs' % (
+                name, size, best['serial'], best['pool'], cpu_count()))
+            results.append(result)
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def key(result):
+    """Return a description of which reshape ``result`` measures, by which
+    it's matched with its baseline."""
+    return '%(corpus)s size=%(size)s' % result
+
+
+def phase_regressions(results, baseline, tolerance, floor=FLOOR):
+    """Return a description of each phase more than ``tolerance`` (a
+    fraction) slower than in ``baseline``, but for those quicker than
+    ``floor`` seconds, and of each reshape that now fails."""
+    old_results = dict((key(result), result) for result in baseline)
+    worse = []
+    for result in results:
+        old = old_results.get(key(result))
+        if old is not None and result['error'] and not old['error']:
+            worse.append('%s: now fails with %s' % (key(result),
+                                                     result['error']))
+    return worse + regressions(results, baseline, tolerance, key=key,
+                               measurements=lambda result: result['phases'],
+                               floor=floor, timed=lambda name: True)
+
+
+def main(argv=None):
+    parser = argument_parser('Benchmark reshaping, headless.',
+                             [c[0] for c in CORPORA + POOLED_CORPORA], 3)
+    parser.add_argument('--recursion-limit', type=int, default=100000,
+                        help='Recursion limit to parse under (default: '
+                             '100000)')
+    args = parser.parse_args(argv)
+
+    sys.setrecursionlimit(args.recursion_limit)
+    vim = install_fake_vim()
+    results = (run(vim, args.names, args.repeat) +
+               run_pooled(args.names, args.repeat))
+    return report(results, args, regressions=phase_regressions)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
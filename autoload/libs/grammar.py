@@ -1,4 +1,10 @@
-from parsimonious.grammar import Grammar
+from array import array
+from multiprocessing import cpu_count
+import re
+
+from parsimonious.exceptions import ParseError
+from parsimonious.expressions import TokenMatcher
+from parsimonious.grammar import Grammar, TokenGrammar
 from parsimonious.nodes import (
     NodeVisitor,
     Node,
@@ -27,7 +33,7 @@ car
     / fn
     / symb
 
-sep = ( ws "," ws )
+sep = @( ws "," ws )
 
 kv
     = ( k ws '=' ws v )
@@ -49,8 +55,8 @@ fn = symb surrounded
 symb = ~r"[A-Za-z0-9._-]+"
 
 string
-    = ( '"' ~r'[^"]*' '"' )
-    / ( "'" ~r"[^']*" "'" )
+    = @( ( '"' ~r'[^"]*' '"' )
+       / ( "'" ~r"[^']*" "'" ) )
 
 number = ~r"[0-9]+[.]?[0-9]*"
 
@@ -138,7 +144,7 @@ class SurroundedNode(FamilyMixin):
         indent = u"    " * (self.indent() - 1)
         return u"{s.prefix}\n{content}\n{indent}{s.suffix}".format(
             s=self,
-            content=self.content.outline(),
+            content=content,
             indent=indent,
         )
 
@@ -189,6 +195,8 @@ class KVNode(FamilyMixin):
 
 class Visitor(NodeVisitor):
     grammar = g
+    # Their nodes' text is all we need:
+    opaque_rules = frozenset(['ws', 'sep', 'string', 'symb', 'number'])
     valid_nodes = (
         SurroundedNode,
         KVNode,
@@ -199,6 +207,10 @@ class Visitor(NodeVisitor):
     def generic_visit(self, node, visited_children):
         return visited_children or node
 
+    def text(self, node):
+        """Return the text ``node`` matched."""
+        return node.text
+
     def visit_surrounded(self, node, elements):
         prefix, _, expr, _, suffix = elements[0]
         if isinstance(expr, Node):
@@ -206,9 +218,9 @@ class Visitor(NodeVisitor):
         else:
             expr = expr[0]
         ret = SurroundedNode(
-            prefix=prefix.text,
+            prefix=self.text(prefix),
             content=expr,
-            suffix=suffix.text,
+            suffix=self.text(suffix),
         )
         expr.parent = ret
         return ret
@@ -230,14 +242,14 @@ class Visitor(NodeVisitor):
         if isinstance(el, self.valid_nodes):
             return el
         if isinstance(el, Node):
-            return StringNode(content=el.text)
+            return StringNode(content=self.text(el))
         raise ValueError("Invalid el")
 
     def visit_kv(self, node, elements):
         key, _, sep, _, val = elements[0]
         ret = KVNode(
             key=key,
-            sep=sep.text,
+            sep=self.text(sep),
             val=val,
         )
         val.parent = ret
@@ -245,8 +257,8 @@ class Visitor(NodeVisitor):
 
     def visit_k(self, node, elements):
         el = elements[0]
-        if isinstance(el, StringNode):
-            return el
+        if isinstance(el, Node):
+            return StringNode(content=self.text(el))
         raise ValueError("Somehow, a bad key")
 
     def visit_v(self, node, elements):
@@ -254,102 +266,584 @@ class Visitor(NodeVisitor):
         if isinstance(el, self.valid_nodes):
             return el
         if isinstance(el, Node):
-            return StringNode(content=el.text)
+            return StringNode(content=self.text(el))
         raise ValueError("Invalid el")
 
-    def visit_symb(self, node, elements):
-        return StringNode(content=node.text)
-
-    def visit_string(self, node, elements):
-        open, txt, close = elements[0]
-        return StringNode(content=open.text + txt.text + close.text)
-
     def visit_fn(self, node, elements):
         symb, surrounded = elements
-        ret = FnNode(symb=symb, surrounded=surrounded)
+        ret = FnNode(symb=StringNode(content=self.text(symb)),
+                     surrounded=surrounded)
         surrounded.parent = ret
         return ret
 
-    def visit_number(self, node, elements):
-        return StringNode(content=node.text)
+
+# Each opening bracket, and the bracket that closes it:
+PAIRS = {
+    '(': ')',
+    '[': ']',
+    '{': '}',
+}
+# The characters that matter when splitting a literal into its elements:
+SPECIALS = re.compile(r"""[][(){}"',]""")
+# What the grammar's ``ws`` rule skips:
+WHITESPACE = ' \t\n\r'
+
+
+def split_elements(text, pos=0, endpos=None):
+    """Return the ``(start, end)`` of each top-level element of the bracketed
+    literal ``text[pos:endpos]``, without surrounding whitespace, by a quick
+    scan that minds only brackets, quotes, and commas.
+
+    Return None if the literal isn't one we can split that way: if its
+    brackets or quotes don't balance, if it has an empty element (other than
+    after a trailing comma), or if it's empty.
+
+    """
+    if endpos is None:
+        endpos = len(text)
+    if (endpos - pos < 2 or text[pos] not in PAIRS or
+            text[endpos - 1] != PAIRS[text[pos]]):
+        return None
+    stop = endpos - 1
+    spans = []
+    depth = 0
+    start = i = pos + 1
+    search = SPECIALS.search
+    while True:
+        special = search(text, i, stop)
+        if special is None:
+            break
+        char = special.group()
+        i = special.end()
+        if char in '"\'':
+            i = text.find(char, i, stop) + 1
+            if not i:
+                return None
+        elif char == ',':
+            if not depth:
+                spans.append((start, special.start()))
+                start = i
+        elif char in PAIRS:
+            depth += 1
+        else:
+            depth -= 1
+            if depth < 0:
+                return None
+    if depth:
+        return None
+    spans.append((start, stop))
+
+    elements = []
+    for start, end in spans:
+        while start < end and text[start] in WHITESPACE:
+            start += 1
+        while end > start and text[end - 1] in WHITESPACE:
+            end -= 1
+        elements.append((start, end))
+    if elements[-1][0] == elements[-1][1]:
+        elements.pop()  # after a trailing comma
+    if not elements or any(start == end for start, end in elements):
+        return None
+    return elements
+
+
+# The grammar's terminals, for :class:`FastParser`:
+WS = re.compile(r"[ \t\n\r]*")
+SYMB = re.compile(r"[A-Za-z0-9._-]+")
+NUMBER = re.compile(r"[0-9]+[.]?[0-9]*")
+
+
+class FastParser(object):
+    """A hand-written parser for the language of :data:`g`, making the tree
+    :class:`Visitor` would make in one pass, with no parse Nodes in between
+
+    Each method but :meth:`ws()` mirrors the rule it's named after, trying
+    its alternatives in the same order and, as a PEG does, committing to the
+    first that matches. It returns the visited result and the index just
+    past it, or None if the rule doesn't match at ``pos``. :data:`g` and
+    :class:`Visitor` remain the reference: the tests check this against
+    them.
+
+    """
+    def __init__(self, text, endpos):
+        self.text = text
+        self.endpos = endpos
+
+    def ws(self, pos):
+        if pos < self.endpos and self.text[pos] in WHITESPACE:
+            return WS.match(self.text, pos, self.endpos).end()
+        return pos
+
+    def surrounded(self, pos):
+        text, endpos = self.text, self.endpos
+        if pos >= endpos or text[pos] not in PAIRS:
+            return None
+        prefix = text[pos]
+        end = self.ws(pos + 1)
+        result = self.expr(end)
+        if result is None:
+            content = ListNode(content=[])
+        else:
+            content, end = result
+        end = self.ws(end)
+        if end >= endpos or text[end] != PAIRS[prefix]:
+            return None
+        ret = SurroundedNode(prefix=prefix, content=content, suffix=text[end])
+        content.parent = ret
+        return ret, end + 1
+
+    def expr(self, pos):
+        # ``car sep expr / car sep?``: elements separated, and maybe
+        # followed, by separators
+        result = self.car(pos)
+        if result is None:
+            return None
+        content = []
+        while result is not None:
+            car, pos = result
+            content.append(car)
+            end = self.sep(pos)
+            if end is None:
+                break
+            pos = end
+            result = self.car(pos)
+        ret = ListNode(content=content)
+        for el in content:
+            el.parent = ret
+        return ret, pos
+
+    def car(self, pos):
+        return self.kv(pos) or self.v(pos)
+
+    def sep(self, pos):
+        pos = self.ws(pos)
+        if pos < self.endpos and self.text[pos] == ',':
+            return self.ws(pos + 1)
+        return None
+
+    def kv(self, pos):
+        text, endpos = self.text, self.endpos
+        result = self.k(pos)
+        if result is None:
+            return None
+        key, end = result
+        end = self.ws(end)
+        if end >= endpos or text[end] not in '=:':
+            return None
+        sep = text[end]
+        result = self.v(self.ws(end + 1))
+        if result is None:
+            return None
+        val, end = result
+        ret = KVNode(key=key, sep=sep, val=val)
+        val.parent = ret
+        return ret, end
+
+    def k(self, pos):
+        return self.string(pos) or self.symb(pos)
+
+    def v(self, pos):
+        return (self.number(pos) or self.string(pos) or
+                self.surrounded(pos) or self.fn(pos) or self.symb(pos))
+
+    def fn(self, pos):
+        match = SYMB.match(self.text, pos, self.endpos)
+        if match is None:
+            return None
+        result = self.surrounded(match.end())
+        if result is None:
+            return None
+        surrounded, end = result
+        ret = FnNode(symb=StringNode(content=match.group()),
+                     surrounded=surrounded)
+        surrounded.parent = ret
+        return ret, end
+
+    def symb(self, pos):
+        match = SYMB.match(self.text, pos, self.endpos)
+        if match is None:
+            return None
+        return StringNode(content=match.group()), match.end()
+
+    def string(self, pos):
+        text = self.text
+        if pos < self.endpos and text[pos] in '"\'':
+            end = text.find(text[pos], pos + 1, self.endpos) + 1
+            if end:
+                return StringNode(content=text[pos:end]), end
+        return None
+
+    def number(self, pos):
+        match = NUMBER.match(self.text, pos, self.endpos)
+        if match is None:
+            return None
+        return StringNode(content=match.group()), match.end()
+
+
+def fast_parse(text, pos=0, endpos=None):
+    """Return the tree :class:`Visitor` would make of the bracketed literal
+    ``text[pos:endpos]``, made the fast way, by :class:`FastParser`.
+
+    Return None if the literal doesn't parse, or is nested too deeply to
+    parse by recursion; :func:`parse()` then has the general parser try, for
+    the sake of its error message, if nothing else.
+
+    """
+    if endpos is None:
+        endpos = len(text)
+    try:
+        result = FastParser(text, endpos).surrounded(pos)
+    except RuntimeError:  # Too deep
+        return None
+    if result is None or result[1] != endpos:
+        return None
+    return result[0]
+
+
+def parse(text, pos=0, endpos=None):
+    """Return the tree of the bracketed literal ``text[pos:endpos]``, made
+    the fast way if possible, or by :class:`Visitor` if not, which raises a
+    ParseError if it doesn't parse."""
+    tree = fast_parse(text, pos, endpos)
+    if tree is None:
+        tree = Visitor().parse(text, pos=pos, endpos=endpos)
+    return tree
+
+
+# The type codes of the tokens :func:`lex()` makes, in the order of their
+# groups in TOKEN:
+(LPAREN, RPAREN, LBRACKET, RBRACKET, LBRACE, RBRACE, COMMA, EQUALS, COLON,
+ STRING_TOKEN, NUMBER_TOKEN, NUMSYMB, SYMB_TOKEN, GLUE) = range(14)
+# One token, after any whitespace. A run of the characters of ``symb`` is
+# one token, since the grammar's regexes take all of it: a number, if all of
+# it is one; a "numsymb", if it only starts like one, which can be nothing
+# but a key; or a symbol.
+TOKEN = re.compile(r"""
+    [ \t\n\r]*
+    (?: (\() | (\)) | (\[) | (\]) | (\{) | (\}) | (,) | (=) | (:)
+      | ( "[^"]*" | '[^']*' )
+      | ( [0-9]+ [.]? [0-9]* (?![A-Za-z0-9._-]) )
+      | ( [0-9] [A-Za-z0-9._-]* )
+      | ( [A-Za-z0-9._-]+ ) )
+    """, re.X)
+RUNS = frozenset([NUMBER_TOKEN, NUMSYMB, SYMB_TOKEN])
+OPENERS = frozenset([LPAREN, LBRACKET, LBRACE])
+
+
+def lex(text, pos=0, endpos=None):
+    """Return the tokens of the bracketed literal ``text[pos:endpos]``: an
+    ``array`` of their type codes, and arrays of where each starts and ends
+    in ``text``. Whitespace makes no tokens.
+
+    The grammar has whitespace between a function's name and its arguments
+    mean they aren't one, so a GLUE token, of no width, stands between a run
+    and a bracket that follows it directly.
+
+    Return None if some of the text can't be made into tokens, or there's
+    whitespace at either end, neither of which the grammar allows.
+
+    """
+    if endpos is None:
+        endpos = len(text)
+    codes, starts, ends = array('B'), array('l'), array('l')
+    end = pos
+    code = None
+    for match in TOKEN.finditer(text, pos, endpos):
+        if match.start() != end:
+            return None  # Something no token matches
+        previous = code
+        code = match.lastindex - 1
+        start, end = match.span(match.lastindex)
+        if previous in RUNS and code in OPENERS and start == ends[-1]:
+            codes.append(GLUE)
+            starts.append(start)
+            ends.append(start)
+        codes.append(code)
+        starts.append(start)
+        ends.append(end)
+    if end != endpos or not codes or starts[0] != pos:
+        return None
+    return codes, starts, ends
+
+
+# The grammar of :data:`g`, over the tokens :func:`lex()` makes
+token_grammar = TokenGrammar(
+    r"""
+surrounded
+    = ( lparen expr? rparen )
+    / ( lbracket expr? rbracket )
+    / ( lbrace expr? rbrace )
+
+expr
+    = ( car comma expr )
+    / ( car comma? )
+
+car
+    = kv
+    / number
+    / string
+    / surrounded
+    / fn
+    / symb
+
+kv
+    = ( k equals v )
+    / ( k colon v )
+
+k
+    = string
+    / symb
+    / number
+    / numsymb
+
+v
+    = number
+    / string
+    / surrounded
+    / fn
+    / symb
+
+fn = symb glue surrounded
+    """,
+    **dict((name, TokenMatcher(code, name=name)) for name, code in [
+        ('lparen', LPAREN), ('rparen', RPAREN), ('lbracket', LBRACKET),
+        ('rbracket', RBRACKET), ('lbrace', LBRACE), ('rbrace', RBRACE),
+        ('comma', COMMA), ('equals', EQUALS), ('colon', COLON),
+        ('string', STRING_TOKEN), ('number', NUMBER_TOKEN),
+        ('numsymb', NUMSYMB), ('symb', SYMB_TOKEN), ('glue', GLUE)])
+)
+
+
+class TokenVisitor(Visitor):
+    """A visitor that makes the tree :class:`Visitor` would of a literal,
+    from its parse by :data:`token_grammar`"""
+
+    grammar = token_grammar
+
+    def __init__(self, text, starts, ends):
+        self.source = text
+        self.starts = starts
+        self.ends = ends
+
+    def text(self, node):
+        return self.source[self.starts[node.start]:self.ends[node.end - 1]]
+
+    def visit_surrounded(self, node, elements):
+        prefix, expr, suffix = elements[0]
+        return super(TokenVisitor, self).visit_surrounded(
+            node, [[prefix, None, expr, None, suffix]])
+
+    def visit_kv(self, node, elements):
+        key, sep, val = elements[0]
+        return super(TokenVisitor, self).visit_kv(
+            node, [[key, None, sep, None, val]])
+
+    def visit_fn(self, node, elements):
+        symb, _, surrounded = elements
+        return super(TokenVisitor, self).visit_fn(node, [symb, surrounded])
+
+
+def token_parse(text, pos=0, endpos=None):
+    """Return the tree :class:`Visitor` would make of the bracketed literal
+    ``text[pos:endpos]``, made by lexing it and parsing the tokens with
+    :data:`token_grammar`, so whitespace costs nothing and backtracking
+    costs per token rather than per character.
+
+    Return None if the literal doesn't parse; the positions in a
+    ParseError of the tokens wouldn't say much.
+
+    """
+    tokens = lex(text, pos, endpos)
+    if tokens is None:
+        return None
+    codes, starts, ends = tokens
+    try:
+        node = token_grammar.parse(codes)
+    except ParseError:
+        return None
+    return TokenVisitor(text, starts, ends).visit(node)
+
+
+def render_element(args):
+    """Return one element of a bracketed literal rendered as it would be in
+    place, or None if it doesn't parse, for :func:`render_parallel()`'s
+    workers.
+
+    :arg args: The element's text, the literal's opening and closing
+        brackets, and the style to render in
+
+    """
+    text, prefix, suffix, style = args
+    try:
+        result = FastParser(text, len(text)).car(0)
+    except RuntimeError:  # Too deep
+        return None
+    if result is None or result[1] != len(text):
+        return None
+    element = result[0]
+    # Give it the family it'd have in place, for indentation's sake:
+    content = ListNode(content=[element])
+    element.parent = content
+    content.parent = SurroundedNode(prefix, content, suffix)
+    return getattr(element, style)()
+
+
+# How long a literal must be for rendering it in a pool to be worth
+# shipping its elements to the workers and the results back:
+PARALLEL_SIZE = 1 << 18
+
+
+def render_parallel(text, style='outline', pos=0, endpos=None, pool=None,
+                    chunksize=None):
+    """Return the bracketed literal ``text[pos:endpos]`` rendered in
+    ``style``, ``'inline'`` or ``'outline'``, rendering its elements in
+    ``pool``, a ``multiprocessing.Pool`` of the caller's, if it's long enough
+    to be worth it.
+
+    The result is just what parsing the literal with :class:`Visitor` and
+    rendering it would give. Without a pool, or for literals shorter than
+    :data:`PARALLEL_SIZE`, or ones that :func:`split_elements()` can't split
+    or that don't parse element by element, that's just what happens, by way
+    of :func:`parse()`, which raises a ParseError if the literal doesn't
+    parse.
+
+    :arg chunksize: How many elements to hand a worker at a time. By
+        default, enough to give each of one worker per CPU about four
+        batches.
+
+    """
+    if endpos is None:
+        endpos = len(text)
+    if pool is not None and endpos - pos >= PARALLEL_SIZE:
+        spans = split_elements(text, pos, endpos)
+        if spans is not None:
+            if chunksize is None:
+                chunksize = max(1, len(spans) // (4 * cpu_count()))
+            prefix, suffix = text[pos], text[endpos - 1]
+            rendered = pool.map(render_element,
+                                [(text[start:end], prefix, suffix, style)
+                                 for start, end in spans],
+                                chunksize)
+            if None not in rendered:
+                content = ListNode(content=[StringNode(content=piece)
+                                            for piece in rendered])
+                content.parent = SurroundedNode(prefix, content, suffix)
+                return getattr(content.parent, style)()
+    return getattr(parse(text, pos, endpos), style)()
 
 
 if __name__ == "__main__":
     # Then run tests
+    from textwrap import dedent
 
     def single_test(input, inline, outline):
-        result = Visitor().parse(input)
-        assert result.inline() == inline, repr(result.inline())
-        assert result.outline() == outline, repr(result.outline())
+        for ends_only in (False, True):
+            result = Visitor().parse(input, ends_only=ends_only)
+            assert result.inline() == inline, repr(result.inline())
+            assert result.outline() == outline, repr(result.outline())
+        for fast in (fast_parse(input), token_parse(input)):
+            assert fast.inline() == inline, repr(fast.inline())
+            assert fast.outline() == outline, repr(fast.outline())
+        for style, expected in (('inline', inline), ('outline', outline)):
+            rendered = render_parallel(input, style)
+            assert rendered == expected, repr(rendered)
         print("Passed: {}".format(input))
 
+    def reference_test(input):
+        # The fast path and the token path should parse just what the
+        # grammar does, the same way.
+        try:
+            reference = Visitor().parse(input, ends_only=True)
+        except ParseError:
+            reference = None
+        for parse_fn in (fast_parse, token_parse):
+            fast = parse_fn(input)
+            if reference is None:
+                assert fast is None, input
+            else:
+                assert fast.inline() == reference.inline(), input
+                assert fast.outline() == reference.outline(), input
+            # And the same within a longer text:
+            text = 'x = ' + input + ' # y'
+            fast = parse_fn(text, 4, 4 + len(input))
+            assert (fast is None) == (reference is None), input
+        print("Passed: {}".format(input))
+
+    for input in ["(123abc)", "(foo (x))", "(1(x))", "(a: )", "(a, , b)",
+                  "(a,\n)", "(  )", '("k" = 1, "v")', "(a=b=c)", "(a: b: c)",
+                  "(a = f(x), -1)", "(1.2.3)", "('a\nb', \"c'\")", "(a,)]",
+                  "[{(}])", "[f(x)(y)]", "[f ()]", "[\"x]", "{a:(b,c),}",
+                  " (a)", "(a) ", "(a # b)", "{1a: b}", "{1.5.3: x}",
+                  "(1a)", "(-1, .5, 1.)", "(12(x))", "(\"a\"(x))"]:
+        reference_test(input)
+
     single_test("()", "()", "()")
     single_test("[]", "[]", "[]")
     single_test("{}", "{}", "{}")
     single_test(
         "(foo)",
         "(foo)",
-        """
+        dedent("""
     (
         foo,
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "(foo,)",
         "(foo)",
-        """
+        dedent("""
     (
         foo,
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "(foo, bar, baz)",
         "(foo, bar, baz)",
-        """
+        dedent("""
     (
         foo,
         bar,
         baz,
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "(foo, bar, baz,)",
         "(foo, bar, baz)",
-        """
+        dedent("""
     (
         foo,
         bar,
         baz,
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "([], {}, (),)",
         "([], {}, ())",
-        """
+        dedent("""
     (
         [],
         {},
         (),
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "{foo: bar}",
         "{foo: bar}",
-        """
+        dedent("""
     {
         foo: bar,
     }
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "({foo: bar,},bing,[bong])",
         "({foo: bar}, bing, [bong])",
-        """
+        dedent("""
     (
         {
             foo: bar,
@@ -359,12 +853,12 @@ if __name__ == "__main__":
             bong,
         ],
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "({foo: [],},bing,[bong])",
         "({foo: []}, bing, [bong])",
-        """
+        dedent("""
     (
         {
             foo: [],
@@ -374,103 +868,103 @@ if __name__ == "__main__":
             bong,
         ],
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "{ foo }",
         "{foo}",
-        """
+        dedent("""
     {
         foo,
     }
-        """.strip(),
+        """).strip(),
     )
     single_test(
         '{ "foo" }',
         '{"foo"}',
-        '''
+        dedent('''
     {
         "foo",
     }
-        '''.strip(),
+        ''').strip(),
     )
     single_test(
         "{ 'foo' }",
         "{'foo'}",
-        """
+        dedent("""
     {
         'foo',
     }
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "[foo.bar]",
         "[foo.bar]",
-        """
+        dedent("""
     [
         foo.bar,
     ]
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "[1]",
         "[1]",
-        """
+        dedent("""
     [
         1,
     ]
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "[1.]",
         "[1.]",
-        """
+        dedent("""
     [
         1.,
     ]
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "[1.0]",
         "[1.0]",
-        """
+        dedent("""
     [
         1.0,
     ]
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "[1, 2.0]",
         "[1, 2.0]",
-        """
+        dedent("""
     [
         1,
         2.0,
     ]
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "{ foo: bar }",
         "{foo: bar}",
-        """
+        dedent("""
     {
         foo: bar,
     }
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "{ 'foo': bar }",
         "{'foo': bar}",
-        """
+        dedent("""
     {
         'foo': bar,
     }
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "{ 'bim': boo, hi: [there, jim]}",
         "{'bim': boo, hi: [there, jim]}",
-        """
+        dedent("""
     {
         'bim': boo,
         hi: [
@@ -478,24 +972,24 @@ if __name__ == "__main__":
             jim,
         ],
     }
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "(foo=bar, bim={baz: boo},)",
         "(foo=bar, bim={baz: boo})",
-        """
+        dedent("""
     (
         foo=bar,
         bim={
             baz: boo,
         },
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "(foo,bar=baz,[bim,bloo],what={is:this})",
         "(foo, bar=baz, [bim, bloo], what={is: this})",
-        """
+        dedent("""
     (
         foo,
         bar=baz,
@@ -507,39 +1001,39 @@ if __name__ == "__main__":
             is: this,
         },
     )
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "[foo()]",
         "[foo()]",
-        """
+        dedent("""
     [
         foo(),
     ]
-        """.strip(),
+        """).strip(),
     )
     single_test(
         "[foo(bar)]",
         "[foo(bar)]",
-        """
+        dedent("""
     [
         foo(
             bar,
         ),
     ]
-        """.strip(),
+        """).strip(),
     )
     single_test(
-        """
+        dedent("""
         (foo, {'kwi': zok.pim,
             'bel': zok.wub,
             'pok': zok.nux,
             'lon': dee(foo),
             'hoi': dee(zok.che.rem('eph', toi=mep))},
         bar='bim', kuh={'rif': tou})
-        """.strip(),
+        """).strip(),
         "(foo, {'kwi': zok.pim, 'bel': zok.wub, 'pok': zok.nux, 'lon': dee(foo), 'hoi': dee(zok.che.rem('eph', toi=mep))}, bar='bim', kuh={'rif': tou})",  # NOQA
-        """
+        dedent("""
     (
         foo,
         {
@@ -561,5 +1055,5 @@ if __name__ == "__main__":
             'rif': tou,
         },
     )
-        """.strip(),
+        """).strip(),
     )
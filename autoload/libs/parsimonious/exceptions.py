@@ -1,26 +1,38 @@
 from six import text_type, python_2_unicode_compatible
 
-from parsimonious.utils import StrAndRepr
+from parsimonious.utils import StrAndRepr, excerpt
 
 
 @python_2_unicode_compatible
 class ParseError(StrAndRepr, Exception):
-    """A call to ``Expression.parse()`` or ``match()`` didn't match."""
+    """A call to ``Expression.parse()`` or ``match()`` didn't match.
 
-    def __init__(self, text, pos=-1, expr=None):
+    ``line_index`` is a :class:`~parsimonious.utils.LineIndex` of the text,
+    shared with whatever other errors are reported against it, to work out
+    the line and column from. Without one, they're worked out by counting the
+    newlines before ``pos``.
+
+    """
+
+    def __init__(self, text, pos=-1, expr=None, line_index=None):
         # It would be nice to use self.args, but I don't want to pay a penalty
         # to call descriptors or have the confusion of numerical indices in
         # Expression.match_core().
         self.text = text
         self.pos = pos
         self.expr = expr
+        self.line_index = line_index
+
+    def __reduce__(self):
+        # Exceptions pickle by their args, which we leave empty.
+        return self.__class__, (self.text, self.pos, self.expr)
 
     def __str__(self):
         rule_name = ((u"'%s'" % self.expr.name) if self.expr.name else
                      text_type(self.expr))
         return u"Rule %s didn't match at '%s' (line %s, column %s)." % (
                 rule_name,
-                self.text[self.pos:self.pos + 20],
+                excerpt(self.text, self.pos, self.pos + 20),
                 self.line(),
                 self.column())
 
@@ -32,15 +44,29 @@ class ParseError(StrAndRepr, Exception):
         match."""
         # This is a method rather than a property in case we ever wanted to
         # pass in which line endings we want to use.
-        return self.text.count('\n', 0, self.pos) + 1
+        if self.line_index is not None:
+            return self.line_index.line(self.pos)
+        text, newline = self._text_before()
+        return text.count(newline, 0, self.pos) + 1
 
     def column(self):
         """Return the 1-based column where the expression ceased to match."""
         # We choose 1-based because that's what Python does with SyntaxErrors.
-        try:
-            return self.pos - self.text.rindex('\n', 0, self.pos)
-        except ValueError:
-            return self.pos + 1
+        if self.line_index is not None:
+            return self.line_index.column(self.pos)
+        text, newline = self._text_before()
+        return self.pos - text.rfind(newline, 0, self.pos)
+
+    def _text_before(self):
+        """Return a string with the text up to ``pos`` at its start, and the
+        newline to count in it."""
+        text = self.text
+        if not isinstance(text, (text_type, bytes)):
+            # Ropes and memoryviews can't count, so copy out what's needed.
+            text = text[:max(self.pos, 0)]
+            if isinstance(text, memoryview):
+                text = text.tobytes()
+        return text, '\n' if isinstance(text, text_type) else b'\n'
 
 
 @python_2_unicode_compatible
@@ -51,7 +77,7 @@ class IncompleteParseError(ParseError):
     def __str__(self):
         return u"Rule '%s' matched in its entirety, but it didn't consume all the text. The non-matching portion of the text begins with '%s' (line %s, column %s)." % (
                 self.expr.name,
-                self.text[self.pos:self.pos + 20],
+                excerpt(self.text, self.pos, self.pos + 20),
                 self.line(),
                 self.column())
 
@@ -65,9 +91,8 @@ class VisitationError(Exception):
     tree traversal in your head.
 
     """
-    # TODO: Make sure this is pickleable. Probably use @property pattern. Make
-    # the original exc and node available on it if they don't cause a whole
-    # raft of stack frames to be retained.
+    # TODO: Make the original exc and node available on it if they don't cause
+    # a whole raft of stack frames to be retained.
     def __init__(self, exc, exc_class, node):
         """Construct.
 
@@ -84,6 +109,21 @@ class VisitationError(Exception):
              exc,
              node.prettily(error=node)))
 
+    def __reduce__(self):
+        # Pickle just the message, since the exception and node may not
+        # pickle.
+        return _unpickle_visitation_error, (self.__class__, self.args,
+                                            self.original_class)
+
+
+def _unpickle_visitation_error(cls, args, original_class):
+    """Return a VisitationError of class ``cls`` with the given ``args`` and
+    ``original_class``, without calling its constructor."""
+    error = Exception.__new__(cls)
+    error.args = args
+    error.original_class = original_class
+    return error
+
 
 class BadGrammar(StrAndRepr, Exception):
     """Something was wrong with the definition of a grammar.
@@ -6,18 +6,34 @@ These do the parsing.
 # TODO: Make sure all symbol refs are local--not class lookups or
 # anything--for speed. And kill all the dots.
 
+from copy import copy
 from inspect import getargspec
+from mmap import mmap
 import re
+from sys import maxsize
 
-from six import integer_types, python_2_unicode_compatible
+from six import PY3, integer_types, python_2_unicode_compatible, text_type
 from six.moves import range
 
 from parsimonious.exceptions import ParseError, IncompleteParseError
 from parsimonious.nodes import Node, RegexNode
-from parsimonious.utils import StrAndRepr
+from parsimonious.utils import Rope, StrAndRepr
 
 MARKER = object()
 
+# Key under which an ends-only cache keeps a nested, ordinary Node cache for
+# expressions that know no cheaper way to match than building whole Nodes:
+NODE_CACHE = object()
+
+# Types of text that are matched as bytes, by the bytes twins of expressions
+# (see Expression.encoded()):
+BINARY_TYPES = (bytearray, memoryview, mmap) + ((bytes,) if PY3 else ())
+
+
+def _endpos(text, endpos):
+    """Return the ``endpos`` a match of ``text`` should actually stop at."""
+    return len(text) if endpos is None else min(endpos, len(text))
+
 
 def expression(callable, rule_name, grammar):
     """Turn a plain callable into an Expression.
@@ -47,6 +63,11 @@ def expression(callable, rule_name, grammar):
             ...
             # Return values as above.
 
+    ``error`` is None during the first, optimistic pass of a match, when we
+    don't track errors; pass it along as-is. Custom rules aren't told the
+    ``endpos`` of a match, but any match of theirs that runs past it is
+    treated as a failure.
+
     The return value of the callable, if an int or a tuple, will be
     automatically transmuted into a :class:`~parsimonious.Node`. If it returns
     a Node-like class directly, it will be passed through unchanged.
@@ -67,7 +88,7 @@ def expression(callable, rule_name, grammar):
                            "arguments, not %s." % num_args)
 
     class AdHocExpression(Expression):
-        def _uncached_match(self, text, pos, cache, error):
+        def _uncached_match(self, text, pos, cache, error, endpos):
             result = (callable(text, pos) if is_simple else
                       callable(text, pos, cache, error, grammar))
 
@@ -75,9 +96,15 @@ def expression(callable, rule_name, grammar):
                 end, children = result, None
             elif isinstance(result, tuple):
                 end, children = result
-            else:
+            elif result is None or result.end <= endpos:
                 # Node or None
                 return result
+            else:
+                return None
+            if end > endpos:
+                # Custom rules don't know about endpos. Don't let them cross
+                # it.
+                return None
             return Node(self.name, text, pos, end, children=children)
 
         def _as_rhs(self):
@@ -94,40 +121,190 @@ class Expression(StrAndRepr):
     # http://stackoverflow.com/questions/1336791/dictionary-vs-object-which-is-more-efficient-and-why
 
     # Top-level expressions--rules--have names. Subexpressions are named ''.
-    __slots__ = ['name']
+    # _bytes_twin caches what encoded() returns, for matching bytes.
+    __slots__ = ['name', '_bytes_twin']
 
     def __init__(self, name=''):
         self.name = name
+        self._bytes_twin = None
 
-    def parse(self, text, pos=0):
+    def parse(self, text, pos=0, ends_only=False, endpos=None,
+              line_index=None):
         """Return a parse tree of ``text``.
 
         Raise ``ParseError`` if the expression wasn't satisfied. Raise
         ``IncompleteParseError`` if the expression was satisfied but didn't
-        consume the full string.
+        consume the full string--or, if ``endpos`` is given, everything up to
+        it.
 
         """
-        node = self.match(text, pos=pos)
-        if node.end < len(text):
-            raise IncompleteParseError(text, node.end, self)
+        self, text = self._for_text(text)
+        endpos = _endpos(text, endpos)
+        node = self.match(text, pos=pos, ends_only=ends_only, endpos=endpos,
+                          line_index=line_index)
+        if node.end < endpos:
+            raise IncompleteParseError(text, node.end, self, line_index)
         return node
 
-    def match(self, text, pos=0):
+    def match(self, text, pos=0, ends_only=False, endpos=None,
+              line_index=None):
         """Return the parse tree matching this expression at the given
         position, not necessarily extending all the way to the end of ``text``.
 
         Raise ``ParseError`` if there is no match there.
 
         :arg pos: The index at which to start matching
+        :arg ends_only: Whether to have the packrat cache hold only the end
+            position of each match (see :meth:`match_end_core()`) rather than
+            whole Nodes. Nodes are then built only along the winning
+            derivation, which saves lots of allocation in grammars that
+            backtrack a lot. The resulting tree is the same either way.
+        :arg endpos: The index past which not to look, as if ``text`` ended
+            there, like the ``endpos`` of a compiled regex's ``match()``.
+            Parse a region of a big string this way rather than slicing it
+            out; the Nodes' positions are then relative to the whole string.
+        :arg line_index: A :class:`~parsimonious.utils.LineIndex` of ``text``
+            for any ``ParseError`` to work out its line and column from. Pass
+            the same one to each parse of a region of a big text, so the
+            text is indexed once, and only if an error's line is asked for.
+
+        ``text`` can also be bytes-like--``bytes``, a ``bytearray``, a
+        ``memoryview``, or an ``mmap``--in which case it's matched by my
+        UTF-8 twin (see :meth:`encoded()`), and the Nodes' ``full_text`` is a
+        ``memoryview`` of it, so their ``text`` is sliced without copying.
+        That makes it possible to parse a memory-mapped file without reading
+        it in or decoding it.
 
         """
-        error = ParseError(text)
-        node = self.match_core(text, pos, {}, error)
+        self, text = self._for_text(text)
+        endpos = _endpos(text, endpos)
+        # Most matches succeed, so make a first pass without paying for error
+        # tracking. Only if that fails do we go back and work out whom to
+        # blame.
+        if ends_only:
+            cache = {}
+            end = self.match_end_core(text, pos, cache, None, endpos)
+            node = (None if end is None else
+                    self._reconstruct(text, pos, end, cache, endpos))
+        else:
+            node = self.match_core(text, pos, {}, None, endpos)
         if node is None:
-            raise error
+            raise self._match_error(text, pos, ends_only, endpos, line_index)
         return node
 
-    def match_core(self, text, pos, cache, error):
+    def iterparse(self, text, pos=0, endpos=None, line_index=None):
+        """Parse ``text``, and yield a flat stream of events describing the
+        parse tree rather than building it.
+
+        Each event is an ``(event, rule_name, start, end)`` tuple. A node with
+        children yields an ``'enter'`` event, then the events of its
+        children, then an ``'exit'``; a childless one yields a single
+        ``'token'``. Only named expressions--rules--get ``'enter'`` and
+        ``'exit'`` events; the children of unnamed ones are spliced into
+        their parents' streams. ``rule_name`` is ``''`` for unnamed tokens.
+
+        The whole text is recognized in ends-only mode (see :meth:`match()`)
+        before the first event is yielded, since no part of a derivation is
+        settled till the whole of it succeeds, and the events are then read
+        from the packrat cache that leaves. So no Nodes are built, except by
+        custom rules, but memory still grows with the text: the cache, an
+        entry for each expression tried at each position, is kept till the
+        last event. Errors are raised, as by :meth:`parse()`, when the first
+        event is asked for. Bytes-like ``text`` and ``line_index`` are
+        handled as by :meth:`match()`.
+
+        """
+        self, text = self._for_text(text)
+        endpos = _endpos(text, endpos)
+        cache = {}
+        end = self.match_end_core(text, pos, cache, None, endpos)
+        if end is None:
+            raise self._match_error(text, pos, True, endpos, line_index)
+        if end < endpos:
+            raise IncompleteParseError(text, end, self, line_index)
+
+        # A stack of (kind, expression or Node or rule name, start, end):
+        stack = [('expr', self, pos, end)]
+        while stack:
+            kind, thing, start, end = stack.pop()
+            if kind == 'exit':
+                yield 'exit', thing, start, end
+                continue
+            if kind == 'expr':
+                spans = thing._child_spans(text, start, end, cache)
+                if spans is None:
+                    # A custom rule, whose Node we have after all
+                    kind, thing = 'node', thing._reconstruct(text, start, end,
+                                                             cache, endpos)
+                else:
+                    name = thing.name
+                    children = [('expr',) + span for span in spans]
+            if kind == 'node':
+                name = thing.expr_name
+                children = [('node', child, child.start, child.end)
+                            for child in thing.children]
+            if not children:
+                yield 'token', name, start, end
+            else:
+                if name:
+                    yield 'enter', name, start, end
+                    stack.append(('exit', name, start, end))
+                stack.extend(reversed(children))
+
+    def encoded(self, encoding='utf-8'):
+        """Return a twin of me that matches bytes rather than text.
+
+        The twin, and each of its subexpressions, is a copy of the
+        corresponding one of mine, but with literals encoded with
+        ``encoding`` and regexes' patterns encoded and recompiled. Byte
+        regexes lack Unicode semantics, so ``\\w`` and friends, as well as
+        character classes of non-ASCII characters, match differently.
+        Custom rules get the bytes-like text as-is; any that delegate to
+        other rules of their grammar get those rules' text versions, which
+        won't match it.
+
+        """
+        return self._encoded(encoding, {})
+
+    def _encoded(self, encoding, twins):
+        """Return my twin for matching bytes encoded with ``encoding``.
+
+        :arg twins: A map of ``{id(expression): twin}`` made so far, so
+            shared and recursive subexpressions get one twin apiece
+
+        """
+        twin = twins.get(id(self))
+        if twin is None:
+            twin = twins[id(self)] = copy(self)
+            twin._bytes_twin = twin
+            self._encode(twin, encoding, twins)
+        return twin
+
+    def _encode(self, twin, encoding, twins):
+        """Make ``twin``, a fresh copy of me, match bytes encoded with
+        ``encoding``. This default, which suits custom rules, does nothing."""
+
+    def _for_text(self, text):
+        """Return the expression to match ``text`` with and the text to match:
+        myself and ``text`` or, if ``text`` is bytes-like, my UTF-8 twin and a
+        ``memoryview`` of it."""
+        if not isinstance(text, BINARY_TYPES):
+            return self, text
+        if self._bytes_twin is None:
+            self._bytes_twin = self.encoded()
+        return self._bytes_twin, memoryview(text)
+
+    def _match_error(self, text, pos, ends_only, endpos, line_index=None):
+        """Match again, this time with error tracking, and return the
+        resulting ``ParseError``."""
+        error = ParseError(text, line_index=line_index)
+        if ends_only:
+            self.match_end_core(text, pos, {}, error, endpos)
+        else:
+            self.match_core(text, pos, {}, error, endpos)
+        return error
+
+    def match_core(self, text, pos, cache, error, endpos=maxsize):
         """Internal guts of ``match()``
 
         This is appropriate to call only from custom rules or Expression
@@ -142,7 +319,10 @@ class Expression(StrAndRepr):
             as we go. (Sticking references on an existing instance is faster
             than allocating a new one for each expression that fails.) We
             return None rather than raising and catching ParseErrors because
-            catching is slow.
+            catching is slow. Pass None instead to skip error tracking
+            altogether.
+        :arg endpos: The index past which not to match. Custom rules should
+            pass it along if they're given it.
 
         """
         # TODO: Optimize. Probably a hot spot.
@@ -155,7 +335,8 @@ class Expression(StrAndRepr):
         # all the time. Also, can we move all the allocs up front?
         #
         # To save space, we have lots of choices: (0) Quit caching whole Node
-        # objects. Cache just what you need to reconstitute them. (1) Cache
+        # objects. Cache just what you need to reconstitute them. [Done, as
+        # an option: see match_end_core() and match(ends_only=True).] (1) Cache
         # only the results of entire rules, not subexpressions (probably a
         # horrible idea for rules that need to backtrack internally a lot). (2)
         # Age stuff out of the cache somehow. LRU? (3) Cuts.
@@ -165,10 +346,11 @@ class Expression(StrAndRepr):
             node = cache[(expr_id, pos)] = self._uncached_match(text,
                                                                 pos,
                                                                 cache,
-                                                                error)
+                                                                error,
+                                                                endpos)
 
         # Record progress for error reporting:
-        if node is None and pos >= error.pos and (
+        if node is None and error is not None and pos >= error.pos and (
                 self.name or getattr(error.expr, 'name', None) is None):
             # Don't bother reporting on unnamed expressions (unless that's all
             # we've seen so far), as they're hard to track down for a human.
@@ -179,6 +361,64 @@ class Expression(StrAndRepr):
 
         return node
 
+    def match_end_core(self, text, pos, cache, error, endpos=maxsize):
+        """Like :meth:`match_core()`, but return (and cache) only the index
+        where the match ends, or None if there is no match
+
+        This is option (0) from the ``match_core()`` TODO: rather than whole
+        Node objects, the packrat cache holds just what we need to
+        reconstitute them later, via :meth:`_reconstruct()`. Don't mix caches
+        between this and ``match_core()``.
+
+        """
+        expr_id = id(self)
+        end = cache.get((expr_id, pos), MARKER)
+        if end is MARKER:
+            end = cache[(expr_id, pos)] = self._uncached_end(text,
+                                                             pos,
+                                                             cache,
+                                                             error,
+                                                             endpos)
+
+        # Record progress for error reporting, just as match_core() does:
+        if end is None and error is not None and pos >= error.pos and (
+                self.name or getattr(error.expr, 'name', None) is None):
+            error.expr = self
+            error.pos = pos
+
+        return end
+
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        """Return the index where I stop matching at ``pos``, or None.
+
+        Subclasses override this, along with :meth:`_reconstruct()`, to avoid
+        allocating Nodes. This default, which suits custom rules, builds whole
+        Nodes after all and keeps them in a Node cache tucked inside the
+        ends-only one.
+
+        """
+        nodes = cache.get(NODE_CACHE)
+        if nodes is None:
+            nodes = cache[NODE_CACHE] = {}
+        node = self.match_core(text, pos, nodes, error, endpos)
+        return None if node is None else node.end
+
+    def _reconstruct(self, text, pos, end, cache, endpos):
+        """Return the Node I matched from ``pos`` to ``end``, rebuilding it
+        from the end positions in an ends-only ``cache``."""
+        return cache[NODE_CACHE][(id(self), pos)]
+
+    def _child_spans(self, text, pos, end, cache):
+        """Return a list of ``(expression, start, end)`` for the children of
+        the Node I matched from ``pos`` to ``end``, read from the end
+        positions in an ends-only ``cache``.
+
+        Return None if only my Node itself can say; that's the case for this
+        default, which suits custom rules.
+
+        """
+        return None
+
     def __str__(self):
         return u'<%s %s at 0x%s>' % (
             self.__class__.__name__,
@@ -224,10 +464,37 @@ class Literal(Expression):
         super(Literal, self).__init__(name)
         self.literal = literal
 
-    def _uncached_match(self, text, pos, cache, error):
-        if text.startswith(self.literal, pos):
+    def _uncached_match(self, text, pos, cache, error, endpos):
+        try:
+            matched = text.startswith(self.literal, pos, endpos)
+        except AttributeError:
+            matched = self._match_buffer(text, pos, endpos)
+        if matched:
             return Node(self.name, text, pos, pos + len(self.literal))
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        try:
+            matched = text.startswith(self.literal, pos, endpos)
+        except AttributeError:
+            matched = self._match_buffer(text, pos, endpos)
+        if matched:
+            return pos + len(self.literal)
+
+    def _reconstruct(self, text, pos, end, cache, endpos):
+        return Node(self.name, text, pos, end)
+
+    def _match_buffer(self, text, pos, endpos):
+        """Match a ``memoryview``, which has no ``startswith()``."""
+        end = pos + len(self.literal)
+        return end <= endpos and text[pos:end] == self.literal
+
+    def _child_spans(self, text, pos, end, cache):
+        return []
+
+    def _encode(self, twin, encoding, twins):
+        if isinstance(self.literal, text_type):
+            twin.literal = self.literal.encode(encoding)
+
     def _as_rhs(self):
         # TODO: Get backslash escaping right.
         return '"%s"' % self.literal
@@ -238,10 +505,27 @@ class TokenMatcher(Literal):
 
     This is for use only with TokenGrammars.
 
+    A token is matched by its ``type`` attribute or, if it has none, by
+    itself, so the tokens can be bare types: small ints in an ``array``, for
+    example, which take much less room than Token objects. Since the
+    TokenGrammar rule syntax makes TokenMatchers only of strings, pass ones
+    of other types as custom rules::
+
+        TokenGrammar('pair = open close', open=TokenMatcher(0, name='open'),
+                     close=TokenMatcher(1, name='close'))
+
     """
-    def _uncached_match(self, token_list, pos, cache, error):
-        if token_list[pos].type == self.literal:
-            return Node(self.name, token_list, pos, pos + 1)
+    def _uncached_match(self, token_list, pos, cache, error, endpos):
+        if pos < endpos:
+            token = token_list[pos]
+            if getattr(token, 'type', token) == self.literal:
+                return Node(self.name, token_list, pos, pos + 1)
+
+    def _uncached_end(self, token_list, pos, cache, error, endpos):
+        if pos < endpos:
+            token = token_list[pos]
+            if getattr(token, 'type', token) == self.literal:
+                return pos + 1
 
 
 class Regex(Expression):
@@ -263,15 +547,53 @@ class Regex(Expression):
                                       (unicode and re.U) |
                                       (verbose and re.X))
 
-    def _uncached_match(self, text, pos, cache, error):
+    def _uncached_match(self, text, pos, cache, error, endpos):
         """Return length of match, ``None`` if no match."""
-        m = self.re.match(text, pos)
+        try:
+            m = self.re.match(text, pos, endpos)
+        except TypeError:
+            m, _ = self._match_rope(text, pos, endpos)
         if m is not None:
             span = m.span()
             node = RegexNode(self.name, text, pos, pos + span[1] - span[0])
             node.match = m  # TODO: A terrible idea for cache size?
             return node
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        try:
+            m = self.re.match(text, pos, endpos)
+            offset = 0
+        except TypeError:
+            m, offset = self._match_rope(text, pos, endpos)
+        if m is not None:
+            return offset + m.end()
+
+    def _reconstruct(self, text, pos, end, cache, endpos):
+        # Matching again is cheaper than keeping every match object around,
+        # since we do it only along the winning derivation.
+        node = RegexNode(self.name, text, pos, end)
+        try:
+            node.match = self.re.match(text, pos, endpos)
+        except TypeError:
+            node.match, _ = self._match_rope(text, pos, endpos)
+        return node
+
+    def _match_rope(self, text, pos, endpos):
+        """Match a :class:`~parsimonious.utils.Rope`, which ``re`` can't
+        handle directly, returning the match and its offset."""
+        if not isinstance(text, Rope):
+            raise  # the TypeError our caller is handling
+        return text.match(self.re, pos, endpos)
+
+    def _child_spans(self, text, pos, end, cache):
+        return []
+
+    def _encode(self, twin, encoding, twins):
+        if isinstance(self.re.pattern, text_type):
+            # Byte patterns can't be Unicode ones.
+            twin.re = re.compile(self.re.pattern.encode(encoding),
+                                 self.re.flags & ~re.U)
+
     def _regex_flags_from_bits(self, bits):
         """Return the textual equivalent of numerically encoded regex flags."""
         flags = 'ilmsux'
@@ -293,6 +615,16 @@ class Compound(Expression):
         super(Compound, self).__init__(kwargs.get('name', ''))
         self.members = members
 
+    def _reconstruct(self, text, pos, end, cache, endpos):
+        return Node(self.name, text, pos, end, [
+            m._reconstruct(text, start, child_end, cache, endpos)
+            for m, start, child_end in self._child_spans(text, pos, end,
+                                                         cache)])
+
+    def _encode(self, twin, encoding, twins):
+        twin.members = tuple(m._encoded(encoding, twins)
+                             for m in self.members)
+
 
 class Sequence(Compound):
     """A series of expressions that must match contiguous, ordered pieces of
@@ -302,12 +634,12 @@ class Sequence(Compound):
     after another.
 
     """
-    def _uncached_match(self, text, pos, cache, error):
+    def _uncached_match(self, text, pos, cache, error, endpos):
         new_pos = pos
         length_of_sequence = 0
         children = []
         for m in self.members:
-            node = m.match_core(text, new_pos, cache, error)
+            node = m.match_core(text, new_pos, cache, error, endpos)
             if node is None:
                 return None
             children.append(node)
@@ -317,6 +649,23 @@ class Sequence(Compound):
         # Hooray! We got through all the members!
         return Node(self.name, text, pos, pos + length_of_sequence, children)
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        new_pos = pos
+        for m in self.members:
+            new_pos = m.match_end_core(text, new_pos, cache, error, endpos)
+            if new_pos is None:
+                return None
+        return new_pos
+
+    def _child_spans(self, text, pos, end, cache):
+        new_pos = pos
+        spans = []
+        for m in self.members:
+            child_end = cache[(id(m), new_pos)]
+            spans.append((m, new_pos, child_end))
+            new_pos = child_end
+        return spans
+
     def _as_rhs(self):
         return u'({0})'.format(u' '.join(self._unicode_members()))
 
@@ -328,13 +677,26 @@ class OneOf(Compound):
     wins.
 
     """
-    def _uncached_match(self, text, pos, cache, error):
+    def _uncached_match(self, text, pos, cache, error, endpos):
         for m in self.members:
-            node = m.match_core(text, pos, cache, error)
+            node = m.match_core(text, pos, cache, error, endpos)
             if node is not None:
                 # Wrap the succeeding child in a node representing the OneOf:
                 return Node(self.name, text, pos, node.end, children=[node])
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        for m in self.members:
+            end = m.match_end_core(text, pos, cache, error, endpos)
+            if end is not None:
+                return end
+
+    def _child_spans(self, text, pos, end, cache):
+        # The members before the winner were all tried and cached as failures.
+        for m in self.members:
+            child_end = cache[(id(m), pos)]
+            if child_end is not None:
+                return [(m, pos, child_end)]
+
     def _as_rhs(self):
         return u'({0})'.format(u' / '.join(self._unicode_members()))
 
@@ -347,11 +709,22 @@ class Lookahead(Compound):
     # Downside: pretty-printed grammars might be spelled differently than what
     # went in. That doesn't bother me.
 
-    def _uncached_match(self, text, pos, cache, error):
-        node = self.members[0].match_core(text, pos, cache, error)
+    def _uncached_match(self, text, pos, cache, error, endpos):
+        node = self.members[0].match_core(text, pos, cache, error, endpos)
         if node is not None:
             return Node(self.name, text, pos, pos)
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        if self.members[0].match_end_core(text, pos, cache, error,
+                                          endpos) is not None:
+            return pos
+
+    def _reconstruct(self, text, pos, end, cache, endpos):
+        return Node(self.name, text, pos, pos)
+
+    def _child_spans(self, text, pos, end, cache):
+        return []
+
     def _as_rhs(self):
         return u'&%s' % self._unicode_members()[0]
 
@@ -362,19 +735,58 @@ class Not(Compound):
     In any case, it never consumes any characters; it's a negative lookahead.
 
     """
-    def _uncached_match(self, text, pos, cache, error):
+    def _uncached_match(self, text, pos, cache, error, endpos):
         # FWIW, the implementation in Parsing Techniques in Figure 15.29 does
         # not bother to cache NOTs directly.
-        node = self.members[0].match_core(text, pos, cache, error)
+        node = self.members[0].match_core(text, pos, cache, error, endpos)
         if node is None:
             return Node(self.name, text, pos, pos)
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        if self.members[0].match_end_core(text, pos, cache, error,
+                                          endpos) is None:
+            return pos
+
+    def _reconstruct(self, text, pos, end, cache, endpos):
+        return Node(self.name, text, pos, pos)
+
+    def _child_spans(self, text, pos, end, cache):
+        return []
+
     def _as_rhs(self):
         # TODO: Make sure this parenthesizes the member properly if it's an OR
         # or AND.
         return u'!%s' % self._unicode_members()[0]
 
 
+class Atomic(Compound):
+    """An expression that matches what the contained one does but yields a
+    single, childless node
+
+    Use this for things like strings and numbers, where only the matched text
+    matters. The contained expression is matched with a scratch cache and
+    without building Nodes, so neither its subtree nor its memo entries
+    outlive the match.
+
+    """
+    def _uncached_match(self, text, pos, cache, error, endpos):
+        end = self.members[0].match_end_core(text, pos, {}, error, endpos)
+        if end is not None:
+            return Node(self.name, text, pos, end)
+
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        return self.members[0].match_end_core(text, pos, {}, error, endpos)
+
+    def _reconstruct(self, text, pos, end, cache, endpos):
+        return Node(self.name, text, pos, end)
+
+    def _child_spans(self, text, pos, end, cache):
+        return []
+
+    def _as_rhs(self):
+        return u'@%s' % self._unicode_members()[0]
+
+
 # Quantifiers. None of these is strictly necessary, but they're darn handy.
 
 class Optional(Compound):
@@ -384,11 +796,20 @@ class Optional(Compound):
     consumes. Otherwise, it consumes nothing.
 
     """
-    def _uncached_match(self, text, pos, cache, error):
-        node = self.members[0].match_core(text, pos, cache, error)
+    def _uncached_match(self, text, pos, cache, error, endpos):
+        node = self.members[0].match_core(text, pos, cache, error, endpos)
         return (Node(self.name, text, pos, pos) if node is None else
                 Node(self.name, text, pos, node.end, children=[node]))
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        end = self.members[0].match_end_core(text, pos, cache, error, endpos)
+        return pos if end is None else end
+
+    def _child_spans(self, text, pos, end, cache):
+        member = self.members[0]
+        child_end = cache[(id(member), pos)]
+        return [] if child_end is None else [(member, pos, child_end)]
+
     def _as_rhs(self):
         return u'%s?' % self._unicode_members()[0]
 
@@ -397,17 +818,37 @@ class Optional(Compound):
 class ZeroOrMore(Compound):
     """An expression wrapper like the * quantifier in regexes."""
 
-    def _uncached_match(self, text, pos, cache, error):
+    def _uncached_match(self, text, pos, cache, error, endpos):
         new_pos = pos
         children = []
         while True:
-            node = self.members[0].match_core(text, new_pos, cache, error)
+            node = self.members[0].match_core(text, new_pos, cache, error,
+                                              endpos)
             if node is None or not (node.end - node.start):
                 # Node was None or 0 length. 0 would otherwise loop infinitely.
                 return Node(self.name, text, pos, new_pos, children)
             children.append(node)
             new_pos += node.end - node.start
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        new_pos = pos
+        while True:
+            end = self.members[0].match_end_core(text, new_pos, cache, error,
+                                                 endpos)
+            if end is None or end == new_pos:
+                return new_pos
+            new_pos = end
+
+    def _child_spans(self, text, pos, end, cache):
+        member = self.members[0]
+        new_pos = pos
+        spans = []
+        while new_pos < end:
+            child_end = cache[(id(member), new_pos)]
+            spans.append((member, new_pos, child_end))
+            new_pos = child_end
+        return spans
+
     def _as_rhs(self):
         return u'%s*' % self._unicode_members()[0]
 
@@ -428,11 +869,12 @@ class OneOrMore(Compound):
         super(OneOrMore, self).__init__(member, name=name)
         self.min = min
 
-    def _uncached_match(self, text, pos, cache, error):
+    def _uncached_match(self, text, pos, cache, error, endpos):
         new_pos = pos
         children = []
         while True:
-            node = self.members[0].match_core(text, new_pos, cache, error)
+            node = self.members[0].match_core(text, new_pos, cache, error,
+                                              endpos)
             if node is None:
                 break
             children.append(node)
@@ -443,5 +885,34 @@ class OneOrMore(Compound):
         if len(children) >= self.min:
             return Node(self.name, text, pos, new_pos, children)
 
+    def _uncached_end(self, text, pos, cache, error, endpos):
+        new_pos = pos
+        count = 0
+        while True:
+            end = self.members[0].match_end_core(text, new_pos, cache, error,
+                                                 endpos)
+            if end is None:
+                break
+            count += 1
+            if end == new_pos:  # Don't loop infinitely.
+                break
+            new_pos = end
+        if count >= self.min:
+            return new_pos
+
+    def _child_spans(self, text, pos, end, cache):
+        member = self.members[0]
+        new_pos = pos
+        spans = []
+        while True:
+            child_end = cache.get((id(member), new_pos))
+            if child_end is None:
+                break
+            spans.append((member, new_pos, child_end))
+            if child_end == new_pos:
+                break
+            new_pos = child_end
+        return spans
+
     def _as_rhs(self):
         return u'%s+' % self._unicode_members()[0]
@@ -13,9 +13,11 @@ from six import (text_type, iterkeys, itervalues, iteritems,
 
 from parsimonious.exceptions import BadGrammar, UndefinedLabel
 from parsimonious.expressions import (Literal, Regex, Sequence, OneOf,
-    Lookahead, Optional, ZeroOrMore, OneOrMore, Not, TokenMatcher,
+    Lookahead, Optional, ZeroOrMore, OneOrMore, Not, Atomic, TokenMatcher,
     expression)
 from parsimonious.nodes import NodeVisitor
+from parsimonious.parallel import parse_many
+from parsimonious.tracing import profiled
 from parsimonious.utils import StrAndRepr, evaluate_string
 
 @python_2_unicode_compatible
@@ -70,6 +72,10 @@ class Grammar(StrAndRepr, Mapping):
         self._expressions, first = self._expressions_from_rules(rules, decorated_custom_rules)
         self.default_rule = first  # may be None
 
+        # What we were made from, for pickling:
+        self._rules = rules
+        self._custom_rules = more_rules
+
     def __getitem__(self, rule_name):
         return self._expressions[rule_name]
 
@@ -95,8 +101,22 @@ class Grammar(StrAndRepr, Mapping):
         """
         new = Grammar(**self._expressions)
         new.default_rule = self.default_rule
+        new._rules, new._custom_rules = self._rules, self._custom_rules
         return new
 
+    def __reduce__(self):
+        """Pickle by the rules I was made from rather than by my Expressions,
+        whose web of references is costly to pickle and can be deep enough to
+        overflow the stack.
+
+        Custom rules are pickled as they are, so custom-coded ones should be
+        module-level functions.
+
+        """
+        return _unpickle_grammar, (
+            self.__class__, self._rules, self._custom_rules,
+            self.default_rule and self.default_rule.name)
+
     def _expressions_from_rules(self, rules, custom_rules):
         """Return a 2-tuple: a dict of rule names pointing to their
         expressions, and then the first rule.
@@ -113,24 +133,80 @@ class Grammar(StrAndRepr, Mapping):
         tree = rule_grammar.parse(rules)
         return RuleVisitor(custom_rules).visit(tree)
 
-    def parse(self, text, pos=0):
+    def parse(self, text, pos=0, ends_only=False, profile=False,
+              endpos=None, line_index=None):
         """Parse some text with the :term:`default rule`.
 
+        ``text`` can be a string or, to parse bytes without decoding them,
+        bytes-like; see :meth:`Expression.match()`.
+
         :arg pos: The index at which to start parsing
+        :arg ends_only: Whether to cache only match end positions while
+            parsing; see :meth:`Expression.match()`
+        :arg profile: If true, return a tuple of the usual result and a
+            :class:`~parsimonious.tracing.Profile` of the parse. Pass a
+            ``Profile`` to accumulate into it rather than a new one.
+        :arg endpos: The index at which to stop parsing, as if the text ended
+            there; see :meth:`Expression.match()`
+        :arg line_index: A :class:`~parsimonious.utils.LineIndex` of the text
+            for errors to share; see :meth:`Expression.match()`
 
         """
         self._check_default_rule()
-        return self.default_rule.parse(text, pos=pos)
-
-    def match(self, text, pos=0):
+        if profile:
+            return profiled(profile, self.default_rule.parse, text, pos=pos,
+                            ends_only=ends_only, endpos=endpos,
+                            line_index=line_index)
+        return self.default_rule.parse(text, pos=pos, ends_only=ends_only,
+                                       endpos=endpos, line_index=line_index)
+
+    def match(self, text, pos=0, ends_only=False, profile=False,
+              endpos=None, line_index=None):
         """Parse some text with the :term:`default rule` but not necessarily
         all the way to the end.
 
         :arg pos: The index at which to start parsing
+        :arg ends_only: Whether to cache only match end positions while
+            parsing; see :meth:`Expression.match()`
+        :arg profile: If true, return a tuple of the usual result and a
+            :class:`~parsimonious.tracing.Profile` of the parse. Pass a
+            ``Profile`` to accumulate into it rather than a new one.
+        :arg endpos: The index at which to stop parsing, as if the text ended
+            there; see :meth:`Expression.match()`
+        :arg line_index: A :class:`~parsimonious.utils.LineIndex` of the text
+            for errors to share; see :meth:`Expression.match()`
+
+        """
+        self._check_default_rule()
+        if profile:
+            return profiled(profile, self.default_rule.match, text, pos=pos,
+                            ends_only=ends_only, endpos=endpos,
+                            line_index=line_index)
+        return self.default_rule.match(text, pos=pos, ends_only=ends_only,
+                                       endpos=endpos, line_index=line_index)
+
+    def iterparse(self, text, pos=0, endpos=None, line_index=None):
+        """Parse some text with the :term:`default rule`, yielding a stream of
+        ``(event, rule_name, start, end)`` tuples rather than a tree.
+
+        See :meth:`Expression.iterparse()`.
+
+        """
+        self._check_default_rule()
+        return self.default_rule.iterparse(text, pos=pos, endpos=endpos,
+                                           line_index=line_index)
+
+    def parse_many(self, texts, workers=None, chunksize=1, ends_only=False):
+        """Parse each of ``texts`` with the :term:`default rule`, in a pool of
+        ``workers`` processes, and return a list of the parse trees in the
+        same order.
+
+        See :func:`~parsimonious.parallel.parse_many()` for the arguments.
 
         """
         self._check_default_rule()
-        return self.default_rule.match(text, pos=pos)
+        return parse_many(self, texts, workers=workers, chunksize=chunksize,
+                          ends_only=ends_only)
 
     def _check_default_rule(self):
         """Raise RuntimeError if there is no default rule defined."""
@@ -153,6 +229,27 @@ class Grammar(StrAndRepr, Mapping):
         return "Grammar('%s')" % str(self).encode(codec)
 
 
+# Grammars unpickled so far, keyed by what they were made from, so a process
+# that receives the same grammar over and over builds it only once:
+_unpickled_grammars = {}
+
+
+def _unpickle_grammar(cls, rules, custom_rules, default_rule_name):
+    """Return a Grammar of class ``cls`` made from ``rules`` and
+    ``custom_rules``, with ``default_rule_name`` as its default rule."""
+    key = cls, rules, default_rule_name
+    grammar = None if custom_rules else _unpickled_grammars.get(key)
+    if grammar is None:
+        grammar = cls(rules, **custom_rules)
+        if default_rule_name is not None and (
+                grammar.default_rule is None or
+                grammar.default_rule.name != default_rule_name):
+            grammar = grammar.default(default_rule_name)
+        if not custom_rules:
+            _unpickled_grammars[key] = grammar
+    return grammar
+
+
 class TokenGrammar(Grammar):
     """A Grammar which takes a list of pre-lexed tokens instead of text
 
@@ -248,7 +345,8 @@ rule_syntax = (r'''
     sequence = term term+
     not_term = "!" term _
     lookahead_term = "&" term _
-    term = not_term / lookahead_term / quantified / atom
+    atomic_term = "@" term _
+    term = not_term / lookahead_term / atomic_term / quantified / atom
     quantified = atom quantifier
     atom = reference / literal / regex / parenthesized
     regex = "~" spaceless_literal ~"[ilmsux]*"i _
@@ -326,6 +424,10 @@ class RuleVisitor(NodeVisitor):
         exclamation, term, _ = not_term
         return Not(term)
 
+    def visit_atomic_term(self, node, atomic_term):
+        at, term, _ = atomic_term
+        return Atomic(term)
+
     def visit_rule(self, node, rule):
         """Assign a name to the Expression and return it."""
         label, equals, expression = rule
@@ -0,0 +1,458 @@
+"""Reparsing text as it's edited, reusing whatever of the last parse's packrat
+cache the edits didn't touch
+
+The cache of an ends-only parse (see ``Expression.match_end_core()``) says
+where each expression tried at each position stopped matching, or that it
+failed. That stays true after an edit as long as the edit is outside the
+stretch of text the expression examined on the way--and, if the edit is
+before that stretch, once the positions are shifted to match. So, alongside
+the cache, a :class:`Session` keeps how far each entry examined, which it
+learns by watching the parse through a :class:`~parsimonious.tracing.Tracer`.
+After an edit, only the entries that examined the edited text are forgotten,
+and reparsing redoes only them: the rules enclosing the edit, more or less.
+
+The entries are kept by position relative to a gap, which follows the edits
+around: those before it by their distance from the start of the text, the
+rest by their distance from the end, so an edit shifts the ones after it
+without touching them. The Nodes of the last tree are kept too, and a subtree
+no edit touched is copied to its new place rather than rebuilt from the
+cache.
+
+"""
+from heapq import heapify, heappop, heappush
+try:
+    from re import _parser as sre_parse  # Python 3.11 and later
+except ImportError:
+    import sre_parse
+from sys import maxsize
+
+from six import iteritems
+from six.moves import range
+
+from parsimonious.exceptions import IncompleteParseError
+from parsimonious.expressions import (Compound, Expression, Literal, MARKER,
+                                      NODE_CACHE, Regex, TokenMatcher)
+from parsimonious.nodes import Node, RegexNode
+from parsimonious.tracing import Tracer, _originals
+from parsimonious.utils import LineIndex
+
+
+# The untraced method the ends-only parses of sessions match with:
+_match_end_core = _originals[(Expression, 'match_end_core')]
+
+# Opcodes of regex items that match a single character:
+_CHARACTER_OPS = frozenset([sre_parse.LITERAL, sre_parse.NOT_LITERAL,
+                            sre_parse.IN, sre_parse.ANY, sre_parse.CATEGORY])
+_REPEAT_OPS = frozenset([sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+                         getattr(sre_parse, 'POSSESSIVE_REPEAT',
+                                 sre_parse.MAX_REPEAT)])
+
+# The failure widths of the regexes seen so far (see _failure_width()):
+_failure_widths = {}
+
+
+def _failure_width(regex):
+    """Return the offset, from where it starts, of the furthest character at
+    which the compiled ``regex`` can find it fails, or None if there's no
+    telling.
+
+    Only a sequence of single characters, classes, and the like, each perhaps
+    repeated, is understood, and then only if any unbounded repeat is past
+    the last place it can fail: ``[0-9]+`` can fail only at its first
+    character, ``#[^\\n]*`` at its first, and ``[a-z]{3,}`` by its third.
+    Others, like ``"[^"]*"``, can read arbitrarily far before failing.
+
+    """
+    try:
+        return _failure_widths[regex]
+    except KeyError:
+        pass
+    try:
+        items = list(sre_parse.parse(regex.pattern, regex.flags))
+    except Exception:  # Whatever this Python's sre_parse can't read
+        items = [(None, None)]
+    width, before = 0, 0  # The furthest failure, and the widest prefix
+    for op, av in items:
+        least = most = 1
+        if op in _REPEAT_OPS and len(av[2]) == 1:
+            least, most = av[0], av[1]
+            op, av = av[2][0]
+        if op not in _CHARACTER_OPS or (least and before is None):
+            width = None
+            break
+        if least:
+            width = before + least - 1
+        if before is not None:
+            before = None if most == sre_parse.MAXREPEAT else before + most
+    _failure_widths[regex] = width
+    return width
+
+
+class _ExtentTracer(Tracer):
+    """A tracer that answers the matches of a :class:`Session`'s parse that
+    the session kept from earlier ones, and records, for each entry the parse
+    makes in its cache, the index just past the last character it examined"""
+
+    def __init__(self, session):
+        self.session = session
+        self.regex_lookahead = session.regex_lookahead
+        # The extents of the entries made in this parse, including those the
+        # session won't keep:
+        self.extents = {}
+        # The furthest extent reached so far by each match we're inside:
+        self._stack = []
+
+    def trace_match(self, match, expr, text, pos, cache, error, endpos):
+        if match is not _match_end_core:
+            # Node-building matching within a custom rule, never kept anyway
+            return match(expr, text, pos, cache, error, endpos)
+        key = (id(expr), pos)
+        extent = self.extents.get(key)
+        if extent is not None:
+            result = match(expr, text, pos, cache, error, endpos)
+        else:
+            entry = self.session._entry(key)
+            if entry is not None:
+                length, reach = entry[0], entry[1]
+                result = None if length is None else pos + length
+                extent = pos + reach
+            else:
+                stack = self._stack
+                stack.append(pos)
+                try:
+                    result = match(expr, text, pos, cache, error, endpos)
+                finally:
+                    extent = stack.pop()
+                extent = self.extents[key] = max(
+                    extent, self._own_extent(expr, pos, result, endpos))
+                if extent != maxsize:
+                    self.session._keep(key, result, extent)
+        if self._stack and extent > self._stack[-1]:
+            self._stack[-1] = extent
+        return result
+
+    def _own_extent(self, expr, pos, result, endpos):
+        """Return how far ``expr`` itself, rather than its subexpressions,
+        examined to produce ``result`` at ``pos``."""
+        if isinstance(expr, Compound):
+            return pos
+        if isinstance(expr, TokenMatcher):
+            return pos + 1
+        if isinstance(expr, Literal):
+            return pos + len(expr.literal)
+        if isinstance(expr, Regex):
+            if result is None:
+                width = _failure_width(expr.re)
+                if width is None:
+                    # The re module won't say how far a failed regex got
+                    # before giving up, so it may have looked all the way to
+                    # the end, and at the end itself, which text inserted
+                    # there changes.
+                    return endpos + 1
+                return pos + width + self.regex_lookahead
+            # Assume a match stopped at the first character it didn't match.
+            return result + self.regex_lookahead
+        # There's no telling what a custom rule looked at.
+        return maxsize
+
+
+class _Ends(object):
+    """The ends of the matches a :class:`Session`'s parse made, and of those
+    it kept from earlier ones, read like an ends-only packrat cache"""
+
+    def __init__(self, session, cache):
+        self.session = session
+        self.cache = cache
+
+    def __getitem__(self, key):
+        end = self.cache.get(key, MARKER)
+        if end is MARKER:
+            entry = None if key is NODE_CACHE else self.session._entry(key)
+            if entry is None:
+                raise KeyError(key)
+            end = None if entry[0] is None else key[1] + entry[0]
+        return end
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def _moved(node, delta, text):
+    """Return a copy of ``node``, ``delta`` characters further along, in
+    ``text``, leaving the copying of its descendants till they're asked
+    for."""
+    start, end = node.start + delta, node.end + delta
+    if isinstance(node, RegexNode):
+        moved = RegexNode(node.expr_name, text, start, end, node.children)
+        try:
+            moved.match = node.match.re.match(text, start, len(text))
+        except TypeError:  # A Rope
+            moved.match, _ = text.match(node.match.re, start, len(text))
+        return moved
+    if isinstance(node, _MovedNode):
+        # Its children are still to be copied, so copy them from where it was
+        # copied from.
+        original, moved_by = Node.children.__get__(node)
+        return _MovedNode(original, moved_by + delta, text)
+    if not node.children:
+        return Node(node.expr_name, text, start, end)
+    return _MovedNode(node, delta, text)
+
+
+class _MovedNode(Node):
+    """A Node copied from another at a different position whose children
+    haven't been copied yet
+
+    Once its children are asked for, it copies them and becomes a plain
+    Node, which it otherwise can't be told from.
+
+    """
+    __slots__ = []
+
+    def __init__(self, original, delta, text):
+        # Node.__init__() would set my children, making me a plain Node.
+        self.expr_name = original.expr_name
+        self.full_text = text
+        self.start = original.start + delta
+        self.end = original.end + delta
+        Node.children.__set__(self, (original, delta))
+
+    @property
+    def children(self):
+        original, delta = Node.children.__get__(self)
+        children = [_moved(child, delta, self.full_text)
+                    for child in original.children]
+        self.children = children
+        return children
+
+    @children.setter
+    def children(self, children):
+        Node.children.__set__(self, children)
+        self.__class__ = Node
+
+    def prettily(self, error=None):
+        self.children  # Become a plain Node first.
+        return self.prettily(error)
+
+    def __repr__(self, top_level=True):
+        self.children
+        return self.__repr__(top_level)
+
+    def __reduce_ex__(self, protocol):
+        self.children
+        return self.__reduce_ex__(protocol)
+
+
+class Session(object):
+    """A text and a parse of it, kept up to date as the text is edited
+
+    ::
+
+        session = Session(grammar, text)
+        tree = session.parse()
+        session.edit(120, 3, 'new')  # Replace 3 characters at 120.
+        tree = session.parse()  # Cheaply
+
+    ``expression`` is the Expression to parse with, or a Grammar, meaning its
+    default rule.
+
+    An edit forgets each cached match that examined any of the edited text.
+    Its cost is about the number of matches it forgets, plus how far it is
+    from the edit before. How far a custom rule examined is unknown, so the
+    matches of custom rules, and of any rules that used them, are never kept
+    from one parse to the next. How far a regex examined is unknown too. A
+    regex that failed is taken to have examined everything to the end of the
+    text, since one like ``"[^"]*"`` can get arbitrarily far before failing,
+    unless it's made of character classes and the like that show it can't,
+    like ``[0-9]+``, which fails at its first character. A regex that
+    stopped, matching or failing, is taken to have examined
+    ``regex_lookahead`` characters past where it stopped. That's right for
+    the usual token regexes, which stop at the first character they can't
+    match, such as ``[a-z]+`` or ``[^"]*``, but a regex with a lookahead
+    assertion may be misjudged, leaving a stale match. Raise
+    ``regex_lookahead`` to be safe with such regexes. Lookbehind assertions
+    aren't supported at all.
+
+    """
+    regex_lookahead = 1
+
+    def __init__(self, expression, text=''):
+        self.expression = getattr(expression, 'default_rule', expression)
+        self.text = text
+        # Shared by the errors reported against the current text:
+        self.line_index = LineIndex(text)
+        # The kept matches, as {position: {expression id: entry}}, where an
+        # entry is a list of the length of the match (or None if it failed),
+        # how far past its position it examined, and the Node last built
+        # from it, if any. Those before the gap are found by position, and
+        # those at or after it by their distance from the end of the text.
+        self._before = {}
+        self._after = {}
+        self._gap = 0
+        # A heap of (-extent, position, expression id) of the matches before
+        # the gap, so those reaching furthest can be found, and how many of
+        # them have since moved past the gap or been forgotten:
+        self._reaching = []
+        self._stale = 0
+
+    @property
+    def cache(self):
+        """The ends of the kept matches, or None for those that failed, as
+        ``{(id(expression), position): end}``
+
+        This is made anew each time it's asked for, for looking at.
+
+        """
+        cache = {}
+        length = len(self.text)
+        for kept, to_pos in [(self._before, lambda key: key),
+                             (self._after, lambda key: length - key)]:
+            for key, entries in iteritems(kept):
+                pos = to_pos(key)
+                for expr_id, entry in iteritems(entries):
+                    cache[(expr_id, pos)] = (None if entry[0] is None else
+                                             pos + entry[0])
+        return cache
+
+    def parse(self):
+        """Return a parse tree of the text, as ``Expression.parse()`` would,
+        reusing all the cached matches the edits since the last parse left
+        standing.
+
+        The Nodes of the tree are new, but a subtree of the last one that no
+        edit touched is copied to its new position rather than rebuilt, and
+        its descendants are copied only as they're asked for. Till then, it
+        holds onto the old tree.
+
+        """
+        expression, text = self.expression, self.text
+        endpos = len(text)
+        cache = {}
+        with _ExtentTracer(self):
+            end = expression.match_end_core(text, 0, cache, None, endpos)
+        if end is None:
+            raise expression._match_error(text, 0, True, endpos,
+                                          self.line_index)
+        if end < endpos:
+            raise IncompleteParseError(text, end, expression, self.line_index)
+        return self._build(expression, 0, end, _Ends(self, cache))
+
+    def _build(self, expr, pos, end, ends):
+        """Return the Node ``expr`` matched from ``pos`` to ``end``, copying
+        the one built last time if its match was kept."""
+        text = self.text
+        entry = self._entry((id(expr), pos))
+        if entry is not None and entry[2] is not None:
+            node = entry[2]
+            if node.start != pos or node.full_text is not text:
+                node = entry[2] = _moved(node, pos - node.start, text)
+            return node
+        spans = expr._child_spans(text, pos, end, ends)
+        if spans:
+            node = Node(expr.name, text, pos, end,
+                        [self._build(member, start, child_end, ends)
+                         for member, start, child_end in spans])
+        else:
+            node = expr._reconstruct(text, pos, end, ends, len(text))
+        if entry is not None:
+            entry[2] = node
+        return node
+
+    def _entry(self, key):
+        """Return the kept entry for ``key``, an ``(expression id,
+        position)`` pair, or None."""
+        expr_id, pos = key
+        if pos < self._gap:
+            entries = self._before.get(pos)
+        else:
+            entries = self._after.get(len(self.text) - pos)
+        return None if entries is None else entries.get(expr_id)
+
+    def _keep(self, key, end, extent):
+        """Keep the match ``key`` made, ending at ``end`` and having examined
+        up to ``extent``."""
+        expr_id, pos = key
+        entry = [None if end is None else end - pos, extent - pos, None]
+        if pos < self._gap:
+            self._before.setdefault(pos, {})[expr_id] = entry
+            heappush(self._reaching, (-extent, pos, expr_id))
+        else:
+            self._after.setdefault(len(self.text) - pos, {})[expr_id] = entry
+
+    def edit(self, offset, removed, inserted):
+        """Replace the ``removed`` characters at ``offset`` with ``inserted``,
+        and forget the cached matches that examined any of them."""
+        stop = offset + removed
+        self._move_gap(offset)
+        # The matches at the removed characters:
+        after, length = self._after, len(self.text)
+        for pos in range(offset, stop):
+            after.pop(length - pos, None)
+        # And those before that examined them. The ones after needn't move,
+        # being kept by their distance from the end.
+        before, reaching = self._before, self._reaching
+        while reaching and -reaching[0][0] > offset:
+            extent, pos, expr_id = heappop(reaching)
+            entries = before.get(pos)
+            entry = None if entries is None else entries.get(expr_id)
+            if entry is None or pos + entry[1] != -extent:
+                self._stale -= 1  # Moved or forgotten already
+            else:
+                del entries[expr_id]
+                if not entries:
+                    del before[pos]
+        self.text = self.text[:offset] + inserted + self.text[stop:]
+        self.line_index = LineIndex(self.text)
+
+    def _move_gap(self, gap):
+        """Move the gap to ``gap``, moving the kept matches between it and
+        where it was from one side of it to the other."""
+        before, after, reaching = self._before, self._after, self._reaching
+        length = len(self.text)
+        for pos in range(gap, self._gap):
+            entries = before.pop(pos, None)
+            if entries is not None:
+                after[length - pos] = entries
+                self._stale += len(entries)
+        for pos in range(self._gap, gap):
+            entries = after.pop(length - pos, None)
+            if entries is not None:
+                before[pos] = entries
+                for expr_id, entry in iteritems(entries):
+                    heappush(reaching, (-(pos + entry[1]), pos, expr_id))
+        self._gap = gap
+        if self._stale > len(reaching) // 2:
+            # Sweep out the moved and forgotten ones.
+            reaching[:] = [(-(pos + entry[1]), pos, expr_id)
+                           for pos, entries in iteritems(before)
+                           for expr_id, entry in iteritems(entries)]
+            heapify(reaching)
+            self._stale = 0
+
+    def update(self, text):
+        """Replace the text with ``text``, as one edit of the stretch from the
+        first difference to the last."""
+        old = self.text
+        limit = min(len(old), len(text))
+        prefix = _common_length(old, text, limit)
+        suffix = _common_length(old, text, limit - prefix, from_end=True)
+        self.edit(prefix, len(old) - prefix - suffix,
+                  text[prefix:len(text) - suffix])
+
+
+def _common_length(a, b, limit, from_end=False):
+    """Return the length, up to ``limit``, of the longest common prefix--or,
+    if ``from_end``, suffix--of ``a`` and ``b``, found by binary search so
+    the comparing is done a slice at a time."""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if (a[len(a) - middle:] == b[len(b) - middle:] if from_end else
+                a[:middle] == b[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+    return low
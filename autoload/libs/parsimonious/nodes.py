@@ -13,7 +13,7 @@ from six import reraise, python_2_unicode_compatible, with_metaclass, \
     iteritems
 
 from parsimonious.exceptions import VisitationError, UndefinedLabel
-from parsimonious.utils import StrAndRepr
+from parsimonious.utils import StrAndRepr, excerpt
 
 
 @python_2_unicode_compatible
@@ -78,7 +78,7 @@ class Node(StrAndRepr):
         ret = [u'<%s%s matching "%s">%s' % (
             self.__class__.__name__,
             (' called "%s"' % self.expr_name) if self.expr_name else '',
-            self.text,
+            excerpt(self.full_text, self.start, self.end),
             '  <-- *** We were here. ***' if error is self else '')]
         for n in self:
             ret.append(indent(n.prettily(error=error)))
@@ -126,6 +126,25 @@ class RegexNode(Node):
     """
     __slots__ = ['match']
 
+    def __reduce__(self):
+        # Match objects don't pickle, but matching again makes an equal one.
+        match = getattr(self, 'match', None)
+        return _unpickle_regex_node, (
+            self.__class__, self.expr_name, self.full_text, self.start,
+            self.end, self.children,
+            match and (match.re, match.string, match.pos, match.endpos))
+
+
+def _unpickle_regex_node(cls, expr_name, full_text, start, end, children,
+                         match_args):
+    """Return a RegexNode, its match made again from the regex, string, and
+    bounds in ``match_args``, if any."""
+    node = cls(expr_name, full_text, start, end, children)
+    if match_args:
+        regex, string, pos, endpos = match_args
+        node.match = regex.match(string, pos, endpos)
+    return node
+
 
 class RuleDecoratorMeta(type):
     def __new__(metaclass, name, bases, namespace):
@@ -186,9 +205,23 @@ class NodeVisitor(with_metaclass(RuleDecoratorMeta, object)):
     #: wrapped in a VisitationError when they arise.
     unwrapped_exceptions = ()
 
-    # TODO: If we need to optimize this, we can go back to putting subclasses
-    # in charge of visiting children; they know when not to bother. Or we can
-    # mark nodes as not descent-worthy in the grammar.
+    #: Names of rules whose nodes aren't worth descending into. Rather than
+    #: being visited, a node made by one of these is handed as-is to the
+    #: visitor method of its parent: whitespace, say, or a token whose
+    #: ``text`` is all you need.
+    opaque_rules = frozenset()
+
+    #: Whether to visit each distinct Node only once per top-level
+    #: :meth:`visit()` call. The packrat cache can put the same Node object at
+    #: several places in a tree; with this on, its visited result is reused
+    #: at all of them rather than worked out afresh. That's safe only if
+    #: your visitor methods' results are never mutated after the fact.
+    memoize_visits = False
+
+    # The {id(node): (node, result)} memo of the current top-level visit(),
+    # when memoizing:
+    _visit_memo = None
+
     def visit(self, node):
         """Walk a parse tree, transforming it into another representation.
 
@@ -202,13 +235,34 @@ class NodeVisitor(with_metaclass(RuleDecoratorMeta, object)):
         responsibility to subclass :class:`NodeVisitor` and implement those
         methods.
 
+        Nodes of the rules in :attr:`opaque_rules` aren't descended into;
+        they come back unchanged. See also :attr:`memoize_visits`.
+
         """
+        opaque_rules = self.opaque_rules
+        if node.expr_name in opaque_rules:
+            return node
+
+        memo = self._visit_memo
+        if memo is not None:
+            seen = memo.get(id(node))
+            if seen is not None:
+                return seen[1]
+        elif self.memoize_visits:
+            # We're the top-level call. Keep the memo only as long as we run.
+            self._visit_memo = {}
+            try:
+                return self.visit(node)
+            finally:
+                self._visit_memo = None
+
         method = getattr(self, 'visit_' + node.expr_name, self.generic_visit)
 
         # Call that method, and show where in the tree it failed if it blows
         # up.
         try:
-            return method(node, [self.visit(n) for n in node])
+            result = method(node, [n if n.expr_name in opaque_rules
+                                   else self.visit(n) for n in node])
         except (VisitationError, UndefinedLabel):
             # Don't catch and re-wrap already-wrapped exceptions.
             raise
@@ -220,6 +274,11 @@ class NodeVisitor(with_metaclass(RuleDecoratorMeta, object)):
             exc_class, exc, tb = exc_info()
             reraise(VisitationError, VisitationError(exc, exc_class, node), tb)
 
+        if memo is not None:
+            # Holding the node, too, keeps its id from being reused.
+            memo[id(node)] = node, result
+        return result
+
     def generic_visit(self, node, visited_children):
         """Default visitor method
 
@@ -237,16 +296,19 @@ class NodeVisitor(with_metaclass(RuleDecoratorMeta, object)):
 
     # Convenience methods:
 
-    def parse(self, text, pos=0):
+    def parse(self, text, pos=0, ends_only=False, profile=False,
+              endpos=None, line_index=None):
         """Parse some text with this Visitor's default grammar.
 
         ``SomeVisitor().parse('some_string')`` is a shortcut for
         ``SomeVisitor().visit(some_grammar.parse('some_string'))``.
 
         """
-        return self._parse_or_match(text, pos, 'parse')
+        return self._parse_or_match(text, pos, 'parse', ends_only, profile,
+                                    endpos, line_index)
 
-    def match(self, text, pos=0):
+    def match(self, text, pos=0, ends_only=False, profile=False,
+              endpos=None, line_index=None):
         """Parse some text with this Visitor's default grammar, but don't
         insist on parsing all the way to the end.
 
@@ -254,7 +316,21 @@ class NodeVisitor(with_metaclass(RuleDecoratorMeta, object)):
         ``SomeVisitor().visit(some_grammar.match('some_string'))``.
 
         """
-        return self._parse_or_match(text, pos, 'match')
+        return self._parse_or_match(text, pos, 'match', ends_only, profile,
+                                    endpos, line_index)
+
+    def parse_many(self, texts, workers=None, chunksize=1, ends_only=False):
+        """Parse and visit each of ``texts``, in a pool of ``workers``
+        processes, and return a list of the results in the same order.
+
+        Each worker gets its own copy of this Visitor, so this suits visitors
+        that keep no state across visits. See
+        :func:`~parsimonious.parallel.parse_many()` for the arguments.
+
+        """
+        from parsimonious.parallel import parse_many  # circular import dodge
+        return parse_many(self, texts, workers=workers, chunksize=chunksize,
+                          ends_only=ends_only)
 
     # Internal convenience methods to help you write your own visitors:
 
@@ -265,10 +341,15 @@ class NodeVisitor(with_metaclass(RuleDecoratorMeta, object)):
 
     # Private methods:
 
-    def _parse_or_match(self, text, pos, method_name):
+    def _parse_or_match(self, text, pos, method_name, ends_only=False,
+                        profile=False, endpos=None, line_index=None):
         """Execute a parse or match on the default grammar, followed by a
         visitation.
 
+        If ``profile`` is true, return a tuple of the visitation's result and
+        a :class:`~parsimonious.tracing.Profile` covering both the parse and
+        the visitation.
+
         Raise RuntimeError if there is no default grammar specified.
 
         """
@@ -279,7 +360,14 @@ class NodeVisitor(with_metaclass(RuleDecoratorMeta, object)):
                 "`grammar` attribute, and try again.".format(
                     cls=self.__class__.__name__,
                     method=method_name))
-        return self.visit(getattr(self.grammar, method_name)(text, pos=pos))
+        if profile:
+            from parsimonious.tracing import profiled  # circular import dodge
+            return profiled(profile, self._parse_or_match, text, pos,
+                            method_name, ends_only, endpos=endpos,
+                            line_index=line_index)
+        return self.visit(getattr(self.grammar, method_name)(
+            text, pos=pos, ends_only=ends_only, endpos=endpos,
+            line_index=line_index))
 
 
 def rule(rule_string):
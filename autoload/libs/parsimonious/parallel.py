@@ -0,0 +1,55 @@
+"""Parsing many texts at once, across a pool of processes
+
+The Grammar or NodeVisitor doing the parsing is sent to each worker process
+once, when the pool starts, and stays there for all the texts that worker
+gets. Grammars pickle by rule source (see ``Grammar.__reduce__()``), so that
+costs little.
+
+"""
+from multiprocessing import Pool
+
+
+# The Grammar or NodeVisitor of the worker process we're in, if any:
+_parser = None
+
+
+def _install(parser):
+    """Make ``parser`` the one this worker process parses with."""
+    global _parser
+    _parser = parser
+
+
+def _parse(args):
+    """Parse a text in a worker process, returning the result."""
+    text, ends_only = args
+    return _parser.parse(text, ends_only=ends_only)
+
+
+def parse_many(parser, texts, workers=None, chunksize=1, ends_only=False):
+    """Return a list of ``parser.parse(text)`` for each of ``texts``, in the
+    same order, doing the parsing in a pool of worker processes.
+
+    :arg parser: A Grammar, which gives back parse trees, or a NodeVisitor,
+        which gives back whatever it makes of them. Either must be picklable,
+        as must what it gives back.
+    :arg workers: How many worker processes to start. None means one per CPU.
+        0 means to do all the parsing in this process, without a pool.
+    :arg chunksize: How many texts to hand a worker at a time. Raise this
+        when there are lots of short texts, to spend less time passing
+        messages.
+    :arg ends_only: Whether to parse in ends-only mode; see
+        ``Expression.match()``
+
+    A ParseError, or any other exception, raised while parsing any of the
+    texts is raised again here.
+
+    """
+    if workers == 0:
+        return [parser.parse(text, ends_only=ends_only) for text in texts]
+    pool = Pool(workers, _install, (parser,))
+    try:
+        return pool.map(_parse, [(text, ends_only) for text in texts],
+                        chunksize)
+    finally:
+        pool.terminate()
+        pool.join()
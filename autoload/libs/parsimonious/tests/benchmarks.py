@@ -1,56 +1,79 @@
 """Benchmarks for Parsimonious
 
-Run these with ``nosetests parsimonious/tests/bench.py``. They don't run during
-normal test runs because they're not tests--they don't assert anything. Also,
-they're a bit slow.
+Run these from the directory containing the ``parsimonious`` package::
+
+    python -m parsimonious.tests.benchmarks --output results.json
+
+They don't run during normal test runs because they're not tests--they don't
+assert anything. Also, they're a bit slow.
 
 These differ from the ones in test_benchmarks in that these are meant to be
 compared from revision to revision of Parsimonious to make sure we're not
 getting slower. test_benchmarks simply makes sure our choices among
-implementation alternatives remain valid.
+implementation alternatives remain valid. To compare, save the results of one
+run and pass them to a later one::
+
+    python -m parsimonious.tests.benchmarks --baseline results.json
+
+Any measurement more than ``--tolerance`` worse than its baseline is reported,
+and the exit status is then nonzero. Times under ``--floor`` are too short to
+take reliably and are never reported.
+
+``baseline.json``, beside this file, is a baseline to start from. Memory and
+memo counts carry from machine to machine, but times don't, so before
+comparing times, make a baseline of your own from a clean checkout with
+``--output``.
+
+The saving and comparing of results is shared with the plugin's end-to-end
+benchmarks, in ``autoload/benchmarks.py``.
 
 """
-# These aren't really tests, as they don't assert anything, but I found myself
-# rewriting nose's discovery and selection bits, so why not just use nose?
+from __future__ import print_function
 
+from argparse import ArgumentParser
 import gc
-from timeit import repeat
+import json
+import platform
+import sys
+from timeit import default_timer, repeat
+
+from parsimonious.grammar import Grammar, rule_syntax
+from parsimonious.incremental import Session
+
+
+def brace_grammar():
+    """Return the grammar the brace reshaper uses.
+
+    It lives beside this package, in the plugin's ``libs`` directory.
+
+    """
+    from grammar import g
+    return g
 
-from parsimonious.grammar import Grammar
 
+def brace_text(size, depth):
+    """Return a bracketed literal of ``size`` elements per level, nested
+    ``depth`` levels deep."""
+    elements = ["'key': value", 'fn(arg, kw=1.5)', '"string"', 'symbol.attr']
+    text = '[]'
+    for level in range(depth):
+        items = [elements[i % len(elements)] for i in range(size - 1)]
+        items.append(text)
+        text = '{%s}' % ', '.join(items) if level % 2 else (
+            '(%s)' % ', '.join(items))
+    return text
 
-def test_not_really_json_parsing():
-    """As a baseline for speed, parse some JSON.
+
+def json_grammar():
+    """Return a naive, unoptimized, incorrect JSON grammar.
 
     I have no reason to believe that JSON is a particularly representative or
-    revealing grammar to test with. Also, this is a naive, unoptimized,
-    incorrect grammar, so don't use it as a basis for comparison with other
-    parsers. It's just meant to compare across versions of Parsimonious.
+    revealing grammar to test with. Also, don't use this as a basis for
+    comparison with other parsers. It's just meant to compare across versions
+    of Parsimonious.
 
     """
-    father = """{
-        "id" : 1,
-        "married" : true,
-        "name" : "Larry Lopez",
-        "sons" : null,
-        "daughters" : [
-          {
-            "age" : 26,
-            "name" : "Sandra"
-            },
-          {
-            "age" : 25,
-            "name" : "Margaret"
-            },
-          {
-            "age" : 6,
-            "name" : "Mary"
-            }
-          ]
-        }"""
-    more_fathers = ','.join([father] * 60)
-    json = '{"fathers" : [' + more_fathers + ']}'
-    grammar = Grammar(r"""
+    return Grammar(r"""
         value = space (string / number / object / array / true_false_null)
                 space
 
@@ -75,19 +98,295 @@ def test_not_really_json_parsing():
         space = ~"\s*"
         """)
 
-    # These number and repetition values seem to keep results within 5% of the
-    # difference between min and max. We get more consistent results running a
-    # bunch of single-parse tests and taking the min rather than upping the
-    # NUMBER and trying to stomp out the outliers with averaging.
-    NUMBER = 1
-    REPEAT = 5
-    total_seconds = min(repeat(lambda: grammar.parse(json),
-                               lambda: gc.enable(),  # so we take into account how we treat the GC
-                               repeat=REPEAT,
-                               number=NUMBER))
-    seconds_each = total_seconds / NUMBER
-
-    kb = len(json) / 1024.0
-    print 'Took %.3fs to parse %.1fKB: %.0fKB/s.' % (seconds_each,
-                                                     kb,
-                                                     kb / seconds_each)
+
+def json_text(size, depth):
+    """Return a JSON document of ``size`` fathers, each of whose daughters
+    are nested ``depth`` levels deep."""
+    daughters = '[]'
+    for level in range(depth):
+        daughters = """[
+          {
+            "age" : 26,
+            "name" : "Sandra",
+            "daughters" : %s
+            },
+          {
+            "age" : 25.5e1,
+            "name" : "Margaret"
+            }
+          ]""" % daughters
+    father = """{
+        "id" : 1,
+        "married" : true,
+        "name" : "Larry Lopez",
+        "sons" : null,
+        "daughters" : %s
+        }""" % daughters
+    return '{"fathers" : [' + ','.join([father] * size) + ']}'
+
+
+def rule_grammar():
+    """Return a grammar for the rule syntax itself.
+
+    This is a fresh one rather than ``parsimonious.grammar.rule_grammar`` so
+    that nothing cached on that one skews the measurements.
+
+    """
+    return Grammar(rule_syntax)
+
+
+def rule_text(size, depth):
+    """Return a grammar definition of ``size`` rules, each with
+    parenthesized alternatives nested ``depth`` levels deep."""
+    rhs = '"x"'
+    for level in range(depth):
+        rhs = '((%s "a"*) / (~"[b-z]+"i &"c") / (!"d" label_%s))' % (rhs,
+                                                                     level)
+    return '\n'.join('rule_%s = other_%s %s  # comment' % (i, i, rhs)
+                     for i in range(size))
+
+
+#: (name, grammar factory, text factory, [(size, depth), ...])
+BENCHMARKS = [
+    ('brace', brace_grammar, brace_text,
+     [(10, 1), (100, 1), (400, 1), (5, 10), (3, 40)]),
+    ('json', json_grammar, json_text,
+     [(1, 1), (20, 1), (60, 1), (5, 5), (2, 10)]),
+    ('rules', rule_grammar, rule_text,
+     [(10, 1), (100, 1), (300, 1), (10, 3), (3, 5)]),
+]
+
+MODES = [('nodes', False), ('ends', True)]
+
+# Besides which, each text is reparsed by a Session after a small edit.
+
+# Measurements of which higher numbers are worse, compared to baselines:
+COMPARED = ['seconds', 'peak_kb', 'memo_entries']
+
+# The time, in seconds, below which timings are too noisy to compare:
+FLOOR = 0.001
+
+
+def memo_entries(expr, text, ends_only):
+    """Return how many entries parsing ``text`` leaves in the packrat
+    cache."""
+    cache = {}
+    if ends_only:
+        expr.match_end_core(text, 0, cache, None)
+    else:
+        expr.match_core(text, 0, cache, None)
+    return len(cache)
+
+
+def peak_kb(expr, text, ends_only):
+    """Return the most memory, in KB, allocated at once while parsing
+    ``text``."""
+    # Imported here, so the rest of the harness can be shared with Pythons
+    # that lack it:
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    try:
+        expr.parse(text, ends_only=ends_only)
+        return tracemalloc.get_traced_memory()[1] / 1024.0
+    finally:
+        tracemalloc.stop()
+
+
+def seconds(expr, text, ends_only, repetitions):
+    """Return the best time of several parses of ``text``.
+
+    We get more consistent results running a bunch of single-parse tests and
+    taking the min rather than parsing many times per test and trying to stomp
+    out the outliers with averaging.
+
+    """
+    return min(repeat(lambda: expr.parse(text, ends_only=ends_only),
+                      lambda: gc.enable(),  # so we take into account how we treat the GC
+                      repeat=repetitions,
+                      number=1))
+
+
+def reparse_seconds(expr, text, repetitions):
+    """Return the best time of several reparses of ``text`` by a
+    :class:`~parsimonious.incremental.Session`, each after inserting a space
+    near the middle, which the last one took out again."""
+    session = Session(expr, text)
+    session.parse()
+    middle = text.index(' ', len(text) // 2)
+    times = []
+    for _ in range(repetitions):
+        start = default_timer()
+        session.edit(middle, 0, ' ')
+        session.parse()
+        times.append(default_timer() - start)
+        session.edit(middle, 1, '')
+        session.parse()
+    return min(times)
+
+
+def run(names=None, repetitions=5):
+    """Run the benchmarks, and return a list of result dicts."""
+    results = []
+    for name, make_grammar, make_text, params in BENCHMARKS:
+        if names and name not in names:
+            continue
+        expr = make_grammar().default_rule
+        for size, depth in params:
+            text = make_text(size, depth)
+            for mode, ends_only in MODES:
+                time = seconds(expr, text, ends_only, repetitions)
+                result = {
+                    'grammar': name,
+                    'size': size,
+                    'depth': depth,
+                    'mode': mode,
+                    'chars': len(text),
+                    'seconds': time,
+                    'kb_per_second': len(text) / 1024.0 / time,
+                    'peak_kb': peak_kb(expr, text, ends_only),
+                    'memo_entries': memo_entries(expr, text, ends_only)}
+                print('%(grammar)5s size=%(size)-4s depth=%(depth)-3s '
+                      '%(mode)-7s %(seconds).4fs %(kb_per_second)8.1fKB/s '
+                      'peak %(peak_kb)9.1fKB memo %(memo_entries)8s' % result)
+                results.append(result)
+            time = reparse_seconds(expr, text, repetitions)
+            result = {
+                'grammar': name,
+                'size': size,
+                'depth': depth,
+                'mode': 'reparse',
+                'chars': len(text),
+                'seconds': time,
+                'kb_per_second': len(text) / 1024.0 / time}
+            print('%(grammar)5s size=%(size)-4s depth=%(depth)-3s '
+                  '%(mode)-7s %(seconds).4fs %(kb_per_second)8.1fKB/s' %
+                  result)
+            results.append(result)
+    return results
+
+
+def key(result):
+    """Return a description of which measurement ``result`` is, by which
+    it's matched with its baseline."""
+    return '%(grammar)s size=%(size)s depth=%(depth)s %(mode)s' % result
+
+
+def measurements(result):
+    """Return the measurements of ``result`` to compare with its
+    baseline."""
+    return dict((name, result[name]) for name in COMPARED if name in result)
+
+
+def regressions(results, baseline, tolerance, key=key,
+                measurements=measurements, floor=FLOOR,
+                timed=lambda name: name == 'seconds'):
+    """Return a description of each measurement more than ``tolerance`` (a
+    fraction) worse than the corresponding one in ``baseline``.
+
+    :arg key: A function returning a description of a result, by which it's
+        matched with its baseline
+    :arg measurements: A function returning a dict of a result's
+        measurements, of which higher numbers are worse
+    :arg floor: The time, in seconds, below which a time is skipped, being
+        too short for a ratio of it to mean anything
+    :arg timed: A function returning whether the measurement of a given
+        name is a time
+
+    """
+    old_results = dict((key(result), result) for result in baseline)
+    worse = []
+    for result in results:
+        old = old_results.get(key(result))
+        if old is None:
+            continue
+        old_measurements = measurements(old)
+        for name, value in sorted(measurements(result).items()):
+            if timed(name) and value < floor:
+                continue
+            old_value = old_measurements.get(name)
+            if old_value is not None and value > old_value * (1 + tolerance):
+                worse.append('%s: %s went from %s to %s' %
+                             (key(result), name, old_value, value))
+    return worse
+
+
+def slow_reparses(results):
+    """Return a description of each reparse in ``results`` no faster than
+    parsing the same text afresh."""
+    fresh = dict((key(dict(result, mode='reparse')), result['seconds'])
+                 for result in results if result['mode'] == 'nodes')
+    return ['%s took %s, more than the %s of a fresh parse' %
+            (key(result), result['seconds'], fresh[key(result)])
+            for result in results
+            if result['mode'] == 'reparse' and
+            result['seconds'] >= fresh[key(result)]]
+
+
+def argument_parser(description, names, repetitions):
+    """Return an ArgumentParser for a benchmark suite, taking the names of
+    the benchmarks to run and the usual options for saving and comparing
+    results.
+
+    :arg names: The names of all the suite's benchmarks
+    :arg repetitions: The default number of times to run each one
+
+    """
+    parser = ArgumentParser(description=description)
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='Benchmarks to run (default: all of %s)' %
+                             ', '.join(names))
+    parser.add_argument('--output', help='Write the results to this JSON '
+                                         'file.')
+    parser.add_argument('--baseline', help='Compare against the results in '
+                                           'this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fraction by which a measurement may exceed its '
+                             'baseline before we complain (default: 0.2)')
+    parser.add_argument('--floor', type=float, default=FLOOR,
+                        help='Time, in seconds, below which a time is too '
+                             'short to compare (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=repetitions,
+                        help='Runs to time, taking the fastest '
+                             '(default: %s)' % repetitions)
+    return parser
+
+
+def report(results, args, regressions=regressions):
+    """Save ``results`` to ``args.output`` and compare them with
+    ``args.baseline``, as either was asked for, and return the exit status:
+    nonzero if anything regressed."""
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'python': platform.python_version(),
+                       'results': results},
+                      file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            worse = regressions(results, json.load(file)['results'],
+                                args.tolerance, floor=args.floor)
+        for line in worse:
+            print('REGRESSION: ' + line)
+        return 1 if worse else 0
+    return 0
+
+
+def main(argv=None):
+    parser = argument_parser('Benchmark Parsimonious.',
+                             [b[0] for b in BENCHMARKS], 5)
+    args = parser.parse_args(argv)
+
+    # Deep nesting makes for deep recursion:
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+    results = run(args.names, args.repeat)
+    status = report(results, args)
+    slow = slow_reparses(results)
+    for line in slow:
+        print('REGRESSION: ' + line)
+    return 1 if slow else status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,7 @@
 still valid"""
 
 from functools import partial
-from timeit import timeit
+from timeit import repeat, timeit
 
 from nose.tools import ok_
 
@@ -44,3 +44,30 @@ def test_startswith_vs_regex():
     # Regexes take 2.24x as long as simple string matching.
     ok_(startswith_time < re_time,
         '%s (startswith) < %s (re)' % (startswith_time, re_time))
+
+
+def test_reparse_vs_parse():
+    """Does reparsing after a small edit beat parsing afresh?"""
+    from parsimonious.incremental import Session
+    from parsimonious.tests.benchmarks import json_grammar, json_text
+
+    grammar = json_grammar()
+    text = json_text(40, 1)
+    middle = text.index(',', len(text) // 2) + 1
+
+    def reparse(session):
+        session.edit(middle, 0, ' ')
+        session.parse()
+        session.edit(middle, 1, '')
+        session.parse()
+
+    session = Session(grammar, text)
+    session.parse()
+    parse_time = min(repeat(lambda: grammar.parse(text), number=2, repeat=5))
+    reparse_time = min(repeat(partial(reparse, session), number=1, repeat=5))
+
+    # Reparsing redoes only the matches that examined the edit--those of the
+    # array and object around it, more or less--so it takes a small fraction
+    # of the time.
+    ok_(reparse_time < parse_time,
+        '%s (reparse) < %s (parse)' % (reparse_time, parse_time))
@@ -1,4 +1,7 @@
 #coding=utf-8
+from mmap import mmap, ACCESS_READ
+from tempfile import TemporaryFile
+from timeit import timeit
 from unittest import TestCase
 
 from nose.tools import eq_, ok_, assert_raises
@@ -6,9 +9,10 @@ from six import text_type
 
 from parsimonious.exceptions import ParseError, IncompleteParseError
 from parsimonious.expressions import (Literal, Regex, Sequence, OneOf, Not,
-    Optional, ZeroOrMore, OneOrMore, Expression)
+    Lookahead, Optional, ZeroOrMore, OneOrMore, Expression)
 from parsimonious.grammar import Grammar, rule_grammar
 from parsimonious.nodes import Node
+from parsimonious.utils import LineIndex, Rope
 
 
 def len_eq(node, length):
@@ -147,6 +151,306 @@ class ParseTests(TestCase):
                                    Node('lit', text, 1, 2)]))
 
 
+class EndsOnlyTests(TestCase):
+    """Tests for matching with a cache of end positions rather than Nodes"""
+
+    def test_same_trees(self):
+        """Make sure rebuilding Nodes from end positions gives the same trees
+        as caching whole Nodes does."""
+        grammar = Grammar(r"""
+            list = "(" item* ")" ("!" / "?")?
+            item = (pair / word / list) ws
+            pair = word ":" word
+            word = ~"[a-z]+"
+            ws = ~r"\s*"
+            """)
+        for text in ['()', '(a b:c (d) ())?', '(a:b ((c)))!', '(ab cd']:
+            try:
+                expected = grammar.match(text)
+            except ParseError:
+                assert_raises(ParseError, grammar.match, text, ends_only=True)
+            else:
+                eq_(grammar.match(text, ends_only=True), expected)
+
+    def test_quantifiers_and_lookaheads(self):
+        """Exercise the rebuilding of each kind of Expression."""
+        text = 'aab'
+        for expr in [Optional(Literal('a', name='lit'), name='opt'),
+                     ZeroOrMore(Literal('a', name='lit'), name='zero'),
+                     OneOrMore(Literal('a', name='lit'), name='one'),
+                     OneOrMore(Regex('^'), name='one'),
+                     Sequence(Not(Literal('b')), Lookahead(Literal('a')),
+                              Regex('a+(b)'), name='seq')]:
+            eq_(expr.match(text, ends_only=True), expr.match(text))
+
+    def test_regex_match_objects(self):
+        """Make sure rebuilt ``RegexNode``s still carry their match
+        objects."""
+        node = Regex('a+(b)').match('aab', ends_only=True)
+        eq_(node.match.group(1), 'b')
+
+    def test_no_nodes_cached(self):
+        """Make sure the cache holds only end positions (or None)."""
+        grammar = Grammar(r"""
+            greeting = (word "!") / (word "?")
+            word = ~"[a-z]+"
+            """)
+        cache = {}
+        eq_(grammar['greeting'].match_end_core('hi?', 0, cache,
+                                               ParseError('hi?')), 3)
+        ok_(all(end is None or isinstance(end, int)
+                for end in cache.values()))
+
+    def test_error_reporting(self):
+        """Make sure ends-only matching blames the same expression."""
+        grammar = Grammar("""
+            bold_text = open_parens text close_parens
+            open_parens = "(("
+            text = ~"[a-zA-Z]+"
+            close_parens = "))"
+            """)
+        try:
+            grammar.parse('((fred!!', ends_only=True)
+        except ParseError as error:
+            eq_(error.pos, 6)
+            eq_(error.expr, grammar['close_parens'])
+        else:
+            ok_(False, 'No ParseError was raised.')
+
+
+def node_events(node):
+    """Return the events ``iterparse()`` should yield for a Node tree."""
+    if not node.children:
+        return [('token', node.expr_name, node.start, node.end)]
+    events = []
+    for child in node:
+        events.extend(node_events(child))
+    if node.expr_name:
+        span = (node.expr_name, node.start, node.end)
+        events = [('enter',) + span] + events + [('exit',) + span]
+    return events
+
+
+class IterparseTests(TestCase):
+    """Tests for the tree-less, event-stream parsing API"""
+
+    grammar = Grammar(r"""
+        list = "(" item* ")" ("!" / "?")?
+        item = (pair / word / list) ws
+        pair = word ":" word
+        word = ~"[a-z]+"
+        ws = ~r"\s*"
+        """)
+
+    def test_events(self):
+        eq_(list(Grammar('greeting = "hi" name?  name = ~"[A-Z][a-z]*"')
+                 .iterparse('hiBob')),
+            [('enter', 'greeting', 0, 5),
+             ('token', '', 0, 2),
+             ('token', 'name', 2, 5),
+             ('exit', 'greeting', 0, 5)])
+
+    def test_same_as_trees(self):
+        """The events should describe just the tree ``parse()`` builds."""
+        for text in ['()', '(a b:c (d) ())?', '(a:b ((c)))!']:
+            eq_(list(self.grammar.iterparse(text)),
+                node_events(self.grammar.parse(text)))
+
+    def test_custom_rules(self):
+        """Custom rules, which can't be walked without their Nodes, should
+        come out the same, too."""
+        grammar = Grammar("""
+            bracketed = "[" digits "]"
+            """, digits=lambda text, pos: (pos + 2, [
+                Node('digit', text, pos, pos + 1),
+                Node('digit', text, pos + 1, pos + 2)]))
+        eq_(list(grammar.iterparse('[12]')),
+            node_events(grammar.parse('[12]')))
+
+    def test_errors(self):
+        assert_raises(ParseError, list, self.grammar.iterparse('(a b'))
+        assert_raises(IncompleteParseError, list,
+                      self.grammar.iterparse('(a b))'))
+
+
+class EndposTests(TestCase):
+    """Tests for bounding matches with ``endpos``, without slicing"""
+
+    grammar = Grammar(r"""
+        call = word "(" args ")"
+        args = word ("," word)*
+        word = ~"[a-z]+"
+        """)
+
+    def test_parse_region(self):
+        text = 'xx f(a,b) trailing junk'
+        for ends_only in (False, True):
+            node = self.grammar.parse(text, pos=3, endpos=9,
+                                      ends_only=ends_only)
+            eq_((node.start, node.end, node.text), (3, 9, 'f(a,b)'))
+            eq_(list(self.grammar.iterparse(text, pos=3, endpos=9)),
+                [('enter', 'call', 3, 9), ('token', 'word', 3, 4),
+                 ('token', '', 4, 5), ('enter', 'args', 5, 8),
+                 ('token', 'word', 5, 6), ('token', '', 6, 7),
+                 ('token', 'word', 7, 8), ('exit', 'args', 5, 8),
+                 ('token', '', 8, 9), ('exit', 'call', 3, 9)])
+
+    def test_bounds(self):
+        """Neither literals nor regexes should see past ``endpos``, and
+        completeness should be judged against it."""
+        text = 'f(abc)'
+        assert_raises(ParseError, self.grammar.parse, text, endpos=5)
+        eq_(self.grammar['word'].match(text, pos=2, endpos=4).text, 'ab')
+        assert_raises(IncompleteParseError, self.grammar['word'].parse, text,
+                      pos=2, endpos=6)
+        # An endpos past the end is the same as none:
+        eq_(self.grammar.parse(text, endpos=100), self.grammar.parse(text))
+
+    def test_custom_rules(self):
+        """Custom rules can't see ``endpos``, but mustn't match past it."""
+        grammar = Grammar('greeting = "hi" name',
+                          name=lambda text, pos: pos + 3)
+        eq_(grammar.parse('hibob').end, 5)
+        assert_raises(ParseError, grammar.parse, 'hibob', endpos=4)
+
+
+class RopeTests(TestCase):
+    """Tests for parsing sequences of chunks without joining them"""
+
+    grammar = Grammar(r"""
+        call = word "(" ws args ws ")"
+        args = arg ("," ws arg)*
+        arg = word / string
+        word = ~"[a-z]+"
+        string = ~r'"[^"]*"'
+        ws = ~r"\s*"
+        """)
+    lines = ['fn(', '  abc, "a long', 'string", x', ')']
+
+    def test_slicing(self):
+        rope = Rope(self.lines, separator='\n')
+        text = '\n'.join(self.lines)
+        eq_(len(rope), len(text))
+        for start in range(len(text)):
+            for stop in range(start, len(text) + 1):
+                eq_(rope[start:stop], text[start:stop])
+        eq_(rope[-1], ')')
+        ok_(rope.startswith('abc', 6))
+        ok_(not rope.startswith('abc', 6, 8))
+        ok_(rope.startswith('a long\nstr', 12))
+
+    def test_same_trees(self):
+        """Parsing a Rope should make Nodes whose positions and text match
+        those of parsing the joined string."""
+        text = '\n'.join(self.lines)
+        for separator, chunks in [('\n', self.lines),
+                                  ('', list(text)),
+                                  ('', [text[:7], '', text[7:]])]:
+            for ends_only in (False, True):
+                rope_node = self.grammar.parse(Rope(chunks, separator),
+                                               ends_only=ends_only)
+                eq_(rope_node.prettily(), self.grammar.parse(text).prettily())
+                args = rope_node.children[3]
+                eq_(args.children[0].children[0].match.group(), 'abc')
+
+    def test_windows(self):
+        """Regexes should be matched through a window widened to fit."""
+        class SmallRope(Rope):
+            window = 4
+            lookahead = 2
+        rope = SmallRope(['abcdefghij', 'klm'])
+        eq_(self.grammar['word'].parse(rope).end, 13)
+
+    def test_long_tokens(self):
+        """A regex that fails in the first window but matches in a wider one
+        should match, as it does in the joined string."""
+        text = '"%s"' % ('x' * 300)
+        for chunks in [[text], [text[:100], text[100:]]]:
+            eq_(self.grammar['string'].parse(Rope(chunks)).end, len(text))
+
+    def test_linear_time(self):
+        """Failed regexes shouldn't copy the rest of the text, which would
+        make parsing take time quadratic in its length."""
+        def parse_time(count):
+            lines = ['fn('] + ['  abc, "de f",'] * count + ['  x', ')']
+            rope = Rope(lines, separator='\n')
+            return min(timeit(lambda: self.grammar.parse(rope), number=1)
+                       for _ in range(3))
+        small, big = parse_time(500), parse_time(4000)
+        # 8 times as long, at most 8 times the time, give or take noise:
+        ok_(big < 12 * small, '%s (4000 lines) < 12 * %s (500 lines)' % (
+            big, small))
+
+    def test_errors(self):
+        try:
+            self.grammar.parse(Rope(['fn(', '  abc;', ')'], '\n'))
+        except ParseError as error:
+            eq_((error.line(), error.column()), (2, 6))
+        else:
+            ok_(False, 'Should have raised a ParseError.')
+
+
+class BytesTests(TestCase):
+    """Tests for parsing bytes-like text with UTF-8 twins of expressions"""
+
+    grammar = Grammar(u"""
+        call = word "(" args ")"
+        args = arg (", " arg)*
+        arg = word / string / "→"
+        word = ~"[a-z]+"i
+        string = ~r'"[^"]*"'
+        """)
+    text = u'Fn(abc, "déf", →)'
+
+    def test_same_trees(self):
+        """Parsing bytes should make Nodes spanning the same bytes that the
+        text ones span characters."""
+        data = self.text.encode('utf-8')
+        text_node = self.grammar.parse(self.text)
+        for ends_only in (False, True):
+            node = self.grammar.parse(data, ends_only=ends_only)
+            ok_(isinstance(node.full_text, memoryview))
+            eq_(node.prettily(), text_node.prettily())
+            string = (node.children[2].children[1].children[0].children[1]
+                      .children[0])
+            eq_(string.text.tobytes(), u'"déf"'.encode('utf-8'))
+            eq_(string.match.group(), u'"déf"'.encode('utf-8'))
+
+    def test_twins(self):
+        """Bytes twins should be made once and share structure as the
+        originals do."""
+        call = self.grammar['call']
+        eq_(call.parse(bytearray(b'f(g)')).end, 4)
+        twin = call._bytes_twin
+        ok_(twin is not call and twin._bytes_twin is twin)
+        eq_(twin.members[0].re.pattern, b'[a-z]+')
+        ok_(twin.members[0] is twin.members[2].members[0].members[0])
+        eq_(call.parse(b'f(g)').end, 4)
+        ok_(call._bytes_twin is twin)
+        eq_(self.grammar['word'].re.pattern, '[a-z]+')
+
+    def test_mmap(self):
+        with TemporaryFile() as file:
+            file.write(self.text.encode('utf-8') * 2)
+            file.flush()
+            mapped = mmap(file.fileno(), 0, access=ACCESS_READ)
+            length = len(self.text.encode('utf-8'))
+            node = self.grammar.parse(mapped, pos=length)
+            eq_((node.start, node.end), (length, 2 * length))
+            eq_(node.children[0].text, b'Fn')
+            del node
+            mapped.close()
+
+    def test_errors(self):
+        try:
+            self.grammar.parse(u'f(x,\né)'.encode('utf-8'))
+        except ParseError as error:
+            eq_((error.line(), error.column()), (1, 4))
+            ok_(u"',\né)'" in text_type(error))
+        else:
+            ok_(False, 'Should have raised a ParseError.')
+
+
 class ErrorReportingTests(TestCase):
     """Tests for reporting parse errors"""
 
@@ -229,6 +533,33 @@ class ErrorReportingTests(TestCase):
         except ParseError as error:
             eq_(text_type(error), u"Rule 'starts_with_a' didn't match at 'burp' (line 1, column 1).")
 
+    def test_optimistic_first_pass(self):
+        """Make sure we track errors only once a match has failed, and that
+        the error we then raise is the one we'd have gotten anyway."""
+        errors = []
+
+        def digit(text, pos, cache, error, grammar):
+            errors.append(error)
+            return grammar['real_digit'].match_core(text, pos, cache, error)
+
+        grammar = Grammar("""
+            bracketed_digit = "[" digit "]"
+            real_digit = ~"[0-9]"
+            """, digit=digit)
+        grammar.parse('[6]')
+        eq_(errors, [None])
+
+        del errors[:]
+        try:
+            grammar.parse('[x]')
+        except ParseError as error:
+            eq_(errors[0], None)
+            ok_(errors[1] is error)
+            eq_(error.pos, 1)
+            eq_(error.expr, grammar['digit'])
+        else:
+            ok_(False, 'No ParseError was raised.')
+
     def test_line_and_column(self):
         """Make sure we got the line and column computation right."""
         grammar = Grammar(r"""
@@ -243,6 +574,48 @@ class ErrorReportingTests(TestCase):
             # didn't match". That's not the greatest. Fix that, then fix this.
             ok_(text_type(error).endswith(r"""didn't match at 'GOO' (line 2, column 4)."""))
 
+    def test_line_index(self):
+        """Make sure the line index agrees with counting newlines."""
+        text = 'one\n\nthree\nfour\n'
+        index = LineIndex(text)
+        for pos in range(len(text) + 1):
+            eq_(index.line(pos), text.count('\n', 0, pos) + 1)
+            eq_(index.column(pos), pos - text.rfind('\n', 0, pos))
+
+    def test_shared_line_index(self):
+        """The errors reported against one text should share one index of it,
+        built once, when a line or column is first asked for."""
+        grammar = Grammar(r"""
+            pair = "(" ~"[a-z]+" ")"
+            """)
+        text = '(a)\n(b]\n  (c)\n(d!'
+        index = LineIndex(text)
+        errors = []
+        for start, end in [(4, 7), (14, 17), (0, 2)]:
+            try:
+                grammar.parse(text, start, endpos=end, line_index=index)
+            except ParseError as error:
+                errors.append(error)
+        eq_(len(errors), 3)
+        ok_(all(error.line_index is index for error in errors))
+        ok_(index._starts is None)
+        eq_([(error.line(), error.column()) for error in errors],
+            [(2, 3), (4, 3), (1, 3)])
+        starts = index._starts
+        eq_(starts, [0, 4, 8, 14])
+        ok_(errors[1].line() == 4 and index._starts is starts)
+
+    def test_line_without_index(self):
+        """Without an index, an error should count the newlines before it, in
+        whatever kind of text it's in."""
+        for text in ['a\nbc\nd', b'a\nbc\nd', memoryview(b'a\nbc\nd'),
+                     Rope(['a', 'bc', 'd'], separator='\n')]:
+            error = ParseError(text, 4)
+            ok_(error.line_index is None)
+            eq_((error.line(), error.column()), (2, 3))
+        eq_((ParseError('abcde', 4).line(), ParseError('abcde', 4).column()),
+            (1, 5))
+
 
 class RepresentationTests(TestCase):
     """Tests for str(), unicode(), and repr() of expressions"""
@@ -278,6 +651,12 @@ class RepresentationTests(TestCase):
         eq_(text_type(Grammar('foo = "bar" &("baz" "eggs") "spam"')),
             u'foo = "bar" &("baz" "eggs") "spam"')
 
+        # Atomic
+        eq_(text_type(Grammar('foo = "bar" @("baz" / "eggs") "spam"')),
+            u'foo = "bar" @("baz" / "eggs") "spam"')
+        eq_(text_type(Grammar('foo = @("baz" / "eggs")')),
+            u'foo = @("baz" / "eggs")')
+
         # Multiple sequences
         eq_(text_type(Grammar('foo = ("bar" "baz") / ("baff" "bam")')),
             u'foo = ("bar" "baz") / ("baff" "bam")')
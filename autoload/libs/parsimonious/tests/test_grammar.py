@@ -1,3 +1,4 @@
+from array import array
 from sys import version_info
 from unittest import TestCase
 
@@ -6,9 +7,9 @@ from nose.tools import eq_, assert_raises, ok_
 from six import text_type
 
 from parsimonious.exceptions import UndefinedLabel, ParseError
-from parsimonious.expressions import Sequence
+from parsimonious.expressions import Sequence, TokenMatcher
 from parsimonious.grammar import rule_grammar, RuleVisitor, Grammar, TokenGrammar, LazyReference
-from parsimonious.nodes import Node
+from parsimonious.nodes import Node, RegexNode
 from parsimonious.utils import Token
 
 
@@ -74,6 +75,7 @@ class BootstrappingGrammarTests(TestCase):
         # + is higher precedence than &, so 'anded' should match the whole
         # thing:
         ok_(rule_grammar['lookahead_term'].parse('&this+'))
+        ok_(rule_grammar['atomic_term'].parse('@("a" b)'))
 
         ok_(rule_grammar['expression'].parse('this'))
         ok_(rule_grammar['expression'].parse('this? that other*'))
@@ -233,6 +235,34 @@ class GrammarTests(TestCase):
                                       Node('', s, 0, 0),
                                       Node('', s, 0, 3)]))
 
+    def test_atomic(self):
+        """Atomic terms should match like their contents but make a single,
+        childless node."""
+        grammar = Grammar(r'''
+            greeting = @("hi" / "hello") ws name
+            name = @(~"[A-Z]" ~"[a-z]*")
+            ws = ~r"\s+"
+            ''')
+        assert_raises(ParseError, grammar.parse, 'hey Bob')
+
+        s = 'hello Bob'
+        for ends_only in (False, True):
+            eq_(grammar.parse(s, ends_only=ends_only),
+                Node('greeting', s, 0, 9, children=[
+                    Node('', s, 0, 5),
+                    RegexNode('ws', s, 5, 6),
+                    Node('name', s, 6, 9)]))
+
+    def test_atomic_memo(self):
+        """The contents of atomic terms should leave nothing in the packrat
+        cache."""
+        atomic = Grammar(r'''string = @('"' ~r'[^"]*' '"')''')['string']
+        plain = Grammar(r'''string = ('"' ~r'[^"]*' '"')''')['string']
+        for expr, entries in ((atomic, 1), (plain, 4)):
+            cache = {}
+            expr.match_core('"hi"', 0, cache, None)
+            eq_(len(cache), entries)
+
     def test_parens(self):
         grammar = Grammar(r'''sequence = "chitty" (" " "bang")+''')
         # Make sure it's not as if the parens aren't there:
@@ -339,6 +369,19 @@ class GrammarTests(TestCase):
                 Node('real_digit', s, 1, 2),
                 Node('end', s, 2, 3)]))
 
+    def test_custom_rules_ends_only(self):
+        """Make sure custom rules, which build their own Nodes, work when the
+        rest of the grammar caches only end positions."""
+        grammar = Grammar("""
+            bracketed_digit = start digit end
+            start = '['
+            end = ']'
+            real_digit = '6'""",
+            digit=lambda text, pos, cache, error, grammar:
+                    grammar['real_digit'].match_core(text, pos, cache, error))
+        s = '[6]'
+        eq_(grammar.parse(s, ends_only=True), grammar.parse(s))
+
     def test_lazy_custom_rules(self):
         """Make sure LazyReferences manually shoved into custom rules are
         resolved.
@@ -428,3 +471,21 @@ class TokenGrammarTests(TestCase):
         assert_raises(ParseError,
                       grammar.parse,
                       [Token('tokenBOO'), Token('token2')])
+
+    def test_bare_types(self):
+        """Tokens should be matchable by themselves, as when they're ints in
+        an array, given TokenMatchers of them as custom rules."""
+        grammar = TokenGrammar("""
+            pairs = pair+
+            pair = open close
+            """, open=TokenMatcher(0, name='open'),
+                 close=TokenMatcher(1, name='close'))
+        s = array('B', [0, 1, 0, 1])
+        for ends_only in (False, True):
+            eq_(grammar.parse(s, ends_only=ends_only),
+                Node('pairs', s, 0, 4, children=[
+                    Node('pair', s, 0, 2, children=[Node('open', s, 0, 1),
+                                                    Node('close', s, 1, 2)]),
+                    Node('pair', s, 2, 4, children=[Node('open', s, 2, 3),
+                                                    Node('close', s, 3, 4)])]))
+        assert_raises(ParseError, grammar.parse, array('B', [0, 0, 1]))
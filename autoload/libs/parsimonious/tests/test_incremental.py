@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import pickle
+import re
+
+from nose.tools import eq_, ok_
+
+from parsimonious import Grammar, ParseError
+from parsimonious.incremental import Session, _failure_width
+from parsimonious.nodes import Node
+
+
+grammar = Grammar(r"""
+    list = "[" items "]"
+    items = item ("," item)*
+    item = list / number / word
+    number = ~"[0-9]+"
+    word = ~"[a-z]+"
+    """)
+
+
+def parsed(parse, *args):
+    """Return the tree ``parse(*args)`` returns, or the position of the
+    ParseError it raises."""
+    try:
+        return parse(*args)
+    except ParseError as error:
+        return error.pos
+
+
+def test_reparse():
+    """Reparsing after edits should give the tree, or the error, a fresh
+    parse would."""
+    session = Session(grammar, '[1,[2,x],abc]')
+    eq_(session.parse(), grammar.parse('[1,[2,x],abc]'))
+    for offset, removed, inserted, text in [(3, 0, 'ab,', '[1,ab,[2,x],abc]'),
+                                            (0, 0, '[', '[[1,ab,[2,x],abc]'),
+                                            (17, 0, ']', '[[1,ab,[2,x],abc]]'),
+                                            (5, 6, '', '[[1,a],abc]]'),
+                                            (11, 1, '', '[[1,a],abc]')]:
+        session.edit(offset, removed, inserted)
+        eq_(session.text, text)
+        eq_(parsed(session.parse), parsed(grammar.parse, text))
+    ok_(isinstance(parsed(session.parse), Node))
+
+
+def test_reuse():
+    """Matches that didn't examine the edited text should be kept, shifted if
+    they're after it."""
+    session = Session(grammar['items'], 'abc,123,def')
+    session.parse()
+    word, number = id(grammar['word']), id(grammar['number'])
+    eq_(session.cache[(word, 0)], 3)
+    eq_(session.cache[(number, 8)], None)
+
+    session.edit(4, 3, '45678')
+    eq_(session.text, 'abc,45678,def')
+    eq_(session.cache[(word, 0)], 3)
+    eq_(session.cache[(word, 10)], 13)
+    eq_(session.cache[(number, 10)], None)
+    ok_((number, 4) not in session.cache)
+    # The word at 0 examined the comma after it, but not the number:
+    ok_((id(grammar['items']), 0) not in session.cache)
+    eq_(session.parse(), grammar['items'].parse('abc,45678,def'))
+
+
+def test_update():
+    """``update()`` should edit just the stretch that differs."""
+    session = Session(grammar, '[abc,def,ghi]')
+    session.parse()
+    session.update('[abc,de,f,ghi]')
+    eq_(session.text, '[abc,de,f,ghi]')
+    word = id(grammar['word'])
+    ok_((word, 1) in session.cache)
+    ok_((word, 10) in session.cache)
+    ok_((word, 5) not in session.cache)
+    eq_(session.parse(), grammar.parse('[abc,de,f,ghi]'))
+    session.update('[abc,de,f,ghi]')
+    eq_(session.parse(), grammar.parse('[abc,de,f,ghi]'))
+
+
+def test_custom_rules():
+    """Custom rules' matches, and their callers', should always be
+    forgotten."""
+    custom = Grammar("""
+        words = word+
+        word = letters " "
+        """, letters=lambda text, pos: pos + 1 if text[pos:pos + 1].isalpha()
+                                       else None)
+    session = Session(custom, 'a b c ')
+    session.parse()
+    session.edit(6, 0, 'd ')
+    # Only the spaces' matches are left:
+    eq_(set(expr_id for expr_id, pos in session.cache),
+        set([id(custom['word'].members[1])]))
+    eq_(session.parse(), custom.parse('a b c d '))
+
+
+def test_failed_regexes():
+    """A regex that failed after reading to the end of the text should be
+    tried again after text is added there."""
+    g = Grammar(r"""
+        text = (quoted / word / quote)+
+        quoted = ~'"[^"]*"'
+        word = ~"[a-z]+"
+        quote = '"'
+        """)
+    for text, edits in [('"abc', [(4, 0, '"')]),
+                        ('"ab"cd', [(3, 1, ''), (5, 0, '"'), (0, 1, '')]),
+                        ('x"ab"', [(4, 1, ''), (4, 0, 'c"')])]:
+        session = Session(g, text)
+        eq_(session.parse(), g.parse(text))
+        for edit in edits:
+            session.edit(*edit)
+            eq_(parsed(session.parse), parsed(g.parse, session.text))
+
+
+def test_token_regex_failures():
+    """A character-class regex that failed should be forgotten only after an
+    edit where it failed."""
+    session = Session(grammar['items'], 'abc,123,def')
+    session.parse()
+    number = id(grammar['number'])
+    eq_(session.cache[(number, 0)], None)
+    session.edit(8, 3, 'ghi')
+    eq_(session.cache[(number, 0)], None)
+    session.edit(0, 1, 'x')
+    ok_((number, 0) not in session.cache)
+    eq_(session.parse(), grammar['items'].parse('xbc,123,ghi'))
+
+
+def test_failure_width():
+    """Only regexes that can't read on before failing should be trusted."""
+    for pattern, width in [('[0-9]+', 0),
+                           (r'#[^\n]*', 0),
+                           ('[a-z]{3,}', 2),
+                           ('u?r?"', 2),
+                           ('[a-z]*x', None),
+                           ('"[^"]*"', None),
+                           ('(ab)+', None)]:
+        eq_(_failure_width(re.compile(pattern)), width)
+
+
+def test_moved_nodes():
+    """The Nodes copied from the last tree should be indistinguishable from
+    fresh ones."""
+    session = Session(grammar, '[1,[2,[x,y]],abc]')
+    session.parse()
+    session.edit(1, 1, '42')
+    tree = session.parse()
+    fresh = grammar.parse('[42,[2,[x,y]],abc]')
+    eq_(repr(tree), repr(fresh))
+    eq_(tree.prettily(), fresh.prettily())
+    eq_(pickle.loads(pickle.dumps(tree)), fresh)
+    eq_(session.parse(), fresh)
+    eq_(type(session.parse().children[1]), Node)
+
+
+def test_regex_lookahead():
+    """Regexes that look past where their matches end should be given the
+    margin they need."""
+    g = Grammar(r"""
+        text = loud / quiet
+        loud = ~"[a-z]+(?= *!)" ~" *[!?]"
+        quiet = ~"[a-z]+" ~" *[!?]"
+        """)
+    session = Session(g, 'hi  !')
+    # The loud regex matches "hi" having examined the "!" at 4.
+    session.regex_lookahead = 3
+    session.parse()
+    session.edit(4, 1, '?')
+    eq_(session.parse(), g.parse('hi  ?'))
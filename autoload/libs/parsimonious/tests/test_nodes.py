@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from nose import SkipTest
-from nose.tools import eq_, assert_raises
+from nose.tools import eq_, ok_, assert_raises
 
 from parsimonious import Grammar, NodeVisitor, VisitationError, rule
 from parsimonious.nodes import Node
@@ -142,3 +142,62 @@ def test_unwrapped_exceptions():
             raise PrimalScream('This should percolate up!')
 
     assert_raises(PrimalScream, Screamer().parse, 'howdy')
+
+
+def test_opaque_rules():
+    """Nodes of opaque rules should be handed to their parents unvisited."""
+    class Lister(NodeVisitor):
+        grammar = Grammar(r"""
+            list = word (ws word)*
+            word = ~"[a-z]+"
+            ws = ~r"\s+"
+            """)
+        opaque_rules = frozenset(['word', 'ws'])
+
+        def visit_word(self, node, visited_children):
+            raise AssertionError("Opaque rules shouldn't be visited.")
+
+        def generic_visit(self, node, visited_children):
+            words = []
+            for child in visited_children:
+                if isinstance(child, list):
+                    words.extend(child)
+                elif child.expr_name == 'word':
+                    words.append(child.text)
+            return words
+
+    lister = Lister()
+    eq_(lister.parse('hi there you'), ['hi', 'there', 'you'])
+
+    # The top node can be opaque, too:
+    node = lister.grammar['word'].parse('hi')
+    ok_(lister.visit(node) is node)
+
+
+def test_memoize_visits():
+    """Each distinct Node should be visited once per top-level visit()."""
+    class Counter(NodeVisitor):
+        memoize_visits = True
+
+        def __init__(self):
+            self.visits = 0
+
+        def generic_visit(self, node, visited_children):
+            self.visits += 1
+            return tuple(visited_children) or node.text
+
+    text = 'hi'
+    shared = Node('word', text, 0, 2)
+    tree = Node('pair', text, 0, 2, children=[shared, shared])
+
+    counter = Counter()
+    eq_(counter.visit(tree), ('hi', 'hi'))
+    eq_(counter.visits, 2)
+
+    # The memo doesn't outlive the top-level call:
+    eq_(counter.visit(tree), ('hi', 'hi'))
+    eq_(counter.visits, 4)
+
+    Counter.memoize_visits = False
+    counter.visit(tree)
+    eq_(counter.visits, 7)
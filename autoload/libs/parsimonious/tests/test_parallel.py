@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+
+from nose.tools import eq_, ok_, assert_raises
+
+from parsimonious import Grammar, NodeVisitor, ParseError, VisitationError
+
+
+grammar = Grammar(r"""
+    list = "[" items "]"
+    items = item ("," item)*
+    item = list / number / word
+    number = ~"[0-9]+"
+    word = ~"[a-z]+"
+    """)
+
+
+class Summer(NodeVisitor):
+    grammar = grammar
+
+    def visit_number(self, node, visited_children):
+        return int(node.text)
+
+    def visit_word(self, node, visited_children):
+        if node.text == 'boom':
+            raise ValueError('Boom!')
+        return 0
+
+    def generic_visit(self, node, visited_children):
+        return sum(child for child in visited_children
+                   if isinstance(child, int))
+
+
+def digits(text, pos):
+    """A custom rule for the pickling tests"""
+    end = pos
+    while text[end:end + 1].isdigit():
+        end += 1
+    return end if end > pos else None
+
+
+def test_pickle_by_source():
+    """Grammars should pickle as the rules they were made from, and come back
+    whole."""
+    for protocol in range(HIGHEST_PROTOCOL + 1):
+        pickled = dumps(grammar, protocol)
+        ok_(b'items = item' in pickled)
+        unpickled = loads(pickled)
+        eq_(unpickled.parse('[1,[a]]'), grammar.parse('[1,[a]]'))
+        # Unpickling the same rules again gives back the same grammar:
+        ok_(loads(pickled) is unpickled)
+
+
+def test_pickle_default_and_custom():
+    """Grammars should keep their default rules and custom rules through
+    pickling."""
+    unpickled = loads(dumps(grammar.default('items'), HIGHEST_PROTOCOL))
+    eq_(unpickled.default_rule.name, 'items')
+    eq_(unpickled.parse('1,a'), grammar['items'].parse('1,a'))
+
+    custom = Grammar('sum = number "+" number', number=digits)
+    unpickled = loads(dumps(custom, HIGHEST_PROTOCOL))
+    eq_(unpickled.parse('12+3').end, 4)
+
+
+def test_pickle_errors():
+    """ParseErrors and VisitationErrors should survive pickling."""
+    try:
+        grammar.parse('[1,]')
+    except ParseError as error:
+        unpickled = loads(dumps(error, HIGHEST_PROTOCOL))
+        eq_((unpickled.line(), unpickled.column()), (1, 4))
+        eq_(str(unpickled), str(error))
+    try:
+        Summer().parse('[boom]')
+    except VisitationError as error:
+        unpickled = loads(dumps(error, HIGHEST_PROTOCOL))
+        eq_(str(unpickled), str(error))
+        ok_(unpickled.original_class is ValueError)
+
+
+def test_parse_many():
+    """Results should come back in order, pooled or not."""
+    texts = ['[%s,[%s]]' % (i, i) for i in range(40)]
+    expected = [grammar.parse(text) for text in texts]
+    eq_(grammar.parse_many(texts, workers=0), expected)
+    pooled = grammar.parse_many(texts, workers=2, chunksize=3,
+                                ends_only=True)
+    eq_(pooled, expected)
+    number = pooled[7].children[1].children[0].children[0]
+    eq_(number.match.group(), '7')
+    eq_(Summer().parse_many(texts, workers=2), [2 * i for i in range(40)])
+
+
+def test_parse_many_errors():
+    """Errors in workers should be raised in the caller."""
+    assert_raises(ParseError, grammar.parse_many, ['[1]', '[1,]'], workers=2)
+    assert_raises(VisitationError, Summer().parse_many, ['[1]', '[boom]'],
+                  workers=2)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from nose.tools import eq_, ok_
+
+from parsimonious import Grammar, NodeVisitor
+from parsimonious.expressions import Expression
+from parsimonious.nodes import Node
+from parsimonious.tracing import Profile, Tracer
+
+
+grammar = Grammar(r"""
+    list = "[" items "]"
+    items = item ("," item)*
+    item = list / number / word
+    number = ~"[0-9]+"
+    word = ~"[a-z]+"
+    """)
+
+
+class Summer(NodeVisitor):
+    grammar = grammar
+
+    def visit_number(self, node, visited_children):
+        return int(node.text)
+
+    def generic_visit(self, node, visited_children):
+        return sum(child for child in visited_children
+                   if isinstance(child, int))
+
+
+class Recorder(Tracer):
+    """Tracer that records which rules were tried where"""
+
+    def __init__(self):
+        self.matches = []
+        self.visits = []
+
+    def trace_match(self, match, expr, text, pos, cache, error, endpos):
+        result = match(expr, text, pos, cache, error, endpos)
+        if expr.name:
+            self.matches.append((expr.name, pos, result is not None))
+        return result
+
+    def trace_visit(self, visit, visitor, node):
+        self.visits.append(node.expr_name)
+        return visit(visitor, node)
+
+
+def test_zero_cost_when_inactive():
+    """Outside any tracer, the untraced methods should be in place."""
+    match_core = Expression.match_core
+    visit = NodeVisitor.visit
+    with Recorder():
+        ok_(Expression.match_core is not match_core)
+        ok_(NodeVisitor.visit is not visit)
+    eq_(Expression.match_core, match_core)
+    eq_(NodeVisitor.visit, visit)
+
+
+def test_tracer_hooks():
+    """Tracers should see every rule tried and every node visited."""
+    with Recorder() as recorder:
+        total = Summer().parse('[1,[2,x]]')
+    eq_(total, 3)
+    ok_(('list', 0, True) in recorder.matches)
+    ok_(('number', 1, True) in recorder.matches)
+    ok_(('list', 1, False) in recorder.matches)
+    eq_(recorder.visits[0], 'list')
+    eq_(recorder.visits.count('number'), 2)
+
+
+def test_nested_tracers():
+    """Only the innermost tracer should see anything."""
+    with Recorder() as outer:
+        with Recorder() as inner:
+            grammar.parse('[1]')
+        eq_(outer.matches, [])
+        ok_(inner.matches)
+        grammar.parse('[1]')
+        ok_(outer.matches)
+
+
+def test_grammar_profile():
+    """``Grammar.parse(..., profile=True)`` should count calls, memo hits and
+    misses, and backtracks."""
+    node, profile = grammar.parse('[1,[2,x]]', profile=True)
+    ok_(isinstance(node, Node))
+    eq_(node.text, '[1,[2,x]]')
+
+    number = profile.rules['number']
+    eq_(number.calls, number.hits + number.misses)
+    # "item" tries "number" at 1 and 4, after "list" fails there; "number"
+    # then fails at 6, where "word" takes over.
+    eq_(number.calls, 3)
+    eq_(number.backtracks, 1)
+    eq_(profile.rules['list'].backtracks, 3)
+    ok_(profile.rules['list'].seconds >= profile.rules['items'].seconds)
+    ok_(profile.peak_memo_size > 0)
+    eq_(profile.visits, {})
+
+
+def test_profile_hits():
+    """Retrying a rule at the same place should be counted as a memo hit."""
+    g = Grammar("""
+        greeting = (word "!") / (word "?")
+        word = ~"[a-z]+"
+        """)
+    _, profile = g.parse('hi?', profile=True)
+    eq_(profile.rules['word'].calls, 2)
+    eq_(profile.rules['word'].hits, 1)
+    eq_(profile.rules['word'].misses, 1)
+
+
+def test_ends_only_profile():
+    """Profiling should work the same in ends-only mode."""
+    _, nodes = grammar.parse('[1,[2,x]]', profile=True)
+    _, ends = grammar.parse('[1,[2,x]]', ends_only=True, profile=True)
+    eq_(dict((name, stats.calls) for name, stats in nodes.rules.items()),
+        dict((name, stats.calls) for name, stats in ends.rules.items()))
+
+
+def test_visitor_profile():
+    """``NodeVisitor.parse(..., profile=True)`` should cover the parse and the
+    visitation."""
+    total, profile = Summer().parse('[1,[2,x]]', profile=True)
+    eq_(total, 3)
+    eq_(profile.rules['number'].calls, 3)
+    eq_(profile.visits['visit_number'].calls, 2)
+    ok_(profile.visits['generic_visit'].calls > 2)
+    ok_('visit_number' in profile.report())
+
+
+def test_accumulating_profile():
+    """Passing a Profile should add to it."""
+    profile = Profile()
+    grammar.parse('[1]', profile=profile)
+    _, same = grammar.parse('[2]', profile=profile)
+    ok_(same is profile)
+    eq_(profile.rules['list'].calls, 4)
+
+
+def test_collapsed():
+    """Collapsed stacks should nest rules, outermost first, and count
+    microseconds."""
+    _, profile = grammar.parse('[1,[2,[3,[4]]]]', profile=True)
+    lines = profile.collapsed().splitlines()
+    ok_(lines)
+    for line in lines:
+        stack, microseconds = line.rsplit(' ', 1)
+        ok_(stack.startswith('list'))
+        ok_(int(microseconds) > 0)
+    ok_(any(line.startswith('list;items;item;list;items;item;')
+            for line in lines))
@@ -0,0 +1,262 @@
+"""Hooks for watching a parse as it happens, and a rule-level profiler built
+on them
+
+Nothing here costs anything until you use it: only while some
+:class:`Tracer` is active do we swap traced versions of
+``Expression.match_core()``, ``Expression.match_end_core()``, and
+``NodeVisitor.visit()`` into place, and we swap the originals back as soon as
+the last one finishes.
+
+"""
+from collections import defaultdict
+from sys import maxsize
+from threading import Lock, local
+from timeit import default_timer
+
+from parsimonious.expressions import Expression
+from parsimonious.nodes import NodeVisitor
+
+
+_originals = {
+    (Expression, 'match_core'): Expression.match_core,
+    (Expression, 'match_end_core'): Expression.match_end_core,
+    (NodeVisitor, 'visit'): NodeVisitor.visit,
+}
+
+# The innermost active Tracer of each thread:
+_local = local()
+
+# How many Tracers are active, across all threads, guarded by _lock:
+_active = [0]
+_lock = Lock()
+
+
+def _traced_match(match):
+    """Return a version of the ``match_core()``-like method ``match`` which
+    defers to the current thread's tracer, if any."""
+    def traced_match(self, text, pos, cache, error, endpos=maxsize):
+        tracer = getattr(_local, 'tracer', None)
+        if tracer is None:
+            return match(self, text, pos, cache, error, endpos)
+        return tracer.trace_match(match, self, text, pos, cache, error,
+                                  endpos)
+    traced_match.__doc__ = match.__doc__
+    return traced_match
+
+
+def _traced_visit(visit):
+    """Return a version of ``NodeVisitor.visit()`` which defers to the
+    current thread's tracer, if any."""
+    def traced_visit(self, node):
+        tracer = getattr(_local, 'tracer', None)
+        if tracer is None:
+            return visit(self, node)
+        return tracer.trace_visit(visit, self, node)
+    traced_visit.__doc__ = visit.__doc__
+    return traced_visit
+
+
+class Tracer(object):
+    """Something that watches Expressions match and NodeVisitors visit
+
+    Subclass this, and override :meth:`trace_match()` and
+    :meth:`trace_visit()`. Then do your parsing inside a ``with`` block::
+
+        with MyTracer() as tracer:
+            grammar.parse(text)
+
+    A tracer sees only what happens in the thread that entered it. Tracers
+    nest; only the innermost active one sees anything.
+
+    """
+    def trace_match(self, match, expr, text, pos, cache, error, endpos):
+        """Watch ``expr`` match at ``pos``, and return the result.
+
+        :arg match: The untraced method: ``Expression.match_core`` or
+            ``Expression.match_end_core``. Call it as
+            ``match(expr, text, pos, cache, error, endpos)`` to do the actual
+            work.
+
+        """
+        return match(expr, text, pos, cache, error, endpos)
+
+    def trace_visit(self, visit, visitor, node):
+        """Watch ``visitor`` visit ``node``, and return the result.
+
+        :arg visit: The untraced ``NodeVisitor.visit``. Call it as
+            ``visit(visitor, node)`` to do the actual work.
+
+        """
+        return visit(visitor, node)
+
+    def __enter__(self):
+        with _lock:
+            if not _active[0]:
+                for (cls, name), original in _originals.items():
+                    setattr(cls, name, _traced_visit(original)
+                            if name == 'visit' else _traced_match(original))
+            _active[0] += 1
+        self._outer = getattr(_local, 'tracer', None)
+        _local.tracer = self
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _local.tracer = self._outer
+        with _lock:
+            _active[0] -= 1
+            if not _active[0]:
+                for (cls, name), original in _originals.items():
+                    setattr(cls, name, original)
+
+
+class Stats(object):
+    """Counts and times for one rule or visitor method"""
+
+    __slots__ = ['calls', 'hits', 'misses', 'backtracks', 'seconds']
+
+    def __init__(self):
+        self.calls = self.hits = self.misses = self.backtracks = 0
+        self.seconds = 0.0
+
+
+class Profile(Tracer):
+    """A tracer that keeps per-rule statistics
+
+    Only named expressions--rules--are counted; the work of anonymous
+    subexpressions is charged to the rule that contains them.
+
+    After parsing, look at...
+
+    * ``rules``: a map of rule names to :class:`Stats`: how many times each
+      was called, how many of those calls were packrat cache hits and misses,
+      how many failed and so made the caller backtrack, and the cumulative
+      seconds spent in it (counting only the outermost of recursive calls)
+    * ``visits``: the same for the visitor methods, keyed by method name,
+      with only ``calls`` and ``seconds`` filled in
+    * ``peak_memo_size``: the most entries the packrat cache ever held
+    * :meth:`collapsed()`: the call stacks, ready for a flame graph
+
+    You'll usually get one of these by passing ``profile=True`` to
+    ``Grammar.parse()`` or ``NodeVisitor.parse()``.
+
+    """
+    def __init__(self):
+        self.rules = defaultdict(Stats)
+        self.visits = defaultdict(Stats)
+        self.peak_memo_size = 0
+
+        # The call tree, for collapsed stacks. Frame 0 is the root; each
+        # other one is keyed by its parent frame and its name.
+        self._frames = {}
+        self._parents = [None]
+        self._names = [None]
+        self._self_seconds = [0.0]
+
+        # The frames we're in, and the time spent in each one's children:
+        self._stack = [0]
+        self._child_seconds = [0.0]
+
+        # How deep we are in each rule, so recursion isn't counted twice:
+        self._depths = defaultdict(int)
+
+    def trace_match(self, match, expr, text, pos, cache, error, endpos):
+        if not expr.name:
+            return match(expr, text, pos, cache, error, endpos)
+        stats = self.rules[expr.name]
+        stats.calls += 1
+        if (id(expr), pos) in cache:
+            stats.hits += 1
+        else:
+            stats.misses += 1
+        result = self._time(stats, expr.name, match, expr, text, pos, cache,
+                            error, endpos)
+        if result is None:
+            stats.backtracks += 1
+        if len(cache) > self.peak_memo_size:
+            self.peak_memo_size = len(cache)
+        return result
+
+    def trace_visit(self, visit, visitor, node):
+        name = 'visit_' + node.expr_name
+        if not hasattr(visitor, name):
+            name = 'generic_visit'
+        stats = self.visits[name]
+        stats.calls += 1
+        return self._time(stats, name, visit, visitor, node)
+
+    def _time(self, stats, name, function, *args):
+        """Call ``function(*args)``, charging the time to ``stats`` and to a
+        frame called ``name`` in the call tree."""
+        parent = self._stack[-1]
+        frame = self._frames.get((parent, name))
+        if frame is None:
+            frame = self._frames[(parent, name)] = len(self._names)
+            self._parents.append(parent)
+            self._names.append(name)
+            self._self_seconds.append(0.0)
+        self._stack.append(frame)
+        self._child_seconds.append(0.0)
+        self._depths[name] += 1
+
+        start = default_timer()
+        try:
+            return function(*args)
+        finally:
+            seconds = default_timer() - start
+            self._depths[name] -= 1
+            if not self._depths[name]:
+                stats.seconds += seconds
+            self._stack.pop()
+            self._self_seconds[frame] += seconds - self._child_seconds.pop()
+            self._child_seconds[-1] += seconds
+
+    def collapsed(self):
+        """Return the call stacks in collapsed form, one per line, as taken
+        by flamegraph.pl and friends.
+
+        Each line is the semicolon-separated names of the frames in a stack,
+        from the outermost in, then a space and the microseconds spent in the
+        innermost frame itself.
+
+        """
+        lines = []
+        for frame in range(1, len(self._names)):
+            microseconds = int(self._self_seconds[frame] * 1000000)
+            if not microseconds:
+                continue
+            names = []
+            parent = frame
+            while parent:
+                names.append(self._names[parent])
+                parent = self._parents[parent]
+            lines.append('%s %s' % (';'.join(reversed(names)), microseconds))
+        return '\n'.join(lines)
+
+    def report(self, limit=None):
+        """Return a table of the costliest rules and visitor methods."""
+        lines = ['%-30s %8s %8s %8s %10s %10s' % (
+            'rule', 'calls', 'hits', 'misses', 'backtracks', 'seconds')]
+        for name, stats in sorted(self.rules.items(),
+                                  key=lambda item: -item[1].seconds)[:limit]:
+            lines.append('%-30s %8s %8s %8s %10s %10.4f' % (
+                name, stats.calls, stats.hits, stats.misses, stats.backtracks,
+                stats.seconds))
+        for name, stats in sorted(self.visits.items(),
+                                  key=lambda item: -item[1].seconds)[:limit]:
+            lines.append('%-30s %8s %8s %8s %10s %10.4f' % (
+                name, stats.calls, '', '', '', stats.seconds))
+        lines.append('peak memo size: %s' % self.peak_memo_size)
+        return '\n'.join(lines)
+
+
+def profiled(profile, function, *args, **kwargs):
+    """Call ``function(*args, **kwargs)`` under a :class:`Profile`, and
+    return its result and the profile.
+
+    :arg profile: A :class:`Profile` to add to, or ``True`` for a new one
+
+    """
+    if profile is True:
+        profile = Profile()
+    with profile:
+        return function(*args, **kwargs), profile
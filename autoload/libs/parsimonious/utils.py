@@ -1,9 +1,11 @@
 """General tools which don't depend on other parts of Parsimonious"""
 
 import ast
+from bisect import bisect_right
+import re
 from sys import version_info
 
-from six import python_2_unicode_compatible
+from six import python_2_unicode_compatible, string_types
 
 
 class StrAndRepr(object):
@@ -28,6 +30,203 @@ def evaluate_string(string):
     return ast.literal_eval(string)
 
 
+class Rope(object):
+    """A read-only stand-in for a string, made of a sequence of chunks
+
+    Parse one of these rather than joining the chunks into a string, when
+    they're many and big: the lines of a file or an editor buffer, say::
+
+        grammar.parse(Rope(lines, separator='\n'))
+
+    ``chunks`` can be any sequence of strings supporting ``len()`` and
+    indexing; it's consulted as parsing goes, never copied whole. The Rope
+    reads as the chunks joined by ``separator``. Nodes' ``text`` is sliced
+    out of it only when asked for.
+
+    Literals are compared a slice at a time. Regexes, which need a real
+    string, are matched against a window of the text, starting
+    ``lookbehind`` characters before the match position and at least
+    ``window`` characters long. The window is doubled until a match ends at
+    least ``lookahead`` characters short of its end, or until it reaches the
+    end of the text. A regex that doesn't match in a window may match in a
+    wider one, but widening until the end of the text would make every
+    failed match copy the rest of it, so a failure is taken as final once
+    the window is ``reach`` characters long. That leaves three limitations:
+    a regex that needs to see more than ``reach`` characters before it can
+    match (a string token longer than that, say) fails; a regex that needs to
+    see more than ``lookahead`` characters past the end of its match (in a
+    lookahead assertion, say) may be misjudged; and the positions in a
+    rope-matched ``RegexNode``'s ``match`` are relative to the window (or the
+    single chunk it was matched in), not the Rope.
+
+    """
+    window = 256
+    lookahead = 64
+    lookbehind = 16
+    reach = 4096
+
+    def __init__(self, chunks, separator=''):
+        self.chunks = chunks
+        self.separator = separator
+        # Where each chunk begins:
+        self.starts = []
+        pos = 0
+        for chunk in chunks:
+            self.starts.append(pos)
+            pos += len(chunk) + len(separator)
+        self.length = max(pos - len(separator), 0)
+        # The last window copied out of the chunks, and where it starts:
+        self._window = 0, separator[:0]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step != 1:
+                raise ValueError('Ropes support only contiguous slices.')
+            return self._slice(start, stop)
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError('Rope index out of range')
+        return self._slice(key, key + 1)
+
+    def _slice(self, start, stop):
+        """Return the text from ``start`` to ``stop`` as a string."""
+        if start >= stop:
+            return self.separator[:0]
+        chunks, separator, starts = self.chunks, self.separator, self.starts
+        i = bisect_right(starts, start) - 1
+        pieces = []
+        while start < stop:
+            chunk = chunks[i]
+            chunk_start = starts[i]
+            chunk_end = chunk_start + len(chunk)
+            if start < chunk_end:
+                pieces.append(chunk[start - chunk_start:stop - chunk_start])
+                start = min(stop, chunk_end)
+            if start < stop:
+                piece = separator[start - chunk_end:stop - chunk_end]
+                pieces.append(piece)
+                start += len(piece)
+                i += 1
+        return pieces[0] if len(pieces) == 1 else ''.join(pieces)
+
+    def startswith(self, prefix, start=0, end=None):
+        """Act like ``str.startswith()``."""
+        if end is None or end > self.length:
+            end = self.length
+        stop = start + len(prefix)
+        return stop <= end and self._slice(start, stop) == prefix
+
+    def match(self, regex, pos, endpos):
+        """Match the compiled ``regex`` at ``pos`` as
+        ``regex.match(text, pos, endpos)`` would on the equivalent string.
+
+        Return the match object, or None, and the offset to add to the
+        positions in it to get positions in the Rope. A window that lies
+        within a single chunk is matched in place, without copying. Other
+        windows are copied out twice as long as they need to be, and the
+        last one is kept, so the matches after it can reuse it.
+
+        """
+        endpos = min(endpos, self.length)
+        chunks, starts = self.chunks, self.starts
+        offset = max(pos - self.lookbehind, 0)
+        i = bisect_right(starts, offset) - 1
+        size = self.window
+        while True:
+            stop = min(pos + size, endpos)
+            chunk_start = starts[i]
+            chunk = chunks[i]
+            base, window = self._window
+            if stop <= chunk_start + len(chunk):
+                # The window lies within one chunk: match it in place.
+                m = regex.match(chunk, pos - chunk_start, stop - chunk_start)
+                base = chunk_start
+            else:
+                if not (base <= offset and stop <= base + len(window)):
+                    base = offset
+                    window = self._slice(offset,
+                                         min(2 * stop - offset, self.length))
+                    self._window = base, window
+                m = regex.match(window, pos - base, stop - base)
+            if m is None:
+                if stop == endpos or size >= self.reach:
+                    return m, base
+                size = self.reach
+            elif stop == endpos or base + m.end() + self.lookahead <= stop:
+                return m, base
+            else:
+                size *= 2
+
+    def pieces(self):
+        """Yield the offset of each chunk and the chunk, plus the separator
+        after it, if any."""
+        last = len(self.starts) - 1
+        for i, start in enumerate(self.starts):
+            chunk = self.chunks[i]
+            yield start, chunk if i == last else chunk + self.separator
+
+
+class LineIndex(object):
+    """The offsets at which the lines of a text begin, for turning positions
+    into line and column numbers in O(log n) rather than O(n)
+
+    The offsets are found the first time they're asked for. Make one of these
+    per text, and pass it to each parse of a region of the text, so the
+    errors reported against the text share it::
+
+        index = LineIndex(text)
+        for start, end in regions:
+            try:
+                grammar.parse(text, start, endpos=end, line_index=index)
+            except ParseError as error:
+                report(error.line(), error.column())
+
+    """
+
+    __slots__ = ['text', '_starts']
+
+    def __init__(self, text):
+        self.text = text
+        self._starts = None
+
+    @property
+    def starts(self):
+        if self._starts is None:
+            text = self.text
+            starts = [0]
+            if isinstance(text, Rope):
+                for offset, piece in text.pieces():
+                    starts.extend(offset + m.end()
+                                  for m in re.finditer('\n', piece))
+            else:
+                newline = '\n' if isinstance(text, string_types) else b'\n'
+                starts.extend(m.end() for m in re.finditer(newline, text))
+            self._starts = starts
+        return self._starts
+
+    def line(self, pos):
+        """Return the 1-based number of the line ``pos`` is on."""
+        return bisect_right(self.starts, pos)
+
+    def column(self, pos):
+        """Return the 1-based column of ``pos`` within its line."""
+        return pos - self.starts[self.line(pos) - 1] + 1
+
+
+def excerpt(text, start, end):
+    """Return ``text[start:end]`` as a string, for showing to people, even if
+    ``text`` is a ``memoryview`` of UTF-8 bytes."""
+    piece = text[start:end]
+    if isinstance(piece, memoryview):
+        return piece.tobytes().decode('utf-8', 'replace')
+    return piece
+
+
 @python_2_unicode_compatible
 class Token(StrAndRepr):
     """A class to represent tokens, for use with TokenGrammars
@@ -0,0 +1,304 @@
+"""Reshape the bracket groups in files, or in a stream, without an editor
+
+::
+
+    python -m reshape --outline fixtures/ --in-place
+    some-command | python -m reshape --inline > flat.jsonl
+
+Every outermost bracket group that parses is inlined or outlined, just as
+the plugin would do it with the cursor inside; the rest of the text is left
+alone. Run it from this directory, or with it on ``PYTHONPATH``.
+
+Quotes count only inside bracket groups, where the grammar's strings are, and
+stray brackets in the rest of the text can throw off which groups are found,
+as they can for the plugin. Groups that don't parse are left as they are.
+
+"""
+from __future__ import print_function
+
+import argparse
+import io
+from itertools import groupby, islice
+from multiprocessing import Pool
+import os
+import sys
+
+from parsimonious.exceptions import ParseError, VisitationError
+
+from grammar import PAIRS, PARALLEL_SIZE, SPECIALS, render_parallel
+
+
+def _scan(text, depth=0, quote=None, pos=0):
+    """Yield ``(index, depth, quote)`` after each bracket that opens or closes
+    an outermost group in ``text``, starting from ``pos`` with the given
+    nesting ``depth`` and open ``quote`` character, if any, and finally the
+    ``depth`` and ``quote`` at the end of the text, with an index of None."""
+    search = SPECIALS.search
+    while True:
+        if quote:
+            close = text.find(quote, pos)
+            if close < 0:
+                break
+            pos = close + 1
+            quote = None
+        special = search(text, pos)
+        if special is None:
+            break
+        char = special.group()
+        pos = special.end()
+        if not depth:
+            if char in PAIRS:
+                depth = 1
+                yield special.start(), depth, quote
+        elif char in '"\'':
+            quote = char
+        elif char in PAIRS:
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+            if not depth:
+                yield pos, depth, quote
+    yield None, depth, quote
+
+
+def find_groups(text):
+    """Yield the start and (exclusive) end of each outermost bracket group in
+    ``text``."""
+    start = None
+    for index, depth, _ in _scan(text):
+        if index is None:
+            break
+        if depth:
+            start = index
+        else:
+            yield start, index
+
+
+# How many characters of an unfinished group to hold before giving up on it:
+SEGMENT_LIMIT = 1 << 22
+
+
+def segments(lines, limit=SEGMENT_LIMIT):
+    """Yield the concatenated ``lines`` in pieces, each ending at the end of
+    a line outside any bracket group, so that no group is split.
+
+    A piece still inside a group after ``limit`` characters, most likely
+    because of a stray opening bracket, is yielded as it is, and the lines
+    after it are taken to be outside any group. Its unfinished group is
+    then left unchanged, and the rest of the text is still reshaped.
+
+    """
+    pending = []
+    size = 0
+    depth, quote = 0, None
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        for _, depth, quote in _scan(line, depth, quote):
+            pass
+        if not depth or size > limit:
+            yield ''.join(pending)
+            pending = []
+            size = 0
+            depth, quote = 0, None
+    if pending:
+        yield ''.join(pending)
+
+
+def reshape_text(text, style, pool=None):
+    """Return ``text`` with each outermost bracket group that parses
+    rendered in ``style``, ``'inline'`` or ``'outline'``, and how many groups
+    there were.
+
+    :arg pool: A ``multiprocessing.Pool`` to render the elements of groups
+        of at least :data:`~grammar.PARALLEL_SIZE` characters in
+
+    """
+    pieces = []
+    done = 0
+    count = 0
+    for start, end in find_groups(text):
+        try:
+            rendered = render_parallel(text, style, start, end, pool=pool)
+        except (ParseError, VisitationError, RuntimeError):
+            # It doesn't parse, or is nested too deeply to parse or render
+            # by recursion; either way, one group shouldn't sink the rest.
+            continue
+        pieces.append(text[done:start])
+        pieces.append(rendered)
+        done = end
+        count += 1
+    pieces.append(text[done:])
+    return ''.join(pieces), count
+
+
+def reshape_file(args, pool=None):
+    """Reshape the file at ``path``, in a worker process, or, for a big
+    file, in this one with ``pool`` to render its big groups in.
+
+    Return the path, the reshaped text (or None if it was written back in
+    place), how many groups were reshaped, and an error message, if any.
+
+    """
+    path, style, in_place = args
+    try:
+        with io.open(path, encoding='utf-8', newline='') as file:
+            text = file.read()
+        reshaped, count = reshape_text(text, style, pool)
+        if in_place:
+            if reshaped != text:
+                with io.open(path, 'w', encoding='utf-8', newline='') as file:
+                    file.write(reshaped)
+            reshaped = None
+    except (IOError, OSError, UnicodeDecodeError) as error:
+        return path, None, 0, str(error)
+    return path, reshaped, count, None
+
+
+def _reshape_segment(args, pool=None):
+    """Reshape one segment of a stream, in a worker process, or, for a big
+    segment, in this one with ``pool`` to render its big groups in."""
+    text, style = args
+    return reshape_text(text, style, pool)
+
+
+def _file_size(args):
+    """Return the size, in bytes, which is at least its length in characters,
+    of the file :func:`reshape_file()` is to reshape, or 0 if there's no
+    telling, in which case it'll report the error."""
+    try:
+        return os.path.getsize(args[0])
+    except OSError:
+        return 0
+
+
+def _segment_size(args):
+    """Return the length of the segment :func:`_reshape_segment()` is to
+    reshape."""
+    return len(args[0])
+
+
+def walk(paths):
+    """Yield the files at or, recursively, under ``paths``, skipping hidden
+    directories and files."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories[:] = sorted(name for name in subdirectories
+                                       if not name.startswith('.'))
+            for name in sorted(files):
+                if not name.startswith('.'):
+                    yield os.path.join(directory, name)
+
+
+def _map(pool, function, items, chunksize, size=None):
+    """Map ``function`` over ``items`` in order, in ``pool`` if there is
+    one.
+
+    A worker can't farm out work of its own, so the items for which ``size``
+    returns at least :data:`~grammar.PARALLEL_SIZE`, which may hold groups
+    big enough to render in parallel, are done here instead, with ``pool``
+    passed to ``function`` to render them in.
+
+    """
+    if pool is None:
+        return (function(item) for item in items)
+    if size is None:
+        return pool.imap(function, items, chunksize)
+    return _map_sized(pool, function, items, chunksize, size)
+
+
+def _map_sized(pool, function, items, chunksize, size):
+    for big, run in groupby(items, lambda item: size(item) >= PARALLEL_SIZE):
+        if big:
+            for item in run:
+                yield function(item, pool)
+        else:
+            for result in pool.imap(function, run, chunksize):
+                yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m reshape',
+        description='Inline or outline the bracket groups in files or '
+                    'standard input.')
+    style = parser.add_mutually_exclusive_group(required=True)
+    style.add_argument('-i', '--inline', dest='style', action='store_const',
+                       const='inline', help='put each group on one line')
+    style.add_argument('-o', '--outline', dest='style', action='store_const',
+                       const='outline', help='put each element of each group '
+                                             'on a line of its own')
+    parser.add_argument('paths', nargs='*', metavar='PATH',
+                        help='files or directories to reshape; standard '
+                             'input if none, or "-"')
+    parser.add_argument('--in-place', action='store_true',
+                        help='rewrite the files rather than writing to '
+                             'standard output')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes; one per CPU by default, '
+                             '0 for none')
+    parser.add_argument('--batch', type=int, default=256,
+                        help='segments of standard input to have in hand at '
+                             'once (default: %(default)s)')
+    parser.add_argument('--segment-limit', type=int, default=SEGMENT_LIMIT,
+                        help='characters of standard input to hold while '
+                             'looking for the end of a group before leaving '
+                             'it as it is (default: %(default)s)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='report on each file to standard error')
+    options = parser.parse_args(argv)
+
+    paths = options.paths or ['-']
+    if '-' in paths and (len(paths) > 1 or options.in_place):
+        parser.error('standard input must be read alone and not in place')
+
+    output = io.open(sys.stdout.fileno(), 'w', encoding='utf-8', newline='',
+                     closefd=False)
+    pool = None if options.jobs == 0 else Pool(options.jobs)
+    failed = False
+    total = 0
+    try:
+        if paths == ['-']:
+            lines = io.open(sys.stdin.fileno(), encoding='utf-8', newline='',
+                            closefd=False)
+            pieces = segments(lines, options.segment_limit)
+            while True:
+                # Take the stream a batch at a time, so memory stays bounded.
+                batch = [(text, options.style)
+                         for text in islice(pieces, options.batch)]
+                if not batch:
+                    break
+                for text, count in _map(pool, _reshape_segment, batch, 16,
+                                        _segment_size):
+                    output.write(text)
+                    total += count
+                output.flush()
+        else:
+            jobs = ((path, options.style, options.in_place)
+                    for path in walk(paths))
+            for path, text, count, error in _map(pool, reshape_file, jobs,
+                                                 1, _file_size):
+                if error:
+                    failed = True
+                    print('%s: %s' % (path, error), file=sys.stderr)
+                    continue
+                if text is not None:
+                    output.write(text)
+                total += count
+                if options.verbose:
+                    print('%s: %s groups' % (path, count), file=sys.stderr)
+    finally:
+        output.flush()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if options.verbose:
+        print('%s groups reshaped' % total, file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
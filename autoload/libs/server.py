@@ -0,0 +1,135 @@
+r"""A reshape server, for Vim to run as a job and talk to over a JSON channel
+
+::
+
+    let job = job_start(['python3', 'server.py'], {'mode': 'json'})
+    call ch_sendexpr(job, {'id': 1, 'text': '[1, 2]', 'style': 'outline'},
+                   \ {'callback': 'Received'})
+
+Parsing a big region in Vim's own Python holds up the editor, and holds on to
+the memory; here it happens in another process, or several. Each request is
+a dict with the ``text`` of a bracketed region and the ``style`` to render it
+in, ``'inline'`` or ``'outline'``. The response is a dict with the rendered
+``text`` or, if the region doesn't parse, an ``error`` message, and the same
+``id`` as the request, if it had one. Lines that aren't requests get an
+``error`` response too, numbered 0 if they aren't numbered.
+
+Requests are handed to a pool of worker processes, each of which has the
+grammar compiled and ready from the start, so requests from several buffers
+are served at once, and a big one doesn't hold up the rest. Responses are
+sent as they're ready, so they may come back in a different order. The server
+stops when its standard input is closed, as it is when Vim quits.
+
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+from multiprocessing import Pool
+import sys
+from threading import Lock
+
+from six import integer_types, string_types
+
+from grammar import render_parallel
+
+
+def handle(request):
+    """Return the response to ``request``, a ``[number, dict]`` pair as Vim
+    sends it.
+
+    Anything else gets an ``error`` response, numbered like the request if
+    it starts with a number, or 0 if not; this never raises.
+
+    """
+    numbered = (isinstance(request, list) and len(request) > 0 and
+                isinstance(request[0], integer_types))
+    if not (numbered and len(request) == 2 and isinstance(request[1], dict)):
+        return [request[0] if numbered else 0,
+                {'error': 'Requests must be [number, dict] pairs, not %.60s' %
+                          json.dumps(request)}]
+    number = request[0]
+    request = request[1]
+    response = {}
+    if 'id' in request:
+        response['id'] = request['id']
+    if not isinstance(request.get('text'), string_types):
+        response['error'] = 'The request has no text.'
+        return [number, response]
+    try:
+        response['text'] = render_parallel(request['text'],
+                                           request.get('style', 'outline'))
+    except Exception as error:
+        # A ParseError's message goes on to excerpt the text; the first line
+        # says enough.
+        response['error'] = str(error).split('\n')[0]
+    return [number, response]
+
+
+class Responder(object):
+    """Something to write responses to ``output``, one JSON message per line,
+    from any thread"""
+
+    def __init__(self, output):
+        self.output = output
+        self.lock = Lock()
+
+    def __call__(self, response):
+        # Non-ASCII characters are escaped, so the encoding doesn't matter.
+        message = json.dumps(response) + '\n'
+        with self.lock:
+            self.output.write(message)
+            self.output.flush()
+
+
+def serve(input, output, workers=None):
+    """Answer the requests, one JSON message per line, in ``input``, writing
+    the responses to ``output``, until ``input`` ends.
+
+    :arg workers: How many worker processes to start. None means one per CPU.
+        0 means to handle the requests one at a time, in this process.
+
+    """
+    respond = Responder(output)
+    pool = None if workers == 0 else Pool(workers)
+    try:
+        for line in input:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                respond([0, {'error': 'Not JSON: %s' % error}])
+                continue
+            if pool is None:
+                respond(handle(request))
+            else:
+                pool.apply_async(handle, (request,), callback=respond)
+        if pool is not None:
+            # Let the requests in hand finish.
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python server.py',
+        description='Reshape bracket groups for Vim, over a JSON channel on '
+                    'standard input and output.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes; one per CPU by default, '
+                             '0 for none')
+    options = parser.parse_args(argv)
+    input = io.open(sys.stdin.fileno(), encoding='utf-8', closefd=False)
+    output = io.open(sys.stdout.fileno(), 'w', encoding='utf-8',
+                     closefd=False)
+    serve(input, output, options.jobs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
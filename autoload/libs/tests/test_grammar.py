@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+from multiprocessing import Pool
+from random import Random
+
+from nose.tools import eq_, ok_, assert_raises
+
+import grammar
+from grammar import (fast_parse, g, parse, render_element, render_parallel,
+                     token_parse, Visitor)
+from parsimonious import ParseError
+
+
+# Literals the grammar parses, some of them only just:
+VALID = ['()', '[]', '{}', '(  )', '(a,\n)', '(foo, bar, baz,)',
+         '([], {}, (),)', '{a:(b,c),}', '("k" = 1, "v")', '(a = f(x), -1)',
+         "('a\nb', \"c'\")", '{1a: b}', '{1.5.3: x}', '(-1, .5, 1.)',
+         "{ 'bim': boo, hi: [there, jim]}",
+         '(foo,bar=baz,[bim,bloo],what={is:this})', '[foo.bar(x)]',
+         '{"a]": "(", \'}\': \'"\'}', '(\t a \r\n)']
+# And ones it doesn't:
+INVALID = ['', '(', ')', '(]', '[{(}])', '(a,)]', '(a, , b)', '(a: )',
+           '(a=b=c)', '(a: b: c)', '[f(x)(y)]', '["x]', ' (a)', '(a) ',
+           '(a # b)', '(1(x))', '("a"(x))', '(foo (x))', '[f ()]', '(1a)',
+           '(123abc)', '(1.2.3)', '(12(x))', '(,)', '(a b)', '("a" "b")',
+           "('a)"]
+
+
+def reference(text, pos=0, endpos=None):
+    """Return the inline and outline renderings of the tree that :data:`g`
+    and :class:`Visitor` make of ``text[pos:endpos]``, or None if it doesn't
+    parse."""
+    try:
+        tree = Visitor().visit(g.parse(text, pos=pos, endpos=endpos))
+    except ParseError:
+        return None
+    return tree.inline(), tree.outline()
+
+
+def renderings(tree):
+    return None if tree is None else (tree.inline(), tree.outline())
+
+
+def random_literal(random, depth=0):
+    """Return a random literal that's likely to parse, built of the parts the
+    grammar knows."""
+    def space():
+        return random.choice(['', '', ' ', '\n  ', '\t'])
+
+    def atom():
+        choice = random.random()
+        if choice < 0.2:
+            return random.choice(['1', '2.5', '3.', '007'])
+        if choice < 0.35:
+            return random.choice(['"s t"', "'q'", '""', '"a\nb"', '"(]"',
+                                  "'\"'", '"{\'"'])
+        if choice < 0.5 and depth < 4:
+            return random_literal(random, depth + 1)
+        if choice < 0.6 and depth < 4:
+            return (random.choice(['f', 'a.b', 'x1']) +
+                    random_literal(random, depth + 1))
+        return random.choice(['a', 'foo', 'x.y', '-z', 'a-1', '_'])
+
+    def element():
+        if random.random() < 0.3:
+            return (random.choice(['"k"', "'k'", 'k', '1a', 'x.y']) +
+                    space() + random.choice('=:') + space() + atom())
+        return atom()
+
+    opener = random.choice('([{')
+    elements = [element() for _ in range(random.randint(0, 4))]
+    body = (space() + ',' + space()).join(elements)
+    if elements and random.random() < 0.3:
+        body += ','
+    return opener + space() + body + space() + grammar.PAIRS[opener]
+
+
+def random_soup(random):
+    """Return a random string of the grammar's pieces, which will mostly not
+    parse."""
+    pieces = ['(', ')', '[', ']', '{', '}', ',', ' ', '\n', ':', '=', '"',
+              "'", 'a', 'b1', '1', '2.5', '.', '-', 'f(', 'x']
+    return (random.choice('([{') +
+            ''.join(random.choice(pieces)
+                    for _ in range(random.randint(0, 14))) +
+            random.choice(')]}'))
+
+
+def test_fast_parse():
+    """The fast parser should make the trees :data:`g` and :class:`Visitor`
+    do, and turn down what they do."""
+    for text in VALID:
+        ok_(reference(text) is not None, text)
+        eq_(renderings(fast_parse(text)), reference(text))
+    for text in INVALID:
+        eq_(reference(text), None)
+        eq_(fast_parse(text), None)
+
+
+def test_fast_parse_in_text():
+    """Parsing a literal within a longer text should give the same tree as
+    parsing it alone."""
+    for text in VALID + INVALID:
+        surrounded = 'x = ' + text + ' # (y)'
+        eq_(renderings(fast_parse(surrounded, 4, 4 + len(text))),
+            reference(text))
+
+
+def test_fast_parse_nested():
+    random = Random(1)
+    # As deep as the general parser can go at the default recursion limit:
+    nested = 'a'
+    for depth in range(30):
+        opener = '([{'[depth % 3]
+        nested = '%s%s, f(%s)%s' % (opener, random_literal(random), nested,
+                                    grammar.PAIRS[opener])
+    ok_(reference(nested) is not None)
+    eq_(renderings(fast_parse(nested)), reference(nested))
+    # Too deep to parse by recursion isn't an error, just a job for the
+    # general parser:
+    eq_(fast_parse('[' * 5000 + ']' * 5000), None)
+
+
+def test_fast_parse_random():
+    random = Random(0)
+    parsed = 0
+    for _ in range(3000):
+        for text in random_literal(random), random_soup(random):
+            expected = reference(text)
+            eq_(renderings(fast_parse(text)), expected)
+            parsed += expected is not None
+    ok_(parsed > 3000)
+
+
+def test_token_parse():
+    """The token parser should make the trees :func:`parse` does, and turn
+    down what the grammar does, wherever the literal is in the text."""
+    for text in VALID + INVALID:
+        expected = reference(text)
+        eq_(renderings(token_parse(text)), expected)
+        eq_(renderings(token_parse('x = ' + text + ' # (y)', 4,
+                                   4 + len(text))),
+            expected)
+        if expected is not None:
+            eq_(renderings(token_parse(text)), renderings(parse(text)))
+
+
+def test_token_parse_strings():
+    """Brackets and quotes in strings shouldn't be taken for tokens of their
+    own."""
+    for text in ['{"a]": "(", \'}\': \'"\'}', '("(]", \'"\')',
+                 "[')', \"'\", f('{', \"[\")]", '{"k": "a, b = c"}',
+                 '("a" = "]", x = "\'(")', '["(", \'[\', "{"]']:
+        eq_(renderings(token_parse(text)), renderings(parse(text)))
+        ok_(reference(text) is not None, text)
+    for text in ['("(]")]', '["]"', "('a\")", '("a\')']:
+        eq_((token_parse(text), reference(text)), (None, None))
+
+
+def test_token_parse_random():
+    random = Random(2)
+    for _ in range(1000):
+        for text in random_literal(random), random_soup(random):
+            eq_(renderings(token_parse(text)), reference(text))
+    nested = 'a'
+    for depth in range(30):
+        opener = '([{'[depth % 3]
+        nested = '%s%s, f(%s)%s' % (opener, random_literal(random), nested,
+                                    grammar.PAIRS[opener])
+    eq_(renderings(token_parse(nested)), reference(nested))
+
+
+def test_render_element():
+    """An element should render as it would in place."""
+    eq_(render_element(('a=f(x, y)', '(', ')', 'outline')),
+        'a=f(\n        x,\n        y,\n    )')
+    eq_(render_element(('a=f(x, y)', '(', ')', 'inline')), 'a=f(x, y)')
+    eq_(render_element(('a, b', '(', ')', 'inline')), None)
+    eq_(render_element(('(a', '(', ')', 'inline')), None)
+
+
+def test_render_parallel():
+    """Rendering in a pool should give just what rendering in this process
+    does."""
+    texts = ['(%s)' % ', '.join('"k%s": [x, f(y, z=2)]' % i
+                                for i in range(50)),
+             '[a, (b, [c, {d: e}]),]',
+             '{"a,b": "(", \'c\': ")"}',
+             '(a, (b, c)',  # Doesn't split, so goes the serial way
+             '[1, ,2]']  # Splits, but doesn't parse element by element
+    pool = Pool(2)
+    old_size = grammar.PARALLEL_SIZE
+    grammar.PARALLEL_SIZE = 0
+    try:
+        for text in texts:
+            for style in ('inline', 'outline'):
+                try:
+                    expected = getattr(grammar.Visitor().parse(text), style)()
+                except ParseError:
+                    assert_raises(ParseError, render_parallel, text, style,
+                                  pool=pool)
+                else:
+                    eq_(render_parallel(text, style, pool=pool, chunksize=7),
+                        expected)
+                    eq_(render_parallel(text, style), expected)
+    finally:
+        grammar.PARALLEL_SIZE = old_size
+        pool.terminate()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import io
+from multiprocessing import Pool
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from nose.tools import eq_, ok_
+
+from grammar import PARALLEL_SIZE
+from reshape import _map, _scan, find_groups, reshape_text, segments
+
+
+LIBS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reshape(args, input=''):
+    """Run the reshaper with ``args``, feeding it ``input``, and return its
+    exit status, standard output, and standard error."""
+    process = subprocess.Popen([sys.executable, '-m', 'reshape'] + args,
+                               cwd=LIBS, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, errors = process.communicate(input.encode('utf-8'))
+    return (process.returncode, output.decode('utf-8'),
+            errors.decode('utf-8'))
+
+
+def test_scan():
+    """Only the brackets of outermost groups should be reported, and quotes
+    should count only inside groups."""
+    eq_(list(_scan('a (b [c]) "d" {e}')),
+        [(2, 1, None), (9, 0, None), (14, 1, None), (17, 0, None),
+         (None, 0, None)])
+    eq_(list(_scan('x("a)", \'b(\')')),
+        [(1, 1, None), (13, 0, None), (None, 0, None)])
+    # Picking up where a line left off:
+    eq_(list(_scan('(a, "b')), [(0, 1, None), (None, 1, '"')])
+    eq_(list(_scan('c", d)', 1, '"')), [(6, 0, None), (None, 0, None)])
+
+
+def test_find_groups():
+    text = 'f(a, g(b)) + [1, "]"]\n{x: (y)}'
+    eq_([text[start:end] for start, end in find_groups(text)],
+        ['(a, g(b))', '[1, "]"]', '{x: (y)}'])
+    eq_(list(find_groups('no groups')), [])
+    eq_(list(find_groups('(unclosed')), [])
+
+
+def test_segments():
+    """Segments should end only at line ends outside groups."""
+    lines = ['a = 1\n', 'b = [1,\n', '  "]\n', ' ",\n', '  2]\n', 'c = (\n']
+    eq_(list(segments(lines)),
+        ['a = 1\n', 'b = [1,\n  "]\n ",\n  2]\n', 'c = (\n'])
+
+
+def test_segments_limit():
+    """A segment held open too long by an unclosed bracket should be let go,
+    and scanning begun afresh."""
+    lines = ['a = (1,\n', '  "\n', 'b = [1,\n', ' 2]\n', 'c = [3,\n', ' 4]\n']
+    eq_(list(segments(lines, 12)),
+        ['a = (1,\n  "\nb = [1,\n', ' 2]\n', 'c = [3,\n 4]\n'])
+
+
+def test_reshape_text():
+    text = 'x = [1, 2] # "not reshaped\ny = f(a=(b, c),\n      d)\n'
+    eq_(reshape_text(text, 'inline'), (text.replace(',\n      ', ', '), 2))
+    eq_(reshape_text('x = [1, 2]', 'outline'),
+        ('x = [\n    1,\n    2,\n]', 1))
+
+
+def test_reshape_text_errors():
+    """Groups that don't parse, or are too deep to, should be left alone,
+    without stopping the others being reshaped."""
+    deep = '[' * 5000 + ']' * 5000
+    text = 'a = [1, ,2]\nb = %s\nc = (x,\n y)' % deep
+    eq_(reshape_text(text, 'inline'),
+        ('a = [1, ,2]\nb = %s\nc = (x, y)' % deep, 1))
+
+
+def test_main_stdin():
+    """Standard input should be reshaped a batch of segments at a time, and
+    give the same result however it's batched and farmed out."""
+    lines = ['x = [%s,\n    %s]\n' % (i, i + 1) for i in range(20)]
+    lines.insert(5, 'y = ("unclosed,\n')
+    lines.insert(9, 'z = "(",\n')
+    text = ''.join(lines)
+    expected = reshape_text(text, 'inline')[0]
+    for args in (['-j', '0'], ['-j', '0', '--batch', '1'],
+                 ['-j', '2', '--batch', '3'], ['-j', '0', '-']):
+        eq_(reshape(['--inline'] + args, text), (0, expected, ''))
+
+
+def test_main_stdin_unclosed():
+    """An unclosed bracket on standard input should be left alone, without
+    stopping the groups after it being reshaped."""
+    text = 'a = f(1,\n' + 'b = [1,\n 2]\n' * 10
+    status, output, errors = reshape(['-i', '-j', '0', '--segment-limit',
+                                      '40'], text)
+    eq_((status, errors), (0, ''))
+    eq_(output.splitlines()[0], 'a = f(1,')
+    eq_(output.splitlines()[-3:], ['b = [1, 2]'] * 3)
+
+
+def where(item, pool=None):
+    """Return the name of ``item``, whether it was given a pool, and the ID
+    of the process it's done in."""
+    return item[0], pool is not None, os.getpid()
+
+
+def test_map_big_items():
+    """Items big enough to hold groups worth rendering in parallel should be
+    done in this process, with the pool to render them in, and the rest in
+    the pool, all in order."""
+    pool = Pool(2)
+    try:
+        items = [('a', 1), ('b', PARALLEL_SIZE), ('c', 2), ('d', 3),
+                 ('e', PARALLEL_SIZE + 1)]
+        done = list(_map(pool, where, items, 1, lambda item: item[1]))
+    finally:
+        pool.terminate()
+        pool.join()
+    eq_([(name, pooled, pid == os.getpid())
+         for name, pooled, pid in done],
+        [('a', False, False), ('b', True, True), ('c', False, False),
+         ('d', False, False), ('e', True, True)])
+
+
+def test_main_big_group():
+    """A group big enough to render in parallel should come out just as it
+    would in this process, from standard input or a file."""
+    text = 'x = [%s]\n' % ',\n    '.join(str(i)
+                                        for i in range(PARALLEL_SIZE // 6))
+    ok_(len(text) > PARALLEL_SIZE)
+    expected = reshape_text(text, 'inline')
+    eq_(expected[1], 1)
+    eq_(reshape(['--inline', '-j', '2'], text), (0, expected[0], ''))
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'big.py')
+        with io.open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        eq_(reshape(['--inline', '-j', '2', path]), (0, expected[0], ''))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_main_files():
+    """Files should be written out in order, or rewritten in place, with any
+    that can't be read reported."""
+    directory = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(directory, 'sub'))
+        contents = {'a.py': u'a = [1,\n 2]\n',
+                    os.path.join('sub', 'b.py'): u'b = {"é": (1,\n 2)}\n',
+                    '.hidden': u'h = [1,\n 2]\n'}
+        for name, content in contents.items():
+            with io.open(os.path.join(directory, name), 'w',
+                         encoding='utf-8') as file:
+                file.write(content)
+        missing = os.path.join(directory, 'missing.py')
+
+        status, output, errors = reshape(['-i', '-j', '0', directory,
+                                          missing])
+        eq_(status, 1)
+        eq_(output, u'a = [1, 2]\nb = {"é": (1, 2)}\n')
+        eq_([line.split(':')[0] for line in errors.splitlines()],
+            [missing])
+
+        status, output, errors = reshape(['-i', '--in-place', '-j', '2',
+                                          '-v', directory])
+        eq_((status, output), (0, ''))
+        eq_(errors.splitlines()[-1], '2 groups reshaped')
+        for name, expected in [('a.py', u'a = [1, 2]\n'),
+                               (os.path.join('sub', 'b.py'),
+                                u'b = {"é": (1, 2)}\n'),
+                               ('.hidden', contents['.hidden'])]:
+            with io.open(os.path.join(directory, name),
+                         encoding='utf-8') as file:
+                eq_(file.read(), expected)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_main_stdin_in_place():
+    """Standard input can't be rewritten in place."""
+    status, output, errors = reshape(['-i', '--in-place'])
+    eq_(status, 2)
+    eq_(output, '')
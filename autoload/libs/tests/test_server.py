@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+from nose.tools import eq_, ok_
+
+from server import handle, serve
+
+
+def served(lines, workers=0):
+    """Serve the requests in ``lines``, and return the responses, in order
+    of their numbers."""
+    output = io.StringIO()
+    serve(io.StringIO(u''.join(line + u'\n' for line in lines)), output,
+          workers)
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    return sorted(responses, key=lambda response: response[0])
+
+
+def test_handle():
+    eq_(handle([1, {'id': 7, 'text': '[1, 2]', 'style': 'outline'}]),
+        [1, {'id': 7, 'text': '[\n    1,\n    2,\n]'}])
+    eq_(handle([2, {'text': '(a,\n b)', 'style': 'inline'}]),
+        [2, {'text': '(a, b)'}])
+    # Outlining is the default:
+    eq_(handle([3, {'text': '(a)'}]), [3, {'text': '(\n    a,\n)'}])
+
+
+def test_handle_errors():
+    """Bad regions and bad requests should get error responses, numbered
+    like the requests where they can be."""
+    number, response = handle([1, {'id': 7, 'text': '[1, ,2]'}])
+    eq_((number, response['id']), (1, 7))
+    ok_(response['error'].startswith("Rule 'expr' didn't match"))
+    ok_('\n' not in response['error'])
+
+    eq_(handle([2, {'id': 8}]), [2, {'id': 8,
+                                     'error': 'The request has no text.'}])
+    eq_(handle([3, {'text': 5}])[1]['error'], 'The request has no text.')
+    for request, number in [([4, 'text'], 4), ([5], 5), ([5, {}, {}], 5),
+                            ({'text': '[]'}, 0), (['x', {}], 0), (None, 0),
+                            ([], 0)]:
+        response = handle(request)
+        eq_(response[0], number)
+        ok_(response[1]['error'].startswith('Requests must be [number, dict] '
+                                            'pairs, not '))
+
+
+def test_serve():
+    """Each request should be answered, even the ones that aren't JSON, and
+    blank lines skipped."""
+    lines = [json.dumps([1, {'id': 1, 'text': '[a,\n b]', 'style': 'inline'}]),
+             u'',
+             u'[2, {"id": 2, "text": "(a)"',
+             json.dumps([3, 'text']),
+             json.dumps([4, {'id': 4, 'text': '(a)'}])]
+    responses = served(lines)
+    eq_(responses[0], [0, {'error': responses[0][1]['error']}])
+    ok_(responses[0][1]['error'].startswith('Not JSON: '))
+    eq_(responses[1], [1, {'id': 1, 'text': '[a, b]'}])
+    eq_(responses[2][0], 3)
+    ok_('error' in responses[2][1])
+    eq_(responses[3], [4, {'id': 4, 'text': '(\n    a,\n)'}])
+
+
+def test_serve_in_pool():
+    """A pool of workers should answer just as this process does."""
+    lines = [json.dumps([i, {'id': i, 'text': '[%s, x]' % i}])
+             for i in range(1, 20)] + [u'{', json.dumps([20, 'text'])]
+    eq_(served(lines, workers=2), served(lines))
@@ -3,14 +3,28 @@ Remember: when accessing a thing in a buffer, the rows are 1-indexed
 and the columns are 0-indexed.
 """
 
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import count
+from threading import Lock, Thread
+from time import strftime
+from timeit import default_timer
 import vim
 import sys
 import os
 
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
 libs = os.path.join(vim.eval('expand(s:plugin_path)'), 'libs')
 sys.path.insert(0, libs)
 
 import grammar  # noqa: E402
+from parsimonious.exceptions import ParseError, VisitationError  # noqa: E402
+from reshape import find_groups  # noqa: E402
 
 
 DELIMITERS = {
@@ -54,22 +68,20 @@ def get_next_char(buffer, row, col):
     return get_char_at(buffer, row, col), row, col
 
 
-def get_text_between(buffer, start_row, start_col, end_row, end_col):
-    ret = []
-    row = start_row
-    col = start_col
-    try:
-        char = get_char_at(buffer, row, col)
-    except IndexError:
-        return ''
-    while char is not None:
-        ret.append(char)
-        char, row, col = get_next_char(buffer, row, col)
-        excessive_row = row is not None and row > end_row
-        excessive_col = col is not None and col > end_col
-        if excessive_row or excessive_col:
-            break
-    return ''.join(ret)
+def get_region(buffer, start_row, start_col, end_row, end_col):
+    """Return the lines from ``start_row`` to ``end_row`` as one string, with
+    the start and (exclusive) end of the region from one position to another,
+    both inclusive, within it.
+
+    Parse the region with ``pos`` and ``endpos`` rather than slicing it out of
+    the string: that's one less copy of it.
+
+    """
+    if start_row == end_row:
+        return buffer[start_row - 1], start_col, end_col + 1
+    lines = buffer[start_row - 1:end_row]
+    text = '\n'.join(lines)
+    return text, start_col, len(text) - len(lines[-1]) + end_col + 1
 
 
 def _find_delimiter(
@@ -118,26 +130,510 @@ def find_closing_delimiter(buffer, row, col):
     )
 
 
-buffer = vim.current.buffer
-row, col = vim.current.window.cursor
-opening_triple = find_opening_delimiter(buffer, row, col)
-closing_triple = find_closing_delimiter(buffer, row, col)
-
-# Get characters in range
-_, start_row, start_col = opening_triple
-_, end_row, end_col = closing_triple
-
-if start_row is None or end_row is None:
-    print("No surrounding characters.")
-else:
-    text = get_text_between(buffer, start_row, start_col, end_row, end_col)
-    tree = grammar.Visitor().parse(text)
-    # TODO: Inline or outline, as appropriate:
-    replacement_text = tree.outline()
-    char, row, col = opening_triple
-    # TODO: Save the values of these and recover them at the end of this
-    # operation:
-    vim.command("setl noai nocin nosi inde=")
-    vim.command("call cursor({}, {})".format(row, col + 1))
-    vim.command("normal da{}".format(char))
-    vim.command("normal a{}".format(replacement_text))
+def replace_text_between(buffer, start_row, start_col, end_row, end_col,
+                         text):
+    """Replace the text from one position to another, both inclusive, with
+    ``text``, writing all the affected lines at once."""
+    lines = text.split('\n')
+    lines[0] = buffer[start_row - 1][:start_col] + lines[0]
+    lines[-1] += buffer[end_row - 1][end_col + 1:]
+    buffer[start_row - 1:end_row] = lines
+
+
+@contextmanager
+def phase(phases, name):
+    """Time the enclosed phase of a reshape, appending ``(name, seconds, kb)``
+    to ``phases``, unless that's None.
+
+    ``kb`` is the most memory the phase allocated at once, if tracemalloc is
+    tracing, or None otherwise.
+
+    """
+    if phases is None:
+        yield
+        return
+    tracing = tracemalloc is not None and tracemalloc.is_tracing()
+    if tracing:
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = default_timer()
+    try:
+        yield
+    finally:
+        seconds = default_timer() - start
+        kb = None
+        if tracing:
+            kb = (tracemalloc.get_traced_memory()[1] - before) / 1024.0
+        phases.append((name, seconds, kb))
+
+
+def locate(buffer, row, col):
+    """Return the start row and column and the end row and column of the
+    innermost braces around ``row`` and ``col``, or None if there are none.
+
+    A brace at ``row`` and ``col`` counts as around it, so that, with the
+    cursor left on the opening brace of the braces just reshaped, they can
+    be reshaped again.
+
+    """
+    char = buffer[row - 1][col:col + 1]
+    if char in OPENING_DELIMITERS:
+        start_row, start_col = row, col
+    else:
+        _, start_row, start_col = find_opening_delimiter(buffer, row, col)
+    if char in CLOSING_DELIMITERS:
+        end_row, end_col = row, col
+    else:
+        _, end_row, end_col = find_closing_delimiter(buffer, row, col)
+    if start_row is None or end_row is None:
+        return None
+    return start_row, start_col, end_row, end_col
+
+
+def region_key(text, pos, endpos):
+    """Return a key for the region of ``text`` from ``pos`` to ``endpos``,
+    made of its length and a sample of at most 64 of its characters, evenly
+    spaced, so it costs the same however long the region is.
+
+    Different regions can have the same key, so compare them before taking
+    them for the same.
+
+    """
+    length = endpos - pos
+    return length, text[pos:endpos:max((length + 63) // 64, 1)]
+
+
+class TreeCache(object):
+    """The trees of the regions most recently reshaped, and what they were
+    rendered as, by their text
+
+    Toggling a region back and forth, the same text comes up again and again;
+    its tree is looked up here rather than parsed again, and its rendering in
+    each style rather than rendered again. What a region is rendered as is
+    remembered as a region too, of the same tree, since parsing it would give
+    one that renders the same: so reshaping the braces back the way they
+    were, or the same way again, is a hit.
+
+    Regions are keyed by :func:`region_key()`, which neither copies a region
+    nor reads all of it, and then compared whole, so a collision can't give
+    the wrong tree. When there are more than ``entries`` regions, or they
+    come to more than ``size`` characters, the least recently used are
+    forgotten.
+
+    """
+    def __init__(self, entries, size):
+        self.entries = entries
+        self.size = size
+        self.trees = OrderedDict()
+        self.characters = 0
+        self.hits = 0
+        self.misses = 0
+        # Trees are looked up and stored from worker threads, too:
+        self.lock = Lock()
+
+    def get(self, text, pos=0, endpos=None):
+        """Return the tree of the region of ``text`` from ``pos`` to
+        ``endpos`` and a dict of its renderings by style, or None if it
+        isn't cached."""
+        if endpos is None:
+            endpos = len(text)
+        key = region_key(text, pos, endpos)
+        with self.lock:
+            entry = self.trees.pop(key, None)
+            if entry is None or not (len(entry[0]) == endpos - pos and
+                                     text.startswith(entry[0], pos, endpos)):
+                if entry is not None:
+                    self.characters -= len(entry[0])
+                self.misses += 1
+                return None
+            # Move it to the most recently used end.
+            self.trees[key] = entry
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, region, tree, renderings):
+        """Remember ``tree`` as the tree of ``region``, and ``renderings`` as
+        the dict of its renderings by style, to which more may be added."""
+        if len(region) > self.size or not self.entries:
+            return
+        key = region_key(region, 0, len(region))
+        with self.lock:
+            old = self.trees.pop(key, None)
+            if old is not None:
+                self.characters -= len(old[0])
+            self.trees[key] = region, tree, renderings
+            self.characters += len(region)
+            while (len(self.trees) > self.entries or
+                   self.characters > self.size):
+                _, (old_region, _, _) = self.trees.popitem(last=False)
+                self.characters -= len(old_region)
+
+    def clear(self):
+        with self.lock:
+            self.trees.clear()
+            self.characters = self.hits = self.misses = 0
+
+    def stats(self):
+        """Return a description of how full the cache is and how well it's
+        doing."""
+        lookups = self.hits + self.misses
+        return ('%d hits, %d misses (%.0f%% hit rate); %d of %d entries, '
+                '%d of %d characters' % (
+                    self.hits, self.misses,
+                    100.0 * self.hits / lookups if lookups else 0,
+                    len(self.trees), self.entries, self.characters,
+                    self.size))
+
+
+cache = TreeCache(
+    int(vim.eval("get(g:, 'orthodontics_cache_entries', 32)")),
+    int(vim.eval("get(g:, 'orthodontics_cache_size', 1000000)")))
+
+
+def render(text, pos, endpos, style, phases=None):
+    """Return the braces from ``pos`` to ``endpos`` in ``text`` reshaped in
+    ``style``, ``'inline'`` or ``'outline'``, parsing them only if their
+    tree isn't in the :data:`cache`, and then the fast way, if possible (see
+    :func:`grammar.fast_parse()`), and rendering them only if they haven't
+    been in that style already.
+
+    This touches nothing of Vim's, so it's safe to call from any thread.
+
+    """
+    with phase(phases, 'lookup'):
+        cached = cache.get(text, pos, endpos)
+    if cached is None:
+        node = None
+        with phase(phases, 'parse'):
+            tree = grammar.fast_parse(text, pos, endpos)
+            if tree is None:
+                # Let the general parser have a go, or explain why not.
+                node = grammar.g.parse(text, pos=pos, endpos=endpos)
+        if node is not None:
+            with phase(phases, 'visit'):
+                tree = grammar.Visitor().visit(node)
+        renderings = {}
+        cache.put(text[pos:endpos], tree, renderings)
+    else:
+        tree, renderings = cached
+    rendered = renderings.get(style)
+    if rendered is None:
+        with phase(phases, 'render'):
+            rendered = renderings[style] = getattr(tree, style)()
+        cache.put(rendered, tree, renderings)
+    return rendered
+
+
+def choose_style(region, style):
+    """Return ``style``, unless it's ``'toggle'``; then, the style to toggle
+    the braces in ``region`` to, as :func:`locate()` gives it: ``'inline'``
+    if they span several lines, and ``'outline'`` if they're on one."""
+    if style != 'toggle':
+        return style
+    start_row, _, end_row, _ = region
+    return 'inline' if start_row != end_row else 'outline'
+
+
+def reshape(buffer, row, col, phases=None, style='outline'):
+    """Reshape the innermost braces around ``row`` and ``col`` in ``style``,
+    ``'inline'``, ``'outline'`` or ``'toggle'`` (see :func:`choose_style()`).
+
+    Return the row and column of the opening brace, or None if there are no
+    braces around.
+
+    :arg phases: A list to which to append the name and duration of each
+        phase of the work, or None
+
+    """
+    with phase(phases, 'search'):
+        region = locate(buffer, row, col)
+    if region is None:
+        return None
+
+    style = choose_style(region, style)
+    with phase(phases, 'extract'):
+        text, pos, endpos = get_region(buffer, *region)
+    replacement_text = render(text, pos, endpos, style, phases)
+    with phase(phases, 'write'):
+        replace_text_between(buffer, *(region + (replacement_text,)))
+    return region[:2]
+
+
+def reshape_at_cursor(phases=None, style='outline'):
+    """Reshape the innermost braces around the cursor, and move the cursor to
+    the opening one.
+
+    Return whether there were any braces to reshape.
+
+    """
+    row, col = vim.current.window.cursor
+    start = reshape(vim.current.buffer, row, col, phases=phases, style=style)
+    if start is None:
+        print("No surrounding characters.")
+        return False
+    vim.current.window.cursor = start
+    return True
+
+
+def reshape_lines(buffer, first, last, style):
+    """Reshape, in ``style``, every outermost group of braces in the lines
+    from ``first`` to ``last``, inclusive, that parses.
+
+    The groups are found in one pass over the lines (see
+    :func:`reshape.find_groups()`) and each is parsed once. The replacements
+    are written from the bottom up, so the positions of the groups above stay
+    put, and, being made by one command, are undone in one step.
+
+    Return how many groups were reshaped.
+
+    """
+    lines = buffer[first - 1:last]
+    text = '\n'.join(lines)
+    # The offset in ``text`` of the start of each line:
+    starts = [0]
+    for line in lines[:-1]:
+        starts.append(starts[-1] + len(line) + 1)
+
+    def position(offset):
+        index = bisect_right(starts, offset) - 1
+        return first + index, offset - starts[index]
+
+    replacements = []
+    for start, end in find_groups(text):
+        try:
+            rendered = render(text, start, end, style)
+        except (ParseError, VisitationError, RuntimeError):
+            # It doesn't parse, or is nested too deeply to parse or render
+            # by recursion. Either way, leave it be: this runs on saving, and
+            # one group shouldn't stop the rest, or the write.
+            continue
+        replacements.append(position(start) + position(end - 1) +
+                            (rendered,))
+    for replacement in reversed(replacements):
+        replace_text_between(buffer, *replacement)
+    return len(replacements)
+
+
+def reshape_range(first, last, style):
+    """Reshape the groups of braces in the lines from ``first`` to ``last``
+    of the current buffer, reporting how many there were."""
+    count = reshape_lines(vim.current.buffer, first, last, style)
+    print("Reshaped %d group%s." % (count, '' if count == 1 else 's'))
+
+
+class Job(object):
+    """A reshape of a snapshot of a region, running on a worker thread
+
+    The result is applied, by :func:`poll()`, only if the buffer hasn't
+    changed since the snapshot was taken: if its ``b:changedtick`` is the
+    same.
+
+    """
+    def __init__(self, buffer_number, tick, region, style):
+        self.buffer_number = buffer_number
+        self.tick = tick
+        self.region = region
+        self.style = style
+        self.result = None
+        self.error = None
+        self.started = default_timer()
+        self.thread = None
+
+    def start(self, text, pos, endpos):
+        """Start reshaping the braces from ``pos`` to ``endpos`` in ``text``.
+
+        Return whether the reshape could be started.
+
+        """
+        self.thread = Thread(target=self.run, args=(text, pos, endpos))
+        # Don't hold up quitting Vim:
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def run(self, text, pos, endpos):
+        try:
+            self.result = render(text, pos, endpos, self.style)
+        except Exception as error:
+            self.error = error
+
+
+class ServerJob(Job):
+    """A reshape of a snapshot of a region, running in the reshape server
+    (see ``libs/server.py``), which answers through :func:`received()`"""
+
+    _ids = count()
+
+    def start(self, text, pos, endpos):
+        self.id = next(self._ids)
+        send = vim.Function('orthodontics#SendToServer')
+        return bool(send({'id': self.id, 'text': text[pos:endpos],
+                          'style': self.style}))
+
+    def running(self):
+        return self.result is None and self.error is None
+
+
+# The running Jobs, by buffer number:
+jobs = {}
+
+
+def echo(message):
+    """Show ``message`` without adding it to the message history."""
+    vim.command("redraw | echo '%s'" % message.replace("'", "''"))
+
+
+def reshape_async_at_cursor(style):
+    """Reshape the innermost braces around the cursor in ``style`` (see
+    :func:`reshape()`), on a worker thread if the region is big, and move
+    the cursor to the opening one when done.
+
+    Regions shorter than ``g:orthodontics_async_threshold`` characters
+    (default 20000), and all regions in Vims without timers, are reshaped
+    right away. If ``g:orthodontics_server`` is set, big regions are sent
+    to the reshape server instead, which is started if need be; if it
+    can't be, they go to a worker thread after all.
+
+    """
+    buffer = vim.current.buffer
+    threshold = int(vim.eval(
+        "get(g:, 'orthodontics_async_threshold', 20000)"))
+    if buffer.number in jobs:
+        print("Already reshaping in this buffer; :OrthoCancel to stop.")
+        return
+    row, col = vim.current.window.cursor
+    region = locate(buffer, row, col)
+    if region is None:
+        print("No surrounding characters.")
+        return
+    style = choose_style(region, style)
+    text, pos, endpos = get_region(buffer, *region)
+    if endpos - pos < threshold or not int(vim.eval("has('timers')")):
+        replace_text_between(buffer, *(region + (render(
+            text, pos, endpos, style),)))
+        vim.current.window.cursor = region[:2]
+        return
+
+    tick = int(vim.eval('b:changedtick'))
+    job = None
+    if int(vim.eval("get(g:, 'orthodontics_server', 0)")):
+        job = ServerJob(buffer.number, tick, region, style)
+        if not job.start(text, pos, endpos):
+            job = None
+    if job is None:
+        job = Job(buffer.number, tick, region, style)
+        job.start(text, pos, endpos)
+    jobs[buffer.number] = job
+    vim.command('call orthodontics#StartPolling()')
+
+
+def poll():
+    """Apply the results of any finished Jobs, and show the progress of the
+    rest.
+
+    Return whether any are still running.
+
+    """
+    for number, job in list(jobs.items()):
+        if job.running():
+            continue
+        del jobs[number]
+        finish(job)
+    if jobs:
+        seconds = default_timer() - min(job.started
+                                        for job in jobs.values())
+        if seconds >= 0.5:
+            echo('Reshaping... %.0fs (:OrthoCancel to stop)' % seconds)
+    return bool(jobs)
+
+
+def received(response):
+    """Take a ``response`` from the reshape server, and apply it if the Job
+    it's for hasn't been cancelled."""
+    for job in jobs.values():
+        if getattr(job, 'id', None) == int(response['id']):
+            if 'error' in response:
+                job.error = response['error']
+            else:
+                job.result = response['text']
+    poll()
+
+
+def server_closed():
+    """Fail the Jobs still waiting on the reshape server, which has
+    stopped."""
+    for job in jobs.values():
+        if isinstance(job, ServerJob) and job.running():
+            job.error = 'the reshape server stopped'
+    poll()
+
+
+def finish(job):
+    """Apply the result of a finished ``job``, if its buffer hasn't changed
+    since it started."""
+    if job.error is not None:
+        echo('Reshape failed: %s' % str(job.error).split('\n')[0])
+        return
+    try:
+        buffer = vim.buffers[job.buffer_number]
+    except KeyError:
+        return
+    tick = int(vim.eval("getbufvar(%d, 'changedtick')" % job.buffer_number))
+    if tick != job.tick:
+        echo('The buffer changed while reshaping, so the reshape was '
+             'discarded.')
+        return
+    replace_text_between(buffer, *(job.region + (job.result,)))
+    echo('')
+    if vim.current.buffer.number == job.buffer_number:
+        vim.current.window.cursor = job.region[:2]
+
+
+def cancel():
+    """Cancel the reshape running in the current buffer, if any."""
+    job = jobs.pop(vim.current.buffer.number, None)
+    if job is None:
+        print("No reshape is running in this buffer.")
+        return
+    # The work can't be stopped, but its result can be ignored.
+    echo('Reshape cancelled.')
+
+
+def cache_stats():
+    print("Tree cache: " + cache.stats())
+
+
+def profile_at_cursor(log_path=None):
+    """Reshape the innermost braces around the cursor, reporting how long
+    each phase took and how much memory it allocated.
+
+    :arg log_path: A file to which to append the report, as well
+
+    """
+    name = vim.current.buffer.name or '[No Name]'
+    row, col = vim.current.window.cursor
+    phases = []
+    tracing = tracemalloc is not None and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        if not reshape_at_cursor(phases):
+            return
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    report = '%s:%s:%s: %s, total %.4fs' % (
+        name, row, col,
+        ', '.join('%s %.4fs' % (phase_name, seconds) +
+                  ('' if kb is None else ' %.0fKB' % kb)
+                  for phase_name, seconds, kb in phases),
+        sum(seconds for _, seconds, _ in phases))
+    print(report)
+    if log_path:
+        with open(os.path.expanduser(log_path), 'a') as log:
+            log.write('%s %s\n' % (strftime('%Y-%m-%d %H:%M:%S'), report))
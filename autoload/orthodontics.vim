@@ -1,15 +1,95 @@
 let s:plugin_path = escape(expand('<sfile>:p:h'), '\')
-let s:pyfile = escape(s:plugin_path, ' ') . '/orthodontics.py'
 
+pythonx << EOF
+import sys
+import vim
+sys.path.insert(0, vim.eval('expand(s:plugin_path)'))
+import orthodontics
+EOF
 
-function! orthodontics#InlineBraces()
-    exe 'pyxfile ' . escape(s:pyfile, ' ')
+
+" With a range (a:1, from <range>, is nonzero), reshape every group of braces
+" in the lines from a:2 to a:3; otherwise, the one around the cursor.
+function! orthodontics#InlineBraces(...)
+    if a:0 && a:1
+        pythonx orthodontics.reshape_range(int(vim.eval('a:2')), int(vim.eval('a:3')), 'inline')
+    else
+        pythonx orthodontics.reshape_async_at_cursor('inline')
+    endif
+endfunc
+
+function! orthodontics#OutlineBraces(...)
+    if a:0 && a:1
+        pythonx orthodontics.reshape_range(int(vim.eval('a:2')), int(vim.eval('a:3')), 'outline')
+    else
+        pythonx orthodontics.reshape_async_at_cursor('outline')
+    endif
 endfunc
 
-function! orthodontics#OutlineBraces()
-    exe 'pyxfile ' . escape(s:pyfile, ' ')
+" Reshape every group of braces in the buffer in a:style, 'inline' or
+" 'outline':
+function! orthodontics#ReshapeBuffer(style)
+    pythonx orthodontics.reshape_range(1, len(vim.current.buffer), vim.eval('a:style'))
 endfunc
 
 function! orthodontics#ToggleBraces()
-    exe 'pyxfile ' . escape(s:pyfile, ' ')
+    pythonx orthodontics.reshape_async_at_cursor('toggle')
+endfunc
+
+function! orthodontics#CancelBraces()
+    pythonx orthodontics.cancel()
+endfunc
+
+function! orthodontics#CacheStats()
+    pythonx orthodontics.cache_stats()
+endfunc
+
+function! orthodontics#ProfileBraces(...)
+    pythonx orthodontics.profile_at_cursor(*vim.eval('a:000'))
+endfunc
+
+" Poll for finished background reshapes while any are running:
+let s:timer = -1
+
+function! orthodontics#StartPolling()
+    if s:timer == -1
+        let s:timer = timer_start(100, function('s:Poll'), {'repeat': -1})
+    endif
+endfunc
+
+function! s:Poll(timer)
+    if !pyxeval('orthodontics.poll()')
+        call timer_stop(a:timer)
+        let s:timer = -1
+    endif
+endfunc
+
+" The reshape server, started when it's first needed if g:orthodontics_server
+" is set; see libs/server.py:
+function! orthodontics#SendToServer(request)
+    if !exists('s:server') || job_status(s:server) !=# 'run'
+        let s:server = job_start(
+            \ [get(g:, 'orthodontics_python', 'python3'),
+            \  s:plugin_path . '/libs/server.py'],
+            \ {'mode': 'json', 'err_mode': 'nl',
+            \  'err_cb': function('s:ServerError'),
+            \  'close_cb': function('s:ServerClosed')})
+        if job_status(s:server) !=# 'run'
+            return 0
+        endif
+    endif
+    call ch_sendexpr(s:server, a:request, {'callback': function('s:Received')})
+    return 1
+endfunc
+
+function! s:Received(channel, response)
+    pythonx orthodontics.received(vim.eval('a:response'))
+endfunc
+
+function! s:ServerError(channel, message)
+    echomsg 'orthodontics server: ' . a:message
+endfunc
+
+function! s:ServerClosed(channel)
+    pythonx orthodontics.server_closed()
 endfunc
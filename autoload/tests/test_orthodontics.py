@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+from nose.tools import eq_, ok_
+
+# The plugin's Python is loaded from autoload, with a fake vim module:
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import install_fake_vim  # noqa: E402
+
+vim = install_fake_vim()
+import orthodontics  # noqa: E402
+
+
+LINES = ['x = [1,', '     2]']
+OUTLINED = ['x = [', '    1,', '    2,', ']']
+
+
+def start(lines=LINES, cursor=(1, 5), style='outline', **settings):
+    """Load a buffer of ``lines`` and reshape around ``cursor`` in the
+    background, however small the region, and return the buffer."""
+    vim.load(lines, cursor)
+    vim.settings = dict({'orthodontics_async_threshold': 0}, **settings)
+    orthodontics.reshape_async_at_cursor(style)
+    return vim.current.buffer
+
+
+def wait(buffer):
+    """Wait for the thread of the Job in ``buffer``, if any, then poll."""
+    job = orthodontics.jobs.get(buffer.number)
+    if job is not None and job.thread is not None:
+        job.thread.join()
+    return orthodontics.poll()
+
+
+def last_echo():
+    return [call[1] for call in vim.calls if call[0] == 'command'][-1]
+
+
+def test_fake_buffers():
+    """The fake's buffers should count their changes, and be found by
+    number."""
+    vim.load(['a'], (1, 0))
+    buffer = vim.current.buffer
+    tick = int(vim.eval('b:changedtick'))
+    buffer[0:1] = ['b', 'c']
+    buffer.append('d')
+    eq_(int(vim.eval("getbufvar(%d, 'changedtick')" % buffer.number)),
+        tick + 2)
+    ok_(vim.buffers[buffer.number] is buffer)
+
+
+def test_small_regions():
+    """Small regions should be reshaped right away."""
+    vim.load(LINES, (1, 5))
+    vim.settings = {}
+    orthodontics.reshape_async_at_cursor('outline')
+    eq_(vim.current.buffer, OUTLINED)
+    eq_(orthodontics.jobs, {})
+
+
+def test_job():
+    """A Job's result should be applied once it's done, if the buffer
+    hasn't changed, and the cursor put on the opening brace."""
+    buffer = start()
+    job = orthodontics.jobs[buffer.number]
+    ok_(isinstance(job, orthodontics.Job))
+    eq_(vim.calls[-1], ('command', 'call orthodontics#StartPolling()'))
+    eq_(buffer, LINES)
+
+    orthodontics.reshape_async_at_cursor('outline')
+    eq_(orthodontics.jobs[buffer.number], job)
+
+    ok_(not wait(buffer))
+    eq_(buffer, OUTLINED)
+    eq_(vim.current.window.cursor, (1, 4))
+    eq_(orthodontics.jobs, {})
+
+
+def test_stale_job():
+    """A Job's result should be discarded if the buffer changed while it
+    ran."""
+    buffer = start()
+    buffer.append('y = 1')
+    ok_(not wait(buffer))
+    eq_(buffer, LINES + ['y = 1'])
+    ok_('discarded' in last_echo())
+
+
+def test_other_buffer():
+    """A Job's result should be applied to its own buffer, even if another
+    one is current by then, without moving the cursor."""
+    buffer = start()
+    vim.load(['z'], (1, 0))
+    ok_(not wait(buffer))
+    eq_(buffer, OUTLINED)
+    eq_(vim.current.buffer, ['z'])
+    eq_(vim.current.window.cursor, (1, 0))
+
+
+def test_failed_job():
+    buffer = start(['x = [1, ,2]'])
+    ok_(not wait(buffer))
+    eq_(buffer, ['x = [1, ,2]'])
+    ok_(last_echo().startswith("redraw | echo 'Reshape failed: "))
+
+
+def test_cancel():
+    """A cancelled Job's result should never be applied."""
+    buffer = start()
+    job = orthodontics.jobs[buffer.number]
+    orthodontics.cancel()
+    eq_(orthodontics.jobs, {})
+    eq_(last_echo(), "redraw | echo 'Reshape cancelled.'")
+    job.thread.join()
+    ok_(not orthodontics.poll())
+    eq_(buffer, LINES)
+
+    orthodontics.cancel()
+    eq_(orthodontics.jobs, {})
+
+
+def test_server_job():
+    """With the server on, big regions should be sent to it, and its
+    responses applied."""
+    requests = []
+    vim.functions['orthodontics#SendToServer'] = lambda request: (
+        requests.append(request) or 1)
+    try:
+        buffer = start(orthodontics_server=1)
+        job = orthodontics.jobs[buffer.number]
+        ok_(isinstance(job, orthodontics.ServerJob))
+        eq_(requests, [{'id': job.id, 'text': '[1,\n     2]',
+                        'style': 'outline'}])
+        ok_(orthodontics.poll())
+
+        orthodontics.received({'id': job.id + 1, 'text': 'wrong'})
+        eq_(buffer, LINES)
+        orthodontics.received({'id': job.id, 'text': '[\n    1,\n    2,\n]'})
+        eq_(buffer, OUTLINED)
+        eq_(orthodontics.jobs, {})
+
+        # A stale response is discarded, like a stale result:
+        buffer = start(orthodontics_server=1)
+        job = orthodontics.jobs[buffer.number]
+        buffer.append('')
+        orthodontics.received({'id': job.id, 'text': '[1, 2]'})
+        eq_(buffer, LINES + [''])
+        ok_('discarded' in last_echo())
+
+        # As is one that comes after a cancel:
+        buffer = start(orthodontics_server=1)
+        job = orthodontics.jobs[buffer.number]
+        orthodontics.cancel()
+        orthodontics.received({'id': job.id, 'text': '[1, 2]'})
+        eq_(buffer, LINES)
+
+        # Jobs still waiting when the server stops fail:
+        buffer = start(orthodontics_server=1)
+        orthodontics.server_closed()
+        eq_(orthodontics.jobs, {})
+        eq_(last_echo(),
+            "redraw | echo 'Reshape failed: the reshape server stopped'")
+    finally:
+        del vim.functions['orthodontics#SendToServer']
+
+
+def test_server_unavailable():
+    """If the server can't be started, a thread should do the work."""
+    buffer = start(orthodontics_server=1)
+    job = orthodontics.jobs[buffer.number]
+    ok_(not isinstance(job, orthodontics.ServerJob))
+    ok_(not wait(buffer))
+    eq_(buffer, OUTLINED)
+
+
+def test_no_timers():
+    """Without timers to poll with, everything should be done right
+    away."""
+    vim.features.discard('timers')
+    try:
+        buffer = start()
+        eq_(buffer, OUTLINED)
+        eq_(orthodontics.jobs, {})
+    finally:
+        vim.features.add('timers')
+
+
+def test_reshape_lines():
+    """Every group in the lines should be reshaped, but for those that don't
+    parse, or are too deep to, which should be left alone."""
+    deep = '[' * 5000 + ']' * 5000
+    vim.load(['a = [1,', ' 2]', 'b = [1, ,2]', 'c = ' + deep,
+              'd = (x,', ' y)'], (1, 0))
+    buffer = vim.current.buffer
+    eq_(orthodontics.reshape_lines(buffer, 1, len(buffer), 'inline'), 2)
+    eq_(buffer, ['a = [1, 2]', 'b = [1, ,2]', 'c = ' + deep, 'd = (x, y)'])
+
+
+def test_tree_cache():
+    """Regions should be found by their text wherever it is, but not
+    mistaken for others with the same key."""
+    cache = orthodontics.TreeCache(2, 100)
+    renderings = {}
+    cache.put('(a, b)', 'tree', renderings)
+    eq_(cache.get('x = (a, b) # c', 4, 10), ('tree', renderings))
+    eq_(cache.get('(a, c)'), None)
+    long_region = '[%s]' % ', '.join('1' * 10 for _ in range(20))
+    other = long_region[:-2] + '2]'
+    eq_(orthodontics.region_key(long_region, 0, len(long_region)),
+        orthodontics.region_key(other, 0, len(other)))
+    cache.put(long_region, 'long', {})
+    eq_(cache.get(other), None)
+    # That forgot the long region, so as not to keep two with one key:
+    eq_(cache.get(long_region), None)
+    eq_((cache.hits, cache.misses), (1, 3))
+
+    # The least recently used go, to keep to the limits:
+    cache.put('(c)', 'c', {})
+    cache.put('(d)', 'd', {})
+    eq_(cache.get('(a, b)'), None)
+    cache.put('(e)' * 30, 'e', {})
+    eq_(cache.get('(c)'), None)
+    ok_(cache.get('(e)' * 30) is not None)
+    eq_(cache.characters, 93)
+    cache.put('(f)' * 30, 'f', {})
+    eq_(cache.get('(d)'), None)
+    eq_(cache.characters, 90)
+    # Regions bigger than the whole cache aren't kept at all:
+    cache.put('(g)' * 34, 'g', {})
+    ok_(cache.get('(f)' * 30) is not None)
+
+
+def test_round_trip():
+    """Reshaping braces back the way they were should neither parse nor
+    render them again."""
+    orthodontics.cache.clear()
+    vim.load(['x = [1,', '  2]'], (1, 4))
+    buffer = vim.current.buffer
+    orthodontics.reshape(buffer, 1, 4, style='inline')
+    eq_(buffer, ['x = [1, 2]'])
+    # The first outlining renders the tree, but doesn't parse it:
+    for style, lines, rendered in [('outline', OUTLINED, True),
+                                   ('inline', ['x = [1, 2]'], False),
+                                   ('outline', OUTLINED, False)]:
+        phases = []
+        orthodontics.reshape(buffer, 1, 4, phases=phases, style=style)
+        eq_(buffer, lines)
+        eq_([name for name, _, _ in phases],
+            ['search', 'extract', 'lookup'] + ['render'] * rendered +
+            ['write'])
+    eq_((orthodontics.cache.hits, orthodontics.cache.misses), (3, 1))
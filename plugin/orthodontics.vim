@@ -6,6 +6,28 @@ if !has('pythonx')
     finish
 endif
 
-command! OrthoIn call orthodontics#InlineBraces()
-command! OrthoOut call orthodontics#OutlineBraces()
+command! -range OrthoIn call orthodontics#InlineBraces(<range>, <line1>, <line2>)
+command! -range OrthoOut call orthodontics#OutlineBraces(<range>, <line1>, <line2>)
 command! OrthoToggle call orthodontics#ToggleBraces()
+command! -nargs=? -complete=file OrthoProfile call orthodontics#ProfileBraces(<f-args>)
+command! OrthoCancel call orthodontics#CancelBraces()
+command! OrthoCacheStats call orthodontics#CacheStats()
+
+" Reshape the whole buffer before writing it, in the style, 'inline' or
+" 'outline', that b:orthodontics_on_save or g:orthodontics_on_save names.
+" Neither is set by default, and shouldn't be lightly: groups are found by
+" brackets alone, so a bracket in a comment or a string outside any group
+" gets reshaped, or throws off which groups are found, just as :OrthoIn and
+" :OrthoOut over a range would.
+function! s:ReshapeOnSave()
+    let style = get(b:, 'orthodontics_on_save',
+                \ get(g:, 'orthodontics_on_save', ''))
+    if style !=# ''
+        call orthodontics#ReshapeBuffer(style)
+    endif
+endfunc
+
+augroup orthodontics
+    autocmd!
+    autocmd BufWritePre * call s:ReshapeOnSave()
+augroup END